@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""Compare two workload reports endpoint by endpoint
+
+Prints throughput and p50/p95/p99 for a baseline and a candidate report with
+the relative change. It exits with status 1 when any endpoint's p95 grew, or
+its throughput fell, by more than --threshold percent.
+
+    python benchmarks/compare.py results/baseline.json results/candidate.json --threshold 10
+"""
+
+import argparse
+import json
+import sys
+
+METRICS = (('throughput', 'req/s', False), ('p50_ms', 'p50 ms', True), ('p95_ms', 'p95 ms', True),
+           ('p99_ms', 'p99 ms', True))
+GATED = {'throughput', 'p95_ms'}  # Metrics checked against --threshold
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    parser.add_argument('--threshold', type=float, default=10.0, help='percent change counted as a regression')
+    return parser.parse_args()
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def change(before, after):
+    if not before:
+        return float('nan')
+    return (after - before) / before * 100
+
+
+def main():
+    args = parse_args()
+    baseline, candidate = load(args.baseline), load(args.candidate)
+    print(f"baseline  {baseline['label']} ({baseline.get('commit')}, {baseline['started_at']})")
+    print(f"candidate {candidate['label']} ({candidate.get('commit')}, {candidate['started_at']})")
+
+    rows = [(label, baseline['endpoints'].get(label), candidate['endpoints'].get(label))
+            for label in sorted(set(baseline['endpoints']) | set(candidate['endpoints']))]
+    rows.append(('total', baseline['total'], candidate['total']))
+
+    print(f"\n{'endpoint':<18}" + ''.join(f'{heading:>24}' for _, heading, _ in METRICS))
+    regressions = []
+    for label, before, after in rows:
+        if before is None or after is None:
+            print(f"{label:<18}  only in {'candidate' if before is None else 'baseline'}")
+            continue
+        cells = []
+        for key, _, lower_is_better in METRICS:
+            delta = change(before[key], after[key])
+            cells.append(f'{before[key]:>8.1f} -> {after[key]:>7.1f} {delta:>+5.0f}%')
+            worse = delta > args.threshold if lower_is_better else delta < -args.threshold
+            if key in GATED and worse:
+                regressions.append(f'{label} {key} {delta:+.1f}%')
+        print(f'{label:<18}' + ''.join(f'{cell:>24}' for cell in cells))
+
+    if regressions:
+        print(f'\nRegressions beyond {args.threshold:g}%: ' + ', '.join(regressions))
+        sys.exit(1)
+    print(f'\nNo regressions beyond {args.threshold:g}%')
+
+
+if __name__ == '__main__':
+    main()
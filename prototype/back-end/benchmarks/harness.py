@@ -0,0 +1,56 @@
+"""Shared setup and statistics for the benchmark scripts"""
+
+import os
+import sys
+import tempfile
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS_DIR, '..', 'src'))
+
+
+def create_benchmark_app(overrides=None, database_url=None, default_db=None):
+    """Create the app with production settings plus `overrides`, migrated to the latest schema.
+
+    The database is `database_url`, else DATABASE_URL, else the SQLite file
+    `default_db` under benchmarks/data (or a throwaway one when that is None).
+    """
+    if database_url:
+        os.environ['DATABASE_URL'] = database_url
+    elif not os.environ.get('DATABASE_URL'):
+        if default_db:
+            directory = os.path.join(BENCHMARKS_DIR, 'data')
+            os.makedirs(directory, exist_ok=True)
+        else:
+            directory = tempfile.mkdtemp()
+            default_db = 'benchmark.db'
+        os.environ['DATABASE_URL'] = f'sqlite:///{os.path.join(directory, default_db)}'
+
+    from app import create_app, db
+    from config import config
+    import migrations
+
+    config['benchmark'] = type('BenchmarkConfig', (config['production'],), {
+        name: value for name, value in (overrides or {}).items() if value is not None
+    })
+    app = create_app('benchmark')
+    with app.app_context():
+        migrations.upgrade(db.engine, log=lambda message: None)
+    return app
+
+
+def percentile(samples, fraction):
+    if not samples:
+        return float('nan')
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def latency_summary(samples, duration):
+    """Throughput and latency percentiles, in requests/s and milliseconds"""
+    ordered = sorted(samples)
+    summary = {'requests': len(ordered), 'throughput': len(ordered) / duration if duration else 0.0}
+    for label, fraction in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99)):
+        summary[f'{label}_ms'] = percentile(ordered, fraction) * 1000
+    summary['mean_ms'] = sum(ordered) / len(ordered) * 1000 if ordered else float('nan')
+    summary['max_ms'] = ordered[-1] * 1000 if ordered else float('nan')
+    return summary
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""Catalog latency while logins saturate the password hashers
+
+Runs the app in-process against DATABASE_URL (a throwaway SQLite file by
+default). It first measures catalog GETs alone, then again while login
+threads hammer /login, and reports catalog latency percentiles next to login
+throughput and the number of logins shed with 503.
+
+    python benchmarks/login_storm.py --login-threads 32 --hash-workers 4
+"""
+
+import argparse
+import statistics
+import threading
+import time
+
+from harness import create_benchmark_app, percentile
+
+CATALOG_PATHS = ['/genres', '/artists', '/musical-works', '/search/suggest?q=a']
+PASSWORD = 'benchmark-password'
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds per phase')
+    parser.add_argument('--catalog-threads', type=int, default=4)
+    parser.add_argument('--login-threads', type=int, default=16)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--hash-workers', type=int, help='overrides PASSWORD_HASH_WORKERS')
+    parser.add_argument('--queue-timeout', type=float, help='overrides PASSWORD_HASH_QUEUE_TIMEOUT')
+    parser.add_argument('--hash-method', help='overrides PASSWORD_HASH_METHOD')
+    return parser.parse_args()
+
+
+def create_storm_app(args):
+    app = create_benchmark_app({
+        'PASSWORD_HASH_WORKERS': args.hash_workers,
+        'PASSWORD_HASH_QUEUE_TIMEOUT': args.queue_timeout,
+        'PASSWORD_HASH_METHOD': args.hash_method,
+    })
+    from app import db
+    with app.app_context():
+        seed(app, db, args.users)
+    return app
+
+
+def seed(app, db, user_count):
+    from models import User, Genre, Artist, MusicalWork
+    from password_hashing import get_password_hasher
+
+    if User.query.filter(User.username.like('storm-%')).first():
+        return
+    password_hash = get_password_hasher().hash(PASSWORD)
+    db.session.execute(db.insert(User), [
+        {'username': f'storm-{i}', 'email': f'storm-{i}@example.com', 'password_hash': password_hash,
+         'role': 'user', 'is_active': True}
+        for i in range(user_count)
+    ])
+    genre = Genre(name='Benchmark')
+    artist = Artist(name='Aria Benchmark')
+    db.session.add_all([genre, artist])
+    db.session.flush()
+    db.session.execute(db.insert(MusicalWork), [
+        {'title': f'Anthem {i}', 'genre_id': genre.id, 'artist_id': artist.id} for i in range(200)
+    ])
+    db.session.commit()
+
+
+def run_phase(app, args, with_logins):
+    stop = threading.Event()
+    latencies = []
+    login_statuses = []
+    lock = threading.Lock()
+
+    def catalog_worker(offset):
+        client = app.test_client()
+        samples = []
+        i = offset
+        while not stop.is_set():
+            started = time.perf_counter()
+            client.get(CATALOG_PATHS[i % len(CATALOG_PATHS)])
+            samples.append(time.perf_counter() - started)
+            i += 1
+        with lock:
+            latencies.extend(samples)
+
+    def login_worker(offset):
+        client = app.test_client()
+        statuses = []
+        i = offset
+        while not stop.is_set():
+            response = client.post('/login', json={'username': f'storm-{i % args.users}', 'password': PASSWORD})
+            statuses.append(response.status_code)
+            i += 1
+        with lock:
+            login_statuses.extend(statuses)
+
+    threads = [threading.Thread(target=catalog_worker, args=(i,)) for i in range(args.catalog_threads)]
+    if with_logins:
+        threads += [threading.Thread(target=login_worker, args=(i,)) for i in range(args.login_threads)]
+    for thread in threads:
+        thread.start()
+    time.sleep(args.duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return latencies, login_statuses
+
+
+def report(name, latencies, login_statuses, duration):
+    print(f'\n{name}')
+    print(f'  catalog requests/s  {len(latencies) / duration:10.1f}')
+    for label, fraction in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99)):
+        print(f'  catalog {label} ms      {percentile(latencies, fraction) * 1000:10.2f}')
+    if latencies:
+        print(f'  catalog mean ms     {statistics.mean(latencies) * 1000:10.2f}')
+    if login_statuses:
+        ok = login_statuses.count(200)
+        shed = login_statuses.count(503)
+        print(f'  logins/s            {ok / duration:10.1f}')
+        print(f'  logins shed (503)   {shed:10d}')
+        other = len(login_statuses) - ok - shed
+        if other:
+            print(f'  logins failed       {other:10d}')
+
+
+def main():
+    args = parse_args()
+    app = create_storm_app(args)
+    config = app.config
+    print(f"hash method {config['PASSWORD_HASH_METHOD']}, {config['PASSWORD_HASH_WORKERS']} hasher(s), "
+          f"queue timeout {config['PASSWORD_HASH_QUEUE_TIMEOUT']}s, "
+          f'{args.catalog_threads} catalog / {args.login_threads} login threads')
+
+    run_phase(app, argparse.Namespace(**{**vars(args), 'duration': 1.0}), False)  # warm caches and indexes
+    report('catalog only', *run_phase(app, args, with_logins=False), args.duration)
+    report('catalog during login storm', *run_phase(app, args, with_logins=True), args.duration)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""Generate a synthetic, skewed catalog for the benchmarks
+
+Fills an empty database with genres, artists, musical works, users and
+reviews drawn from a seeded random generator, so the same arguments always
+produce the same data. Popularity is skewed the way real catalogs are: a few
+artists have most of the works, a few works get most of the reviews and a few
+users write most of them. Ratings lean positive per work, and a small share
+of reviews is left pending for the moderation queue.
+
+Rows are written in chunks with COPY on PostgreSQL and multi-row INSERTs
+elsewhere. Rating aggregates are then computed with one UPDATE.
+
+    python benchmarks/seed_catalog.py --scale small
+    python benchmarks/seed_catalog.py --scale full --database-url postgresql://localhost/audiotheca_bench
+
+Every seeded user, and the producer `bench-producer`, has the password
+`benchmark-password`.
+"""
+
+import argparse
+import csv
+import io
+import itertools
+import random
+import time
+from datetime import datetime, timedelta
+
+from harness import create_benchmark_app
+
+PASSWORD = 'benchmark-password'
+PRODUCER = 'bench-producer'
+CHUNK_SIZE = 20000
+MAX_REVIEWS_PER_USER = 5000
+
+SCALES = {
+    # genres, artists, works, users, reviews
+    'tiny': (20, 200, 2000, 2000, 20000),
+    'small': (40, 2000, 20000, 20000, 200000),
+    'medium': (60, 20000, 200000, 200000, 2000000),
+    'full': (80, 100000, 1000000, 1000000, 10000000),
+}
+
+GENRE_WORDS = ['Jazz', 'Blues', 'Rock', 'Folk', 'Soul', 'Funk', 'Disco', 'House', 'Techno', 'Ambient',
+               'Baroque', 'Opera', 'Gospel', 'Reggae', 'Ska', 'Punk', 'Metal', 'Grunge', 'Swing', 'Bossa']
+GENRE_PREFIXES = ['', 'Modern ', 'Classic ', 'Nordic ', 'Balkan ']
+FIRST_NAMES = ['Ana', 'Marko', 'Lena', 'Ivan', 'Mila', 'Nikola', 'Sara', 'Luka', 'Eva', 'Petar', 'Nina',
+               'Stefan', 'Maja', 'Filip', 'Tara', 'Ognjen', 'Iva', 'David', 'Jana', 'Vuk']
+LAST_NAMES = ['Horvat', 'Petrovic', 'Novak', 'Jovanovic', 'Kovac', 'Ilic', 'Markovic', 'Babic', 'Pavlovic',
+              'Lukic', 'Tomic', 'Simic', 'Kralj', 'Vukovic', 'Bozic', 'Radic', 'Milic', 'Knez', 'Ristic', 'Zoric']
+TITLE_WORDS = ['Midnight', 'River', 'Silver', 'Echo', 'Summer', 'Shadow', 'Golden', 'Harbor', 'Velvet', 'Storm',
+               'Morning', 'Ember', 'Crystal', 'Wander', 'Hollow', 'Neon', 'Paper', 'Autumn', 'Signal', 'Orchard',
+               'Lantern', 'Static', 'Meadow', 'Cinder', 'Mirror', 'Tidal', 'Copper', 'Willow', 'Saturn', 'Drift']
+COMMENT_WORDS = ['great', 'moving', 'catchy', 'overlong', 'brilliant', 'dull', 'fresh', 'classic', 'raw',
+                 'beautiful', 'uneven', 'haunting', 'fun', 'masterful', 'forgettable']
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', choices=SCALES, default='small')
+    parser.add_argument('--genres', type=int)
+    parser.add_argument('--artists', type=int)
+    parser.add_argument('--works', type=int)
+    parser.add_argument('--users', type=int)
+    parser.add_argument('--reviews', type=int, help='approximate; heavy users are capped')
+    parser.add_argument('--pending-ratio', type=float, default=0.03, help='share of reviews awaiting moderation')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--database-url', help='defaults to DATABASE_URL, else benchmarks/data/benchmark.db')
+    parser.add_argument('--hash-method', default='pbkdf2:sha256:1000',
+                        help='hash for the shared password; logins rehash it to PASSWORD_HASH_METHOD once')
+    args = parser.parse_args()
+    defaults = dict(zip(('genres', 'artists', 'works', 'users', 'reviews'), SCALES[args.scale]))
+    for name, value in defaults.items():
+        if getattr(args, name) is None:
+            setattr(args, name, value)
+    return args
+
+
+def cumulative_zipf(count, exponent, rng):
+    """Cumulative Zipf weights over `count` items, with ranks shuffled so popularity does not follow ids"""
+    ranks = list(range(1, count + 1))
+    rng.shuffle(ranks)
+    return list(itertools.accumulate(1.0 / rank ** exponent for rank in ranks))
+
+
+def random_time(rng, now, days=3 * 365):
+    """A timestamp in the last `days` days, denser towards the present"""
+    return now - timedelta(seconds=int(days * 86400 * rng.random() ** 2))
+
+
+class BulkWriter:
+    """Writes rows to a table in chunks, with COPY on PostgreSQL"""
+
+    def __init__(self, connection, table, columns):
+        self.connection = connection
+        self.table = table
+        self.columns = columns
+        self.rows = []
+        self.written = 0
+        self.copy = connection.dialect.name == 'postgresql'
+
+    def add(self, row):
+        self.rows.append(row)
+        if len(self.rows) >= CHUNK_SIZE:
+            self.flush()
+
+    def flush(self):
+        if not self.rows:
+            return
+        if self.copy:
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            for row in self.rows:
+                writer.writerow(r'\N' if value is None else value for value in row)
+            buffer.seek(0)
+            cursor = self.connection.connection.dbapi_connection.cursor()
+            cursor.copy_expert(
+                f"COPY {self.table.name} ({', '.join(self.columns)}) FROM STDIN WITH (FORMAT csv, NULL '\\N')",
+                buffer
+            )
+            cursor.close()
+        else:
+            self.connection.execute(self.table.insert(), [dict(zip(self.columns, row)) for row in self.rows])
+        self.written += len(self.rows)
+        self.rows = []
+
+
+def seed(connection, args, password_hash):
+    from models import User, Genre, Artist, MusicalWork, Review
+
+    rng = random.Random(args.seed)
+    now = datetime.utcnow().replace(microsecond=0)
+
+    genres = BulkWriter(connection, Genre.__table__, ('id', 'name', 'description', 'created_at'))
+    names = [prefix + word for prefix in GENRE_PREFIXES for word in GENRE_WORDS]
+    for genre_id in range(1, args.genres + 1):
+        name = names[genre_id - 1] if genre_id <= len(names) else f'Genre {genre_id}'
+        genres.add((genre_id, name, f'Synthetic {name.lower()} genre', random_time(rng, now)))
+    genres.flush()
+
+    artists = BulkWriter(connection, Artist.__table__, ('id', 'name', 'biography', 'multimedia', 'created_at'))
+    for artist_id in range(1, args.artists + 1):
+        name = f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {artist_id}'
+        artists.add((artist_id, name, f'{name} is a synthetic artist.', None, random_time(rng, now)))
+    artists.flush()
+
+    artist_weights = cumulative_zipf(args.artists, 1.1, rng)
+    genre_weights = cumulative_zipf(args.genres, 1.0, rng)
+    artist_ids = range(1, args.artists + 1)
+    genre_ids = range(1, args.genres + 1)
+    works = BulkWriter(connection, MusicalWork.__table__, ('id', 'title', 'description', 'genre_id', 'artist_id',
+                                                         'created_at', 'review_count', 'rating_sum',
+                                                         'rating_1_count', 'rating_2_count', 'rating_3_count',
+                                                         'rating_4_count', 'rating_5_count'))
+    quality = [0.0] * (args.works + 1)
+    for work_id in range(1, args.works + 1):
+        title = ' '.join(rng.sample(TITLE_WORDS, rng.randint(1, 3)))
+        artist_id = rng.choices(artist_ids, cum_weights=artist_weights)[0]
+        genre_id = rng.choices(genre_ids, cum_weights=genre_weights)[0]
+        works.add((work_id, title, f'{title}, a synthetic work.', genre_id, artist_id, random_time(rng, now),
+                   0, 0, 0, 0, 0, 0, 0))
+        quality[work_id] = rng.gauss(3.7, 0.6)
+    works.flush()
+
+    users = BulkWriter(connection, User.__table__, ('id', 'username', 'email', 'password_hash', 'role',
+                                                   'is_active', 'created_at'))
+    for user_id in range(1, args.users + 1):
+        users.add((user_id, f'bench-user-{user_id}', f'bench-user-{user_id}@example.com', password_hash,
+                   'user', True, random_time(rng, now)))
+    users.add((args.users + 1, PRODUCER, f'{PRODUCER}@example.com', password_hash, 'producer', True, now))
+    users.flush()
+
+    # Reviews per user follow a power law, scaled to about args.reviews in total
+    user_weights = [1.0 / rank ** 0.6 for rank in range(1, args.users + 1)]
+    rng.shuffle(user_weights)
+    scale = args.reviews / sum(user_weights)
+    max_per_user = max(1, min(args.works // 5, MAX_REVIEWS_PER_USER))
+    work_weights = cumulative_zipf(args.works, 0.8, rng)
+    work_ids = range(1, args.works + 1)
+    reviews = BulkWriter(connection, Review.__table__, ('id', 'user_id', 'musical_work_id', 'rating', 'comment',
+                                                      'is_approved', 'created_at', 'updated_at'))
+    review_id = 0
+    for user_id, weight in enumerate(user_weights, 1):
+        expected = weight * scale
+        count = min(max_per_user, int(expected) + (rng.random() < expected - int(expected)))
+        chosen = set()
+        for _ in range(3):  # redraw the duplicates a heavy user's picks produce
+            chosen.update(rng.choices(work_ids, cum_weights=work_weights, k=count - len(chosen)))
+            if len(chosen) >= count:
+                break
+        for work_id in chosen:
+            review_id += 1
+            rating = min(5, max(1, round(rng.gauss(quality[work_id], 0.9))))
+            comment = ' '.join(rng.sample(COMMENT_WORDS, 3)) if rng.random() < 0.4 else None
+            created_at = random_time(rng, now, days=2 * 365)
+            approved = rng.random() >= args.pending_ratio
+            reviews.add((review_id, user_id, work_id, rating, comment, approved, created_at, created_at))
+    reviews.flush()
+
+    return {'genres': genres.written, 'artists': artists.written, 'works': works.written,
+            'users': users.written, 'reviews': reviews.written}
+
+
+def update_rating_aggregates(connection):
+    """Set every work's rating aggregates from its approved reviews with one UPDATE ... FROM"""
+    from app import db
+    from models import MusicalWork, Review
+
+    counts = {f'rating_{rating}_count': db.func.sum(db.case((Review.rating == rating, 1), else_=0))
+              for rating in range(1, 6)}
+    totals = (
+        db.select(
+            Review.musical_work_id.label('work_id'),
+            db.func.count().label('review_count'),
+            db.func.sum(Review.rating).label('rating_sum'),
+            *(aggregate.label(name) for name, aggregate in counts.items())
+        )
+        .where(Review.is_approved.is_(True))
+        .group_by(Review.musical_work_id)
+        .subquery()
+    )
+    columns = ['review_count', 'rating_sum', *counts]
+    connection.execute(
+        db.update(MusicalWork)
+        .where(MusicalWork.id == totals.c.work_id)
+        .values({name: totals.c[name] for name in columns})
+    )
+
+
+def reset_sequences(connection, tables):
+    """Move PostgreSQL id sequences past the explicitly inserted ids"""
+    if connection.dialect.name != 'postgresql':
+        return
+    for table in tables:
+        connection.exec_driver_sql(
+            f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), COALESCE(MAX(id), 1)) FROM {table}"
+        )
+        connection.exec_driver_sql(f'ANALYZE {table}')
+
+
+def main():
+    args = parse_args()
+    app = create_benchmark_app(database_url=args.database_url, default_db='benchmark.db')
+
+    from app import db
+    from models import User, Genre, Artist, MusicalWork, Review
+    from repositories.chart_repository import ChartRepository
+    from werkzeug.security import generate_password_hash
+
+    with app.app_context():
+        engine = db.engine
+        with engine.connect() as connection:
+            for model in (Genre, Artist, MusicalWork, User, Review):
+                if connection.scalar(db.select(model.id).limit(1)) is not None:
+                    raise SystemExit(f'{model.__tablename__} is not empty; seed a fresh database')
+
+        print(f'Seeding {engine.url.render_as_string(hide_password=True)}: {args.genres} genres, '
+              f'{args.artists} artists, {args.works} works, {args.users} users, ~{args.reviews} reviews')
+        started = time.perf_counter()
+        with engine.begin() as connection:
+            counts = seed(connection, args, generate_password_hash(PASSWORD, args.hash_method))
+            seeded = time.perf_counter()
+            update_rating_aggregates(connection)
+            reset_sequences(connection, ('genres', 'artists', 'musical_works', 'users', 'reviews'))
+        ChartRepository.rebuild(app.config['CHART_PRIOR_WEIGHT'], app.config['CHART_MIN_REVIEWS'])
+        finished = time.perf_counter()
+
+    print(', '.join(f'{count} {name}' for name, count in counts.items()))
+    print(f'Inserted in {seeded - started:.1f}s, aggregates and charts in {finished - seeded:.1f}s')
+
+
+if __name__ == '__main__':
+    main()
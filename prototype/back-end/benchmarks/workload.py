@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+"""Mixed read/write workload with per-endpoint throughput and latency reports
+
+Runs against a catalog made by seed_catalog.py, either in-process (the
+default, on DATABASE_URL or benchmarks/data/benchmark.db) or over HTTP
+against a running server with --url. Worker threads pick operations by
+weight: searches and suggestions, catalog GETs skewed towards popular
+works, logins, review upserts and moderation (claim, then approve). Each
+run writes a JSON report to benchmarks/results, which compare.py can diff.
+
+    python benchmarks/workload.py --duration 60 --concurrency 16 --label baseline
+    python benchmarks/workload.py --url http://localhost:5000 --label gunicorn-4w
+"""
+
+import argparse
+import http.client
+import itertools
+import json
+import os
+import platform
+import random
+import subprocess
+import threading
+import time
+from datetime import datetime
+from urllib.parse import quote, urlsplit
+
+from harness import BENCHMARKS_DIR, latency_summary
+from seed_catalog import FIRST_NAMES, PASSWORD, PRODUCER, TITLE_WORDS
+
+# operation -> relative weight
+MIX = {
+    'search': 15,
+    'search_suggest': 10,
+    'list_works': 8,
+    'work_detail': 22,
+    'work_reviews': 10,
+    'artist_detail': 5,
+    'list_genres': 3,
+    'login': 3,
+    'create_review': 12,
+    'moderate': 2,
+}
+HOT_WORKS = 10000  # Most reviewed works sampled for skewed reads
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--duration', type=float, default=30.0, help='measured seconds')
+    parser.add_argument('--warmup', type=float, default=5.0, help='unmeasured seconds first')
+    parser.add_argument('--concurrency', type=int, default=8, help='worker threads')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--url', help='base URL of a running server; in-process when omitted')
+    parser.add_argument('--database-url', help='in-process database; defaults as in seed_catalog.py')
+    parser.add_argument('--hash-method', help='overrides PASSWORD_HASH_METHOD in-process')
+    parser.add_argument('--mix', help='weights as name=weight,... overriding the defaults')
+    parser.add_argument('--session-users', type=int, default=50, help='users logged in up front for writes')
+    parser.add_argument('--users', type=int, default=1000,
+                        help='seeded users to log in as over HTTP; read from the database in-process')
+    parser.add_argument('--label', default='run', help='name stored in the report')
+    parser.add_argument('--output', default=os.path.join(BENCHMARKS_DIR, 'results'))
+    args = parser.parse_args()
+    mix = dict(MIX)
+    for item in filter(None, (args.mix or '').split(',')):
+        name, _, weight = item.partition('=')
+        if name not in MIX:
+            parser.error(f'unknown operation {name}')
+        mix[name] = float(weight)
+    args.mix = mix
+    return args
+
+
+class InProcessClient:
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, body=None, token=None):
+        headers = {'Authorization': f'Bearer {token}'} if token else {}
+        response = self.client.open(path, method=method, json=body, headers=headers)
+        return response.status_code, response.get_data()
+
+
+class HttpClient:
+    """One keep-alive connection per worker"""
+
+    def __init__(self, base_url):
+        parts = urlsplit(base_url)
+        connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        self.connection = connection_class(parts.netloc, timeout=60)
+        self.prefix = parts.path.rstrip('/')
+
+    def request(self, method, path, body=None, token=None):
+        headers = {'Content-Type': 'application/json'}
+        if token:
+            headers['Authorization'] = f'Bearer {token}'
+        payload = json.dumps(body).encode() if body is not None else None
+        try:
+            self.connection.request(method, self.prefix + path, payload, headers)
+            response = self.connection.getresponse()
+            return response.status, response.read()
+        except (OSError, http.client.HTTPException):
+            self.connection.close()
+            return 0, b''
+
+
+def load_catalog_over_http(client, user_count):
+    """The most reviewed works as the hot set, and the id ranges, through the public API"""
+    status, body = client.request('GET', '/musical-works?sort=-review_count&limit=100')
+    hot = [(work['id'], 1) for work in json.loads(body)['items']] if status == 200 else []
+    max_ids = {'user': user_count + 1}
+    for name, path in (('work', '/musical-works?sort=-id&limit=1'), ('artist', '/artists?sort=-id&limit=1')):
+        status, body = client.request('GET', path)
+        items = json.loads(body)['items'] if status == 200 else []
+        max_ids[name] = max((item['id'] for item in items), default=1)
+    return hot, max_ids
+
+
+def load_catalog_in_process(app):
+    """Hot works weighted by review count, plus the id ranges, straight from the database"""
+    from app import db
+    from models import Artist, MusicalWork, User
+
+    with app.app_context():
+        hot = db.session.execute(
+            db.select(MusicalWork.id, MusicalWork.review_count)
+            .order_by(MusicalWork.review_count.desc())
+            .limit(HOT_WORKS)
+        ).all()
+        max_ids = {
+            'work': db.session.scalar(db.select(db.func.max(MusicalWork.id))) or 1,
+            'artist': db.session.scalar(db.select(db.func.max(Artist.id))) or 1,
+            'user': db.session.scalar(db.select(db.func.max(User.id))) or 1,
+        }
+    return hot, max_ids
+
+
+class Workload:
+    def __init__(self, args, client_factory, hot_works, max_ids):
+        self.args = args
+        self.client_factory = client_factory
+        self.hot_ids = [work_id for work_id, _ in hot_works] or [1]
+        self.hot_weights = list(itertools.accumulate(count + 1 for _, count in hot_works)) or [1]
+        self.max_ids = max_ids
+        self.terms = [word.lower() for word in TITLE_WORDS + FIRST_NAMES]
+        self.operations = [name for name, weight in args.mix.items() if weight > 0]
+        self.weights = [args.mix[name] for name in self.operations]
+        self.user_tokens = []
+        self.producer_token = None
+
+    def log_in_sessions(self):
+        """Log in the users that write reviews, and the moderating producer"""
+        client = self.client_factory()
+        rng = random.Random(self.args.seed)
+        for _ in range(self.args.session_users):
+            username = f'bench-user-{rng.randint(1, max(1, self.max_ids["user"] - 1))}'
+            token = self._login(client, username)
+            if token:
+                self.user_tokens.append(token)
+        self.producer_token = self._login(client, PRODUCER)
+        if not self.user_tokens or not self.producer_token:
+            raise SystemExit('Could not log in seeded users; run seed_catalog.py against this database first')
+
+    @staticmethod
+    def _login(client, username):
+        status, body = client.request('POST', '/login', {'username': username, 'password': PASSWORD})
+        return json.loads(body)['access_token'] if status == 200 else None
+
+    def work_id(self, rng):
+        if rng.random() < 0.8:
+            return rng.choices(self.hot_ids, cum_weights=self.hot_weights)[0]
+        return rng.randint(1, self.max_ids['work'])
+
+    def run_operation(self, name, client, rng):
+        """Run one operation; returns a list of (label, status, seconds) for its requests"""
+        if name == 'moderate':
+            started = time.perf_counter()
+            status, body = client.request('POST', '/reviews/pending/claim', {'limit': 20}, self.producer_token)
+            results = [('moderate_claim', status, time.perf_counter() - started)]
+            ids = [review['id'] for review in json.loads(body)['items']] if status == 200 else []
+            if ids:
+                started = time.perf_counter()
+                status, _ = client.request('POST', '/reviews/approve', {'ids': ids}, self.producer_token)
+                results.append(('moderate_approve', status, time.perf_counter() - started))
+            return results
+
+        method, body, token = 'GET', None, None
+        if name == 'search':
+            path = f'/search?q={quote(rng.choice(self.terms))}&limit=20'
+        elif name == 'search_suggest':
+            term = rng.choice(self.terms)
+            path = f'/search/suggest?q={quote(term[:rng.randint(1, len(term))])}'
+        elif name == 'list_works':
+            path = '/musical-works?limit=20&sort=' + rng.choice(('title', '-created_at', '-average_rating'))
+        elif name == 'work_detail':
+            path = f'/musical-works/{self.work_id(rng)}'
+        elif name == 'work_reviews':
+            path = f'/musical-works/{self.work_id(rng)}/reviews'
+        elif name == 'artist_detail':
+            path = f'/artists/{rng.randint(1, self.max_ids["artist"])}'
+        elif name == 'list_genres':
+            path = '/genres'
+        elif name == 'login':
+            method, path = 'POST', '/login'
+            body = {'username': f'bench-user-{rng.randint(1, max(1, self.max_ids["user"] - 1))}', 'password': PASSWORD}
+        elif name == 'create_review':
+            method, path, token = 'POST', '/reviews', rng.choice(self.user_tokens)
+            body = {'musical_work_id': self.work_id(rng), 'rating': rng.randint(1, 5), 'upsert': True}
+        else:
+            raise ValueError(name)
+        started = time.perf_counter()
+        status, _ = client.request(method, path, body, token)
+        return [(name, status, time.perf_counter() - started)]
+
+    def run(self):
+        samples = {}
+        lock = threading.Lock()
+        measuring = threading.Event()
+        stop = threading.Event()
+
+        def worker(index):
+            client = self.client_factory()
+            rng = random.Random(self.args.seed * 1000 + index)
+            local = {}
+            while not stop.is_set():
+                name = rng.choices(self.operations, weights=self.weights)[0]
+                results = self.run_operation(name, client, rng)
+                if measuring.is_set() and not stop.is_set():
+                    for label, status, seconds in results:
+                        local.setdefault(label, []).append((status, seconds))
+            with lock:
+                for label, values in local.items():
+                    samples.setdefault(label, []).extend(values)
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(self.args.concurrency)]
+        for thread in threads:
+            thread.start()
+        time.sleep(self.args.warmup)
+        measuring.set()
+        started = time.perf_counter()
+        time.sleep(self.args.duration)
+        stop.set()
+        elapsed = time.perf_counter() - started
+        for thread in threads:
+            thread.join()
+        return samples, elapsed
+
+
+def summarize(samples, elapsed):
+    endpoints = {}
+    for label, values in sorted(samples.items()):
+        summary = latency_summary([seconds for _, seconds in values], elapsed)
+        statuses = {}
+        for status, _ in values:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        summary['errors'] = sum(count for status, count in statuses.items() if not 200 <= int(status) < 400)
+        summary['statuses'] = statuses
+        endpoints[label] = summary
+    total = latency_summary([seconds for values in samples.values() for _, seconds in values], elapsed)
+    total['errors'] = sum(summary['errors'] for summary in endpoints.values())
+    return endpoints, total
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BENCHMARKS_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(endpoints, total):
+    print(f"\n{'endpoint':<18}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}")
+    for label, summary in list(endpoints.items()) + [('total', total)]:
+        print(f"{label:<18}{summary['throughput']:>9.1f}{summary['p50_ms']:>9.2f}"
+              f"{summary['p95_ms']:>9.2f}{summary['p99_ms']:>9.2f}{summary['errors']:>8}")
+
+
+def main():
+    args = parse_args()
+    if args.url:
+        target = args.url
+        hot_works, max_ids = load_catalog_over_http(HttpClient(args.url), args.users)
+        client_factory = lambda: HttpClient(args.url)
+    else:
+        from harness import create_benchmark_app
+        app = create_benchmark_app({'PASSWORD_HASH_METHOD': args.hash_method},
+                                   database_url=args.database_url, default_db='benchmark.db')
+        target = app.config['SQLALCHEMY_DATABASE_URI']
+        hot_works, max_ids = load_catalog_in_process(app)
+        client_factory = lambda: InProcessClient(app)
+
+    workload = Workload(args, client_factory, hot_works, max_ids)
+    workload.log_in_sessions()
+    print(f'{args.label}: {args.concurrency} workers, {args.warmup:g}s warm-up, {args.duration:g}s measured')
+    samples, elapsed = workload.run()
+    endpoints, total = summarize(samples, elapsed)
+    print_report(endpoints, total)
+
+    report = {
+        'label': args.label,
+        'started_at': datetime.utcnow().isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'target': target if args.url else target.split('@')[-1],
+        'python': platform.python_version(),
+        'settings': {name: value for name, value in vars(args).items() if name not in ('output', 'label')},
+        'total': total,
+        'endpoints': endpoints,
+    }
+    os.makedirs(args.output, exist_ok=True)
+    path = os.path.join(args.output, f"{report['started_at'].replace(':', '')}-{args.label}.json")
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print(f'\nReport written to {path}')
+
+
+if __name__ == '__main__':
+    main()
@@ -3,8 +3,14 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_jwt_extended import JWTManager
 from flask_cors import CORS
 from config import config
+from query_budget import init_query_budget
+from request_metrics import init_request_metrics
+from response_cache import init_response_cache
+from catalog_sync import init_catalog_sync
+from password_hashing import init_password_hasher
+from database import RoutingSession, init_database, init_replica_routing
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 jwt = JWTManager()
 
 def create_app(config_name='default'):
@@ -13,25 +19,38 @@ def create_app(config_name='default'):
     app.config.from_object(config[config_name])
     
     # Initialize extensions
+    init_database(app)
     db.init_app(app)
     jwt.init_app(app)
     CORS(app, supports_credentials=True)
+    init_query_budget(app)
+    init_request_metrics(app)
+    init_response_cache(app)
+    init_password_hasher(app)
+    init_catalog_sync(app)
+    init_replica_routing(app)
     
     # Import models after db is initialized
     # Models need db to be initialized first
     from models import User, Genre, Artist, MusicalWork, Review
     
     # Register blueprints
-    from routes import auth_bp, user_bp, producer_bp, search_bp, admin_bp
+    from routes import auth_bp, user_bp, producer_bp, search_bp, admin_bp, batch_bp, charts_bp
     app.register_blueprint(auth_bp)
     app.register_blueprint(user_bp)
     app.register_blueprint(producer_bp)
     app.register_blueprint(search_bp)
     app.register_blueprint(admin_bp)
+    app.register_blueprint(batch_bp)
+    app.register_blueprint(charts_bp)
     
-    # Create tables
-    with app.app_context():
-        db.create_all()
+    # The schema is managed by versioned migrations: run `flask db upgrade`
+    
+    from search_index import init_search_index
+    init_search_index(app)
+    
+    from commands import register_commands
+    register_commands(app)
     
     return app
 
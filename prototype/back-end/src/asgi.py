@@ -0,0 +1,152 @@
+"""Asyncio serving mode for the public catalog and search reads
+
+Run with `uvicorn asgi:application` next to the WSGI deployment, with
+DATABASE_URL (and DATABASE_REPLICA_URL, if set) using an async driver such as
+postgresql+asyncpg://. Requests for /search*, /genres, /artists* and
+/musical-works* are answered by the same Flask views, repositories and JSON
+encoding as the WSGI app, but each runs in a greenlet: every database call
+awaits the driver on the event loop instead of blocking a thread. One process
+can then keep thousands of slow clients open, with at most DB_POOL_SIZE +
+DB_MAX_OVERFLOW of them querying at once. Other paths and methods are
+refused; send them to the WSGI app.
+
+This process never writes, so it learns of catalog changes only through
+catalog_versions: like every worker it polls the table before requests, at
+most every CATALOG_SYNC_INTERVAL seconds, and refreshes its in-memory search
+and suggestion indexes and expires its cached responses from the keys the
+WSGI workers bumped (see catalog_sync). Its reads therefore trail their
+writes by about CATALOG_SYNC_INTERVAL seconds.
+"""
+
+import io
+import json
+import os
+import sys
+
+from sqlalchemy.util import await_, greenlet_spawn
+
+from app import create_app, db
+from search_index import warm_catalog_indexes
+
+READ_PREFIXES = ('/search', '/genres', '/artists', '/musical-works')
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')  # OPTIONS for CORS preflights
+
+
+def is_catalog_read(path):
+    return any(path == prefix or path.startswith(prefix + '/') for prefix in READ_PREFIXES)
+
+
+def _wsgi_environ(scope):
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client')
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode().decode('latin-1'),
+        'PATH_INFO': scope['path'].encode().decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope['http_version']}",
+        'REMOTE_ADDR': client[0] if client else '',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(),  # read requests have no body
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': False,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        name, value = name.decode('latin-1'), value.decode('latin-1')
+        if name == 'content-type':
+            key = 'CONTENT_TYPE'
+        elif name == 'content-length':
+            key = 'CONTENT_LENGTH'
+        else:
+            key = 'HTTP_' + name.upper().replace('-', '_')
+        environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+async def _send_error(send, status, message):
+    body = json.dumps({'error': message}).encode()
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+class CatalogReadApp:
+    """ASGI app serving the catalog read endpoints of a Flask app on an async driver"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            if not is_catalog_read(scope['path']):
+                await _send_error(send, 404, 'Not found')
+            elif scope['method'] not in READ_METHODS:
+                await _send_error(send, 405, 'Method not allowed')
+            else:
+                await greenlet_spawn(self._respond, _wsgi_environ(scope), send)
+
+    def _respond(self, environ, send):
+        """Run the Flask app on `environ` inside a greenlet, awaiting each send"""
+        response_start = {}
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info and response_start.get('sent'):
+                raise exc_info[1].with_traceback(exc_info[2])
+            response_start.update(status=int(status.split(' ', 1)[0]), headers=[
+                (name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers
+            ])
+
+        def send_start():
+            if not response_start.get('sent'):
+                response_start['sent'] = True
+                await_(send({'type': 'http.response.start', 'status': response_start['status'],
+                             'headers': response_start['headers']}))
+
+        body = self.app(environ, start_response)
+        try:
+            for chunk in body:
+                if chunk:
+                    send_start()
+                    await_(send({'type': 'http.response.body', 'body': chunk, 'more_body': True}))
+            send_start()
+            await_(send({'type': 'http.response.body', 'body': b''}))
+        finally:
+            if hasattr(body, 'close'):
+                body.close()
+
+    def _warm_indexes(self):
+        # Builds hold a thread lock while they query; on the event loop's one
+        # thread a second request waiting on it would block the loop, so they
+        # are built before serving.
+        with self.app.app_context():
+            warm_catalog_indexes()
+
+    def _dispose_engines(self):
+        with self.app.app_context():
+            for engine in db.engines.values():
+                engine.dispose()
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    await greenlet_spawn(self._warm_indexes)
+                except Exception as e:
+                    await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await greenlet_spawn(self._dispose_engines)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+application = CatalogReadApp(create_app(os.getenv('FLASK_ENV', 'default')))
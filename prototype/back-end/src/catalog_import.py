@@ -0,0 +1,212 @@
+"""Bulk import of genres, artists and musical works from NDJSON"""
+
+import json
+
+from sqlalchemy.exc import SQLAlchemyError
+
+from models import db
+from repositories.genre_repository import GenreRepository
+from repositories.artist_repository import ArtistRepository
+from repositories.musical_work_repository import MusicalWorkRepository
+from response_cache import invalidate
+from search_index import get_catalog_indexes
+
+RECORD_TYPES = ('genre', 'artist', 'work')
+
+# (field, max length or None for text, required) per record type
+FIELDS = {
+    'genre': (('name', 100, True), ('description', None, False)),
+    'artist': (('name', 200, True), ('biography', None, False), ('multimedia', None, False)),
+    'work': (('title', 200, True), ('description', None, False)),
+}
+
+
+class RecordError(ValueError):
+    """Raised for a record that cannot be imported"""
+
+
+def _parse(line):
+    """Return (type, key, row, refs) for one NDJSON line"""
+    try:
+        record = json.loads(line)
+    except ValueError:
+        raise RecordError('Invalid JSON')
+    if not isinstance(record, dict):
+        raise RecordError('Record must be a JSON object')
+    record_type = record.get('type')
+    if record_type not in RECORD_TYPES:
+        raise RecordError(f'type must be one of: {", ".join(RECORD_TYPES)}')
+    key = record.get('key')
+    if key is not None and not isinstance(key, str):
+        raise RecordError('key must be a string')
+
+    row = {}
+    for field, max_length, required in FIELDS[record_type]:
+        value = record.get(field)
+        if value is None or value == '':
+            if required:
+                raise RecordError(f'{field} is required')
+            value = None
+        elif not isinstance(value, str):
+            raise RecordError(f'{field} must be a string')
+        elif max_length and len(value) > max_length:
+            raise RecordError(f'{field} must be at most {max_length} characters')
+        row[field] = value
+
+    refs = {}
+    if record_type == 'work':
+        for target in ('genre', 'artist'):
+            ref_key, ref_id = record.get(f'{target}_key'), record.get(f'{target}_id')
+            if (ref_key is None) == (ref_id is None):
+                raise RecordError(f'Exactly one of {target}_key and {target}_id is required')
+            if ref_key is not None and not isinstance(ref_key, str):
+                raise RecordError(f'{target}_key must be a string')
+            if ref_id is not None and (not isinstance(ref_id, int) or isinstance(ref_id, bool)):
+                raise RecordError(f'{target}_id must be an integer')
+            refs[target] = (ref_key, ref_id)
+    return record_type, key, row, refs
+
+
+class CatalogImporter:
+    """Imports NDJSON records in chunks of `chunk_size` lines, one transaction per chunk.
+
+    Each line is an object with a `type` of 'genre', 'artist' or 'work', the
+    model's fields, and an optional external `key`. Works reference their
+    genre and artist either by database id (`genre_id`, `artist_id`) or by the
+    key of a record earlier in the same import (`genre_key`, `artist_key`).
+    Within a chunk, genres are inserted before artists and artists before
+    works, each with multi-row INSERTs; id references are checked with one
+    query per chunk. A record that fails validation is reported and skipped;
+    a database error rolls back its whole chunk.
+    """
+
+    def __init__(self, chunk_size):
+        self.chunk_size = chunk_size
+        self.keys = {record_type: {} for record_type in RECORD_TYPES}
+        self.created = 0
+        self.failed = 0
+
+    def run(self, lines, out):
+        """Import `lines` and write one NDJSON result per record, then a summary, to `out`"""
+        chunk = []
+        for line_number, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            chunk.append((line_number, line))
+            if len(chunk) >= self.chunk_size:
+                self._import_chunk(chunk, out)
+                chunk = []
+        if chunk:
+            self._import_chunk(chunk, out)
+        self._write(out, {'summary': {'created': self.created, 'failed': self.failed}})
+
+    def _import_chunk(self, chunk, out):
+        results = {}
+        records = {record_type: [] for record_type in RECORD_TYPES}
+        claimed = []
+        for line_number, line in chunk:
+            try:
+                record_type, key, row, refs = _parse(line)
+            except RecordError as e:
+                results[line_number] = {'line': line_number, 'status': 'error', 'error': str(e)}
+                continue
+            result = {'line': line_number, 'type': record_type, 'key': key}
+            results[line_number] = result
+            if key is not None:
+                if key in self.keys[record_type]:
+                    result.update(status='error', error='Duplicate key')
+                    continue
+                self.keys[record_type][key] = None  # claimed; the id is set once inserted
+                claimed.append((record_type, key))
+            records[record_type].append((result, row, refs))
+
+        created = {record_type: [] for record_type in RECORD_TYPES}
+        try:
+            self._insert_genres(records['genre'], created['genre'])
+            self._insert(ArtistRepository, records['artist'], created['artist'])
+            self._insert_works(records['work'], created['work'])
+            db.session.commit()
+        except SQLAlchemyError:
+            db.session.rollback()
+            for record_type, key in claimed:
+                self.keys[record_type][key] = None
+            for items in records.values():
+                for result, _, _ in items:
+                    if result.get('status') != 'error':
+                        result.pop('id', None)
+                        result.update(status='error', error='Chunk rolled back after a database error')
+            created = {record_type: [] for record_type in RECORD_TYPES}
+
+        for record_type, key in claimed:
+            if self.keys[record_type][key] is None:
+                del self.keys[record_type][key]  # failed records can't be referenced
+
+        for line_number in sorted(results):
+            result = results[line_number]
+            if result['status'] == 'created':
+                self.created += 1
+            else:
+                self.failed += 1
+            self._write(out, result)
+        self._after_commit(created)
+
+    def _insert(self, repository, items, created):
+        """Insert the rows that passed validation, recording their ids on the results"""
+        valid = [(result, row) for result, row, _ in items if 'status' not in result]
+        if not valid:
+            return
+        ids = repository.bulk_create([row for _, row in valid])
+        for (result, _), new_id in zip(valid, ids):
+            result.update(status='created', id=new_id)
+            created.append(result)
+            if result['key'] is not None:
+                self.keys[result['type']][result['key']] = new_id
+
+    def _insert_genres(self, items, created):
+        taken = GenreRepository.find_existing_names({row['name'] for _, row, _ in items})
+        for result, row, _ in items:
+            if row['name'] in taken:
+                result.update(status='error', error='Genre already exists')
+            taken.add(row['name'])
+        self._insert(GenreRepository, items, created)
+
+    def _insert_works(self, items, created):
+        existing = {
+            'genre': GenreRepository.find_existing_ids({refs['genre'][1] for _, _, refs in items} - {None}),
+            'artist': ArtistRepository.find_existing_ids({refs['artist'][1] for _, _, refs in items} - {None}),
+        }
+        for result, row, refs in items:
+            for target in ('genre', 'artist'):
+                ref_key, ref_id = refs[target]
+                if ref_key is not None:
+                    ref_id = self.keys[target].get(ref_key)
+                    if ref_id is None:
+                        result.update(status='error', error=f'Unknown {target}_key')
+                        break
+                elif ref_id not in existing[target]:
+                    result.update(status='error', error=f'{target.capitalize()} not found')
+                    break
+                row[f'{target}_id'] = ref_id
+        self._insert(MusicalWorkRepository, items, created)
+
+    def _after_commit(self, created):
+        ids = {record_type: [result['id'] for result in items] for record_type, items in created.items()}
+        if not any(ids.values()):
+            return
+        invalidate('genres', 'artists', 'works', *(
+            f'{record_type}:{record_id}' for record_type, record_ids in ids.items() for record_id in record_ids
+        ))
+        indexes = get_catalog_indexes()
+        if not indexes:
+            return
+        genres = GenreRepository.find_by_ids(ids['genre'])
+        artists = ArtistRepository.find_by_ids(ids['artist'])
+        works = MusicalWorkRepository.find_by_ids(ids['work'])
+        for index in indexes:
+            index.add_genres(genres)
+            index.add_artists(artists)
+            index.add_works(works)
+
+    @staticmethod
+    def _write(out, payload):
+        out.write(json.dumps(payload, separators=(',', ':')).encode() + b'\n')
@@ -0,0 +1,96 @@
+"""Propagation of catalog writes between worker processes through the catalog_versions table
+
+Every process keeps its own response cache and in-memory indexes. A write
+calls `response_cache.invalidate`, which expires this process's entries and
+bumps the keys in catalog_versions (one row per key, such as 'works' or
+'artist:5'). Before a request, each process reads the keys changed since its
+last poll, at most every CATALOG_SYNC_INTERVAL seconds, reloads the genres,
+artists and works they name into its indexes and expires its cached
+responses built from them. A write handled by another process therefore
+shows up here within about CATALOG_SYNC_INTERVAL seconds; RESPONSE_CACHE_TTL
+still bounds how stale a cached response can get should polling fail.
+
+Each poll reads back CATALOG_SYNC_WINDOW seconds of rows it has already
+seen, so a bump committed late, or stamped by a host whose clock lags, is
+still picked up; rows already applied at the same version are skipped.
+"""
+
+import threading
+import time
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from query_budget import unbudgeted
+
+
+class CatalogSync:
+    """Which catalog_versions rows this process has applied, and when to poll next"""
+
+    def __init__(self, interval, window):
+        self.interval = interval
+        self.window = timedelta(seconds=window)
+        self._lock = threading.Lock()
+        # Changes committed before the process started are in what it loads from the database
+        self._since = datetime.utcnow() - self.window
+        self._applied = {}  # key -> version, for rows the next poll reads again
+        self._next_poll = 0.0
+
+    def poll(self, apply):
+        """Call `apply` with the keys changed since the last poll; returns whether it polled.
+
+        Skips polling when the last poll was less than `interval` seconds ago
+        or another thread is polling. When `apply` raises, the next poll
+        passes the same keys again.
+        """
+        if time.monotonic() < self._next_poll or not self._lock.acquire(blocking=False):
+            return False
+        try:
+            if time.monotonic() < self._next_poll:
+                return False
+            from repositories.catalog_version_repository import CatalogVersionRepository
+
+            started = datetime.utcnow()
+            rows = CatalogVersionRepository.find_changed_since(self._since)
+            changed = [key for key, version, _ in rows if self._applied.get(key) != version]
+            if changed:
+                apply(changed)
+            self._since = started - self.window
+            self._applied = {key: version for key, version, changed_at in rows if changed_at > self._since}
+            self._next_poll = time.monotonic() + self.interval
+            return True
+        finally:
+            self._lock.release()
+
+
+def publish(keys):
+    """Bump version keys in catalog_versions, for other processes to apply on their next poll"""
+    if not keys:
+        return
+    from repositories.catalog_version_repository import CatalogVersionRepository
+
+    with unbudgeted():
+        CatalogVersionRepository.bump(keys, datetime.utcnow())
+
+
+def _apply(keys):
+    from search_index import refresh_catalog_indexes
+
+    # Indexes first, so a response cached after the keys expire is built from the refreshed ones
+    refresh_catalog_indexes(keys)
+    current_app.extensions['response_cache'].invalidate(*keys)
+
+
+def init_catalog_sync(app):
+    """Poll catalog_versions before each request; call before init_replica_routing, so polls read the primary"""
+    app.extensions['catalog_sync'] = CatalogSync(
+        app.config['CATALOG_SYNC_INTERVAL'], app.config['CATALOG_SYNC_WINDOW']
+    )
+
+    @app.before_request
+    def sync_catalog():
+        from app import db
+
+        with unbudgeted():
+            if current_app.extensions['catalog_sync'].poll(_apply):
+                db.session.close()  # returns the primary connection; the request may read from the replica
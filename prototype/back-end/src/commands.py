@@ -0,0 +1,56 @@
+"""Flask CLI commands for maintenance tasks"""
+
+import click
+from flask.cli import AppGroup
+
+
+def register_commands(app):
+    """Register maintenance commands on the app's CLI"""
+
+    @app.cli.command('recompute-ratings')
+    def recompute_ratings():
+        """Rebuild stored rating aggregates from approved reviews"""
+        from repositories.review_repository import ReviewRepository
+        from response_cache import invalidate
+        from search_index import reindex_works
+        repaired = ReviewRepository.recompute_rating_aggregates()
+        if repaired:
+            # Published through catalog_versions, so running servers reload the works too
+            invalidate('works', *(f'work:{musical_work_id}' for musical_work_id in repaired))
+            reindex_works(repaired)
+        click.echo(f'Repaired rating aggregates for {len(repaired)} musical work(s)')
+
+    @app.cli.command('refresh-charts')
+    def refresh_charts():
+        """Re-estimate the chart prior from approved ratings and rescore every work; run periodically"""
+        from repositories.chart_repository import ChartRepository
+        settings, charted = ChartRepository.rebuild(
+            app.config['CHART_PRIOR_WEIGHT'], app.config['CHART_MIN_REVIEWS']
+        )
+        click.echo(
+            f'Charted {charted} musical work(s) '
+            f'with prior mean {settings.prior_mean:.3f} and weight {settings.prior_weight:g}'
+        )
+
+    migrate_cli = AppGroup('db', help='Versioned schema migrations')
+
+    @migrate_cli.command('upgrade')
+    @click.option('--to', 'target', type=int, help='Stop after this migration version')
+    def upgrade(target):
+        """Apply pending migrations"""
+        import migrations
+        from app import db
+        applied = migrations.upgrade(db.engine, target, log=click.echo)
+        click.echo(f'Applied {len(applied)} migration(s)')
+
+    @migrate_cli.command('status')
+    def status():
+        """List migrations and whether each is applied"""
+        import migrations
+        from app import db
+        applied = migrations.applied_versions(db.engine)
+        for migration in migrations.discover():
+            state = 'applied' if migration.version in applied else 'pending'
+            click.echo(f'{migration}  {state}')
+
+    app.cli.add_command(migrate_cli)
@@ -10,6 +10,67 @@ class Config:
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY') or 'jwt-secret-change-me'
     JWT_ACCESS_TOKEN_EXPIRES = False  # Set to appropriate value in production
+    SEARCH_BACKEND = os.environ.get('SEARCH_BACKEND') or 'sql'  # 'sql' or 'memory' (in-process inverted index)
+    # Seconds a token's role/active claims are trusted without a lookup; capped at
+    # PRINCIPAL_CACHE_TTL, which bounds how long other workers act on a revoked role
+    PRINCIPAL_CLAIMS_MAX_AGE = 60
+    PRINCIPAL_CACHE_TTL = 60  # Seconds a principal loaded from the database is cached
+    PRINCIPAL_CACHE_SIZE = 10000
+    RESPONSE_CACHE_MAX_BYTES = 64 * 1024 * 1024  # Public catalog GET responses kept in memory
+    RESPONSE_CACHE_MAX_ENTRY_BYTES = 1024 * 1024
+    # Seconds a cached response lives. Writes made by other worker processes expire it
+    # within CATALOG_SYNC_INTERVAL; this bounds staleness should that polling fail
+    RESPONSE_CACHE_TTL = 30
+    # Seconds between a process's polls of catalog_versions for other processes' writes,
+    # which bounds how long its cached responses and in-memory indexes miss them
+    CATALOG_SYNC_INTERVAL = 2
+    CATALOG_SYNC_WINDOW = 10  # Seconds of changes each poll reads again: late commits plus clock skew between hosts
+    QUERY_BUDGET_ENFORCE = False  # Raise instead of warn when a view exceeds its query budget
+    # Werkzeug hash method with explicit parameters; stored hashes made with
+    # other parameters are rehashed on the user's next login
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD') or 'scrypt:32768:8:1'
+    PASSWORD_HASH_SALT_LENGTH = 16
+    PASSWORD_HASH_WORKERS = 4  # Passwords hashed concurrently per process
+    PASSWORD_HASH_QUEUE_TIMEOUT = 2.0  # Seconds to wait for a hasher before answering 503
+    IMPORT_CHUNK_SIZE = 5000  # NDJSON lines per transaction in POST /import
+    MODERATION_BATCH_MAX_IDS = 10000  # Reviews per batch approve/reject request, listed by id or matched by filter
+    MODERATION_CLAIM_SIZE = 20  # Pending reviews leased per claim by default
+    MODERATION_CLAIM_MAX = 200
+    MODERATION_LEASE_SECONDS = 300  # How long a claimed review stays reserved for its moderator
+    EXPORT_BATCH_SIZE = 1000  # Works fetched and serialized per chunk of GET /musical-works/export
+    WORK_DETAIL_REVIEWS = 10  # Approved reviews embedded in GET /musical-works/<id> unless reviews_limit is given
+    # Chart scores are Bayesian averages: approved ratings plus CHART_PRIOR_WEIGHT
+    # ratings of the catalog mean. Applied by `flask refresh-charts`.
+    CHART_PRIOR_WEIGHT = 10.0
+    CHART_MIN_REVIEWS = 1  # Approved reviews a work needs to be charted
+    CHART_SIZE = 10  # Works in GET /charts and new top lists unless limit/size is given
+    CHART_MAX_SIZE = 100
+    BATCH_GET_MAX_IDS = 500  # Ids per type in a multi-get: GET ...?ids= and POST /batch/get
+    JSON_ENCODER = os.environ.get('JSON_ENCODER') or 'auto'  # 'auto' (orjson when installed), 'orjson' or 'stdlib'
+    # Connection pool per worker process; see database.engine_options
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 5))  # Extra connections opened under load
+    DB_POOL_TIMEOUT = 10  # Seconds to wait for a free connection
+    DB_POOL_RECYCLE = 1800  # Seconds before a connection is replaced, ahead of server idle timeouts
+    DB_POOL_PRE_PING = True  # Test connections on checkout, so a restarted server costs no failed request
+    # Set when connecting through PgBouncer in transaction mode, which rejects
+    # startup options and shares server sessions: timeouts are then set per
+    # transaction. Run `flask db upgrade` against the server directly.
+    DB_PGBOUNCER = os.environ.get('DB_PGBOUNCER', '').lower() in ('1', 'true', 'yes')
+    # PostgreSQL statement_timeout in milliseconds per endpoint class; views
+    # pick one with @statement_timeout, otherwise GET and @read_only views are 'read' and the rest 'write'.
+    # 'background' covers CLI commands and other work outside a request (0 = none).
+    STATEMENT_TIMEOUTS = {'read': 5000, 'search': 2000, 'write': 10000, 'bulk': 600000, 'background': 0}
+    # Streaming read replica; GETs and @read_only views in these blueprints
+    # read from it unless marked @use_primary. Unset DATABASE_REPLICA_URL to use the primary only.
+    DATABASE_REPLICA_URL = os.environ.get('DATABASE_REPLICA_URL')
+    SQLALCHEMY_BINDS = {'replica': DATABASE_REPLICA_URL} if DATABASE_REPLICA_URL else {}
+    REPLICA_BLUEPRINTS = ('search', 'producer', 'user', 'batch', 'charts')
+    REPLICA_LAG_TOLERANCE = 5  # Seconds after a write during which reads stay on the primary
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')  # Bearer token GET /metrics requires; unset disables it
+    SLOW_REQUEST_SECONDS = 0.5  # Requests slower than this are logged with their SQL
+    SLOW_REQUEST_QUERIES = 20  # So are requests running more statements than this
+    SLOW_REQUEST_STATEMENTS = 5  # Most expensive statements listed per slow request
 
 
 class DevelopmentConfig(Config):
@@ -17,13 +78,25 @@ class DevelopmentConfig(Config):
     DEBUG = True
 
 
+class TestingConfig(Config):
+    """Testing configuration"""
+    TESTING = True
+    QUERY_BUDGET_ENFORCE = True
+    PASSWORD_HASH_METHOD = 'pbkdf2:sha256:1000'  # Cheap hashes keep tests fast
+
+
 class ProductionConfig(Config):
     """Production configuration"""
     DEBUG = False
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+    DB_POOL_TIMEOUT = 5  # Fail fast rather than queue behind a saturated pool
+    DB_POOL_RECYCLE = 300  # Managed hosts and load balancers drop idle connections after minutes
 
 
 config = {
     'development': DevelopmentConfig,
+    'testing': TestingConfig,
     'production': ProductionConfig,
     'default': DevelopmentConfig
 }
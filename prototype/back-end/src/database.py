@@ -0,0 +1,256 @@
+"""Engine tuning: connection pool options, statement timeouts, pool checkout metrics and replica routing"""
+
+import threading
+import time
+
+from flask import current_app, g, has_request_context, jsonify, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from sqlalchemy.sql.dml import UpdateBase
+
+# Upper bounds, in seconds, of the checkout wait histogram
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+QUERY_CANCELED = '57014'  # PostgreSQL SQLSTATE for statement_timeout
+
+REPLICA_BIND = 'replica'
+LAST_WRITE_COOKIE = 'last_write'
+
+
+def statement_timeout(endpoint_class):
+    """Run a view's statements under the STATEMENT_TIMEOUTS entry for `endpoint_class`.
+
+    Views without it use 'read' for GET and HEAD requests and `read_only` views, and 'write' otherwise.
+    """
+    def decorator(view):
+        view.statement_timeout = endpoint_class
+        return view
+    return decorator
+
+
+def use_primary(view):
+    """Keep a GET view on the primary even in a blueprint whose reads go to the replica"""
+    view.use_primary = True
+    return view
+
+
+def read_only(view):
+    """Treat a POST view that only reads like a GET: replica routing, the 'read' timeout and no last-write cookie"""
+    view.read_only = True
+    return view
+
+
+def _is_read():
+    """Whether the current request reads only: a GET or HEAD, or a view marked `read_only`"""
+    if request.method in ('GET', 'HEAD'):
+        return True
+    return getattr(current_app.view_functions.get(request.endpoint), 'read_only', False)
+
+
+class PoolMetrics:
+    """Counts of pool checkouts and how long each waited for a connection"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.wait_buckets = [0] * len(WAIT_BUCKETS)
+
+    def record(self, seconds, timed_out=False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+                return
+            self.checkouts += 1
+            self.wait_seconds_total += seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+            for i, bound in enumerate(WAIT_BUCKETS):
+                if seconds <= bound:
+                    self.wait_buckets[i] += 1
+                    break
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'checkouts': self.checkouts,
+                'timeouts': self.timeouts,
+                'wait_seconds_total': self.wait_seconds_total,
+                'wait_seconds_max': self.wait_seconds_max,
+                'wait_buckets': dict(zip((str(bound) for bound in WAIT_BUCKETS), self.wait_buckets))
+            }
+
+
+pool_metrics = PoolMetrics()
+
+
+class _TimedCheckout:
+    """Pool mixin that records how long each checkout waited for a connection"""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except Exception:
+            pool_metrics.record(time.perf_counter() - started, timed_out=True)
+            raise
+        pool_metrics.record(time.perf_counter() - started)
+        return connection
+
+
+class TimedQueuePool(_TimedCheckout, QueuePool):
+    """The pool for synchronous drivers"""
+
+
+class TimedAsyncQueuePool(_TimedCheckout, AsyncAdaptedQueuePool):
+    """For async drivers such as asyncpg, used by the ASGI read path"""
+
+
+def engine_options(config):
+    """SQLALCHEMY_ENGINE_OPTIONS from the DB_* settings, merged under any explicit options"""
+    url = make_url(config['SQLALCHEMY_DATABASE_URI'])
+    if url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:'):
+        # An in-memory database lives in a single shared connection
+        return dict(config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    options = {
+        'poolclass': TimedAsyncQueuePool if url.get_dialect().is_async else TimedQueuePool,
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': config['DB_POOL_PRE_PING'],
+    }
+    if url.get_backend_name() == 'postgresql':
+        options['connect_args'] = _postgresql_connect_args(url.get_driver_name(), config)
+    options.update(config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    return options
+
+
+def _postgresql_connect_args(driver, config):
+    read_timeout = str(config['STATEMENT_TIMEOUTS']['read'])
+    if driver == 'asyncpg':
+        if config['DB_PGBOUNCER']:
+            # Prepared statements are per server session, which transaction pooling shares
+            return {'prepared_statement_cache_size': 0, 'statement_cache_size': 0}
+        return {'server_settings': {'statement_timeout': read_timeout}}
+    if config['DB_PGBOUNCER']:
+        return {}
+    # The read timeout as the connection default, so most transactions need no SET
+    return {'options': f'-c statement_timeout={read_timeout}'}
+
+
+def _timeout_for_transaction():
+    """statement_timeout in ms for the current request's endpoint class, or for background work"""
+    timeouts = current_app.config['STATEMENT_TIMEOUTS']
+    if not has_request_context():
+        return timeouts['background']
+    view = current_app.view_functions.get(request.endpoint)
+    endpoint_class = getattr(view, 'statement_timeout', None)
+    if endpoint_class is None:
+        endpoint_class = 'read' if _is_read() else 'write'
+    return timeouts[endpoint_class]
+
+
+def _set_statement_timeout(connection):
+    if connection.dialect.name != 'postgresql' or not current_app:
+        return
+    if connection.get_execution_options().get('isolation_level') == 'AUTOCOMMIT':
+        return  # SET LOCAL has no effect outside a transaction block
+    timeout = _timeout_for_transaction()
+    config = current_app.config
+    if not config['DB_PGBOUNCER'] and timeout == config['STATEMENT_TIMEOUTS']['read']:
+        return  # already the connection default
+    # On the DBAPI cursor, so it is not counted against the request's query budget
+    cursor = connection.connection.dbapi_connection.cursor()
+    try:
+        cursor.execute(f'SET LOCAL statement_timeout = {int(timeout)}')
+    finally:
+        cursor.close()
+
+
+def init_database(app):
+    """Derive engine options from config; call before db.init_app"""
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config)
+
+    if not event.contains(Engine, 'begin', _set_statement_timeout):
+        event.listen(Engine, 'begin', _set_statement_timeout)
+
+    @app.errorhandler(OperationalError)
+    def statement_timed_out(error):
+        if getattr(error.orig, 'pgcode', None) != QUERY_CANCELED:
+            raise error
+        return jsonify({'error': 'The database took too long to respond'}), 503
+
+
+def pool_status(engine):
+    """Current pool occupancy and cumulative checkout wait metrics"""
+    pool = engine.pool
+    status = pool_metrics.snapshot()
+    if isinstance(pool, QueuePool):
+        status.update({
+            'size': pool.size(),
+            'checked_out': pool.checkedout(),
+            'overflow': pool.overflow(),
+            'idle': pool.checkedin()
+        })
+    return status
+
+
+class RoutingSession(Session):
+    """Session that reads from the replica bind in requests routed there.
+
+    Flushes and INSERT, UPDATE and DELETE statements always go to the primary,
+    so a stray write in a replica-routed request still lands in the right place.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None and not self._flushing and not isinstance(clause, UpdateBase)
+                and has_request_context() and g.get('use_replica')):
+            return self._db.engines[REPLICA_BIND]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def _use_replica():
+    """Route GETs in REPLICA_BLUEPRINTS to the replica, unless the client or this process just wrote.
+
+    A client that made a write within REPLICA_LAG_TOLERANCE seconds carries a
+    last-write cookie and reads from the primary, so it sees its own changes.
+    Likewise, after this process invalidated cached responses, cache misses
+    are rebuilt from the primary instead of caching data the replica has not
+    caught up with yet.
+    """
+    config = current_app.config
+    if REPLICA_BIND not in config['SQLALCHEMY_BINDS']:
+        return False
+    if not _is_read() or request.blueprint not in config['REPLICA_BLUEPRINTS']:
+        return False
+    if getattr(current_app.view_functions.get(request.endpoint), 'use_primary', False):
+        return False
+    fresh_after = time.time() - config['REPLICA_LAG_TOLERANCE']
+    try:
+        if float(request.cookies.get(LAST_WRITE_COOKIE, 0)) > fresh_after:
+            return False
+    except ValueError:
+        pass
+    return current_app.extensions['response_cache'].last_invalidated <= fresh_after
+
+
+def init_replica_routing(app):
+    """Choose primary or replica per request; needs db created with RoutingSession"""
+    @app.before_request
+    def choose_bind():
+        g.use_replica = _use_replica()
+
+    @app.after_request
+    def mark_write(response):
+        if (REPLICA_BIND in app.config['SQLALCHEMY_BINDS'] and request.method != 'OPTIONS' and not _is_read()
+                and response.status_code < 400):
+            response.set_cookie(
+                LAST_WRITE_COOKIE, f'{time.time():.3f}',
+                max_age=max(1, round(app.config['REPLICA_LAG_TOLERANCE'])), httponly=True, samesite='Lax'
+            )
+        return response
@@ -0,0 +1,56 @@
+"""JSON provider with a pluggable encoder: orjson when installed, else the standard library"""
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # optional; the standard library encoder is used instead
+    orjson = None
+
+ENCODERS = ('auto', 'orjson', 'stdlib')
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask's JSON provider, encoding with the backend chosen by the JSON_ENCODER setting.
+
+    orjson output parses to the same values as the standard library's: keys
+    are sorted, and dates, decimals, dataclasses and other types orjson
+    would format differently go through Flask's `default`. Non-ASCII text is
+    written as UTF-8 rather than \\u escapes. Calls with encoder options
+    orjson does not have fall back to the standard library.
+    """
+
+    def __init__(self, app):
+        super().__init__(app)
+        encoder = app.config.get('JSON_ENCODER', 'auto')
+        if encoder not in ENCODERS:
+            raise ValueError(f'JSON_ENCODER must be one of: {", ".join(ENCODERS)}')
+        if encoder == 'orjson' and orjson is None:
+            raise RuntimeError('JSON_ENCODER is orjson, but orjson is not installed')
+        self.encoder = 'stdlib' if encoder == 'stdlib' or orjson is None else 'orjson'
+
+    def dumps(self, obj, **kwargs):
+        if self.encoder == 'orjson':
+            option = self._orjson_option(kwargs)
+            if option is not None:
+                try:
+                    return orjson.dumps(obj, default=self.default, option=option).decode()
+                except orjson.JSONEncodeError:
+                    pass  # e.g. integers beyond 64 bits; the standard library raises its own error if it must
+        return super().dumps(obj, **kwargs)
+
+    def _orjson_option(self, kwargs):
+        """orjson flags equivalent to the standard library `kwargs`, or None when there are none"""
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+        if kwargs.get('sort_keys', self.sort_keys):
+            option |= orjson.OPT_SORT_KEYS
+        indent = kwargs.get('indent')
+        if indent == 2:
+            option |= orjson.OPT_INDENT_2
+        elif indent is not None:
+            return None
+        if kwargs.get('separators', (',', ':')) != (',', ':') and indent is None:
+            return None
+        if set(kwargs) - {'sort_keys', 'indent', 'separators'}:
+            return None
+        return option
@@ -0,0 +1,120 @@
+"""Versioned schema migrations, applied out of band with `flask db upgrade`
+
+Each module in `migrations.versions` is named `<version>_<name>.py` and
+defines `upgrade(connection)`. A migration runs in one transaction unless it
+sets `TRANSACTIONAL = False`, which runs it in autocommit mode so it can
+build indexes with CREATE INDEX CONCURRENTLY; such migrations must be safe to
+re-run after a partial failure. Applied versions are recorded in the
+schema_migrations table.
+"""
+
+import importlib
+import pkgutil
+import re
+from datetime import datetime
+
+import sqlalchemy as sa
+
+from migrations import versions
+
+MODULE_NAME = re.compile(r'^(\d{4})_(\w+)$')
+
+# Serializes concurrent `flask db upgrade` runs on PostgreSQL
+ADVISORY_LOCK_ID = 7_210_501
+
+schema_migrations = sa.Table(
+    'schema_migrations', sa.MetaData(),
+    sa.Column('version', sa.Integer, primary_key=True),
+    sa.Column('name', sa.String(200), nullable=False),
+    sa.Column('applied_at', sa.DateTime, nullable=False)
+)
+
+
+class Migration:
+    """A migration module and its version"""
+
+    def __init__(self, version, name, module):
+        self.version = version
+        self.name = name
+        self.module = module
+
+    @property
+    def transactional(self):
+        return getattr(self.module, 'TRANSACTIONAL', True)
+
+    def __str__(self):
+        return f'{self.version:04d}_{self.name}'
+
+
+def discover():
+    """All migrations in version order"""
+    migrations = []
+    for module_info in pkgutil.iter_modules(versions.__path__):
+        match = MODULE_NAME.match(module_info.name)
+        if match:
+            module = importlib.import_module(f'{versions.__name__}.{module_info.name}')
+            migrations.append(Migration(int(match.group(1)), match.group(2), module))
+    migrations.sort(key=lambda migration: migration.version)
+    for previous, current in zip(migrations, migrations[1:]):
+        if previous.version == current.version:
+            raise RuntimeError(f'Duplicate migration version {current.version:04d}')
+    return migrations
+
+
+def applied_versions(engine):
+    """Versions recorded as applied"""
+    with engine.begin() as connection:
+        schema_migrations.create(connection, checkfirst=True)
+        return set(connection.scalars(sa.select(schema_migrations.c.version)))
+
+
+def pending(engine, target=None):
+    """Migrations not yet applied, up to and including `target`"""
+    applied = applied_versions(engine)
+    return [
+        migration for migration in discover()
+        if migration.version not in applied and (target is None or migration.version <= target)
+    ]
+
+
+def upgrade(engine, target=None, log=print):
+    """Apply pending migrations in order; returns the ones applied"""
+    with engine.connect() as lock_connection:
+        if engine.dialect.name == 'postgresql':
+            lock_connection.execute(sa.text('SELECT pg_advisory_lock(:id)'), {'id': ADVISORY_LOCK_ID})
+            lock_connection.commit()
+        try:
+            migrations = pending(engine, target)
+            for migration in migrations:
+                log(f'Applying {migration}')
+                if migration.transactional:
+                    with engine.begin() as connection:
+                        _disable_statement_timeout(connection, 'SET LOCAL')
+                        migration.module.upgrade(connection)
+                        _record(connection, migration)
+                else:
+                    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+                        _disable_statement_timeout(connection, 'SET')
+                        try:
+                            migration.module.upgrade(connection)
+                            _record(connection, migration)
+                        finally:
+                            if engine.dialect.name == 'postgresql':
+                                connection.exec_driver_sql('RESET statement_timeout')
+            return migrations
+        finally:
+            if engine.dialect.name == 'postgresql':
+                lock_connection.execute(sa.text('SELECT pg_advisory_unlock(:id)'), {'id': ADVISORY_LOCK_ID})
+                lock_connection.commit()
+
+
+def _disable_statement_timeout(connection, set_command):
+    """Lift the request statement_timeout the pool's connections start with"""
+    if connection.dialect.name == 'postgresql':
+        connection.exec_driver_sql(f'{set_command} statement_timeout = 0')
+
+
+def _record(connection, migration):
+    connection.execute(schema_migrations.insert().values(
+        version=migration.version, name=migration.name, applied_at=datetime.utcnow()
+    ))
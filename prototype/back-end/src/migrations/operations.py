@@ -0,0 +1,47 @@
+"""Idempotent schema operations for migrations"""
+
+import sqlalchemy as sa
+from sqlalchemy.schema import CreateColumn, CreateIndex
+
+
+def has_table(connection, table_name):
+    return sa.inspect(connection).has_table(table_name)
+
+
+def has_column(connection, table_name, column_name):
+    return any(column['name'] == column_name for column in sa.inspect(connection).get_columns(table_name))
+
+
+def add_column(connection, table_name, column, references=None):
+    """ALTER TABLE ... ADD COLUMN unless the column exists; `references` is e.g. 'users(id) ON DELETE SET NULL'"""
+    if has_column(connection, table_name, column.name):
+        return False
+    definition = CreateColumn(column).compile(dialect=connection.dialect)
+    if references:
+        definition = f'{definition} REFERENCES {references}'
+    connection.execute(sa.text(f'ALTER TABLE {table_name} ADD COLUMN {definition}'))
+    return True
+
+
+def create_index(connection, index):
+    """CREATE INDEX IF NOT EXISTS.
+
+    Pass an index declared with postgresql_concurrently=True to build it
+    without blocking writes; that needs a non-transactional migration. An
+    invalid index left behind by an interrupted concurrent build is dropped
+    and rebuilt.
+    """
+    if connection.dialect.name == 'postgresql' and index.dialect_options['postgresql']['concurrently']:
+        invalid = connection.scalar(sa.text(
+            'SELECT NOT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid '
+            'WHERE c.relname = :name'
+        ), {'name': index.name})
+        if invalid:
+            connection.execute(sa.text(f'DROP INDEX CONCURRENTLY {index.name}'))
+    connection.execute(CreateIndex(index, if_not_exists=True))
+
+
+def drop_index(connection, name):
+    """DROP INDEX IF EXISTS, concurrently on PostgreSQL (which needs a non-transactional migration)"""
+    concurrently = ' CONCURRENTLY' if connection.dialect.name == 'postgresql' else ''
+    connection.execute(sa.text(f'DROP INDEX{concurrently} IF EXISTS {name}'))
@@ -0,0 +1,59 @@
+"""Tables as first created by db.create_all(); existing databases already have them"""
+
+import sqlalchemy as sa
+
+metadata = sa.MetaData()
+
+sa.Table(
+    'users', metadata,
+    sa.Column('id', sa.Integer, primary_key=True),
+    sa.Column('username', sa.String(80), unique=True, nullable=False, index=True),
+    sa.Column('email', sa.String(120), unique=True, nullable=False, index=True),
+    sa.Column('password_hash', sa.String(255), nullable=False),
+    sa.Column('role', sa.String(20), nullable=False),
+    sa.Column('is_active', sa.Boolean),
+    sa.Column('created_at', sa.DateTime)
+)
+
+sa.Table(
+    'genres', metadata,
+    sa.Column('id', sa.Integer, primary_key=True),
+    sa.Column('name', sa.String(100), unique=True, nullable=False, index=True),
+    sa.Column('description', sa.Text),
+    sa.Column('created_at', sa.DateTime)
+)
+
+sa.Table(
+    'artists', metadata,
+    sa.Column('id', sa.Integer, primary_key=True),
+    sa.Column('name', sa.String(200), nullable=False, index=True),
+    sa.Column('biography', sa.Text),
+    sa.Column('multimedia', sa.Text),
+    sa.Column('created_at', sa.DateTime)
+)
+
+sa.Table(
+    'musical_works', metadata,
+    sa.Column('id', sa.Integer, primary_key=True),
+    sa.Column('title', sa.String(200), nullable=False, index=True),
+    sa.Column('description', sa.Text),
+    sa.Column('genre_id', sa.Integer, sa.ForeignKey('genres.id'), nullable=False),
+    sa.Column('artist_id', sa.Integer, sa.ForeignKey('artists.id'), nullable=False),
+    sa.Column('created_at', sa.DateTime)
+)
+
+sa.Table(
+    'reviews', metadata,
+    sa.Column('id', sa.Integer, primary_key=True),
+    sa.Column('user_id', sa.Integer, sa.ForeignKey('users.id'), nullable=False),
+    sa.Column('musical_work_id', sa.Integer, sa.ForeignKey('musical_works.id'), nullable=False),
+    sa.Column('rating', sa.Integer, nullable=False),
+    sa.Column('comment', sa.Text),
+    sa.Column('is_approved', sa.Boolean, nullable=False),
+    sa.Column('created_at', sa.DateTime),
+    sa.Column('updated_at', sa.DateTime)
+)
+
+
+def upgrade(connection):
+    metadata.create_all(connection, checkfirst=True)
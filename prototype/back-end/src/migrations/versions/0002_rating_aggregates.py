@@ -0,0 +1,36 @@
+"""Stored per-work rating aggregates, backfilled from approved reviews"""
+
+import sqlalchemy as sa
+
+from migrations.operations import add_column
+
+COLUMNS = ['review_count', 'rating_sum'] + [f'rating_{rating}_count' for rating in range(1, 6)]
+
+
+def upgrade(connection):
+    added = [
+        name for name in COLUMNS
+        if add_column(connection, 'musical_works', sa.Column(
+            name, sa.Integer, nullable=False, server_default='0'
+        ))
+    ]
+    if not added:
+        return
+
+    reviews = sa.table(
+        'reviews', sa.column('musical_work_id'), sa.column('rating'), sa.column('is_approved'), sa.column('id')
+    )
+    works = sa.table('musical_works', sa.column('id'), *(sa.column(name) for name in COLUMNS))
+
+    def approved(aggregate, *criteria):
+        return sa.select(aggregate).where(
+            reviews.c.musical_work_id == works.c.id, reviews.c.is_approved.is_(True), *criteria
+        ).scalar_subquery()
+
+    values = {
+        'review_count': approved(sa.func.count(reviews.c.id)),
+        'rating_sum': approved(sa.func.coalesce(sa.func.sum(reviews.c.rating), 0))
+    }
+    for rating in range(1, 6):
+        values[f'rating_{rating}_count'] = approved(sa.func.count(reviews.c.id), reviews.c.rating == rating)
+    connection.execute(sa.update(works).values(values))
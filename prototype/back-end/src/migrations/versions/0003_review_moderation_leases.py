@@ -0,0 +1,10 @@
+"""Moderation lease columns on reviews"""
+
+import sqlalchemy as sa
+
+from migrations.operations import add_column
+
+
+def upgrade(connection):
+    add_column(connection, 'reviews', sa.Column('claimed_by', sa.Integer), references='users (id) ON DELETE SET NULL')
+    add_column(connection, 'reviews', sa.Column('claimed_until', sa.DateTime))
@@ -0,0 +1,115 @@
+"""Foreign key, keyset-order, moderation and search indexes, built concurrently on PostgreSQL"""
+
+import sqlalchemy as sa
+
+from migrations.operations import create_index
+
+TRANSACTIONAL = False
+
+metadata = sa.MetaData()
+
+genres = sa.Table(
+    'genres', metadata,
+    sa.Column('id', sa.Integer), sa.Column('created_at', sa.DateTime)
+)
+
+artists = sa.Table(
+    'artists', metadata,
+    sa.Column('id', sa.Integer), sa.Column('name', sa.String(200)), sa.Column('created_at', sa.DateTime)
+)
+
+musical_works = sa.Table(
+    'musical_works', metadata,
+    sa.Column('id', sa.Integer), sa.Column('title', sa.String(200)), sa.Column('description', sa.Text),
+    sa.Column('genre_id', sa.Integer), sa.Column('artist_id', sa.Integer), sa.Column('created_at', sa.DateTime),
+    sa.Column('review_count', sa.Integer), sa.Column('rating_sum', sa.Integer)
+)
+
+reviews = sa.Table(
+    'reviews', metadata,
+    sa.Column('id', sa.Integer), sa.Column('user_id', sa.Integer), sa.Column('musical_work_id', sa.Integer),
+    sa.Column('is_approved', sa.Boolean), sa.Column('created_at', sa.DateTime)
+)
+
+
+def _literal(value):
+    return sa.literal(value, literal_execute=True)
+
+
+def _tsvector(column):
+    return sa.func.to_tsvector(_literal('simple'), sa.func.coalesce(column, _literal('')))
+
+
+def _index(name, *expressions, **kwargs):
+    return sa.Index(name, *expressions, postgresql_concurrently=True, **kwargs)
+
+
+INDEXES = [
+    # Foreign keys; reviews.user_id is covered by the unique (user_id, musical_work_id) index
+    _index('ix_musical_works_genre_id', musical_works.c.genre_id),
+    _index('ix_musical_works_artist_id', musical_works.c.artist_id),
+    _index('ix_reviews_musical_work_id', reviews.c.musical_work_id),
+    _index('ux_reviews_user_id_musical_work_id', reviews.c.user_id, reviews.c.musical_work_id, unique=True),
+
+    # Keyset pagination orders
+    _index('ix_genres_created_at_id', genres.c.created_at, genres.c.id),
+    _index('ix_artists_created_at_id', artists.c.created_at, artists.c.id),
+    _index('ix_musical_works_created_at_id', musical_works.c.created_at, musical_works.c.id),
+    _index('ix_musical_works_review_count_id', musical_works.c.review_count, musical_works.c.id),
+    _index(
+        'ix_musical_works_average_rating_id',
+        sa.case(
+            (musical_works.c.review_count > 0,
+             sa.cast(musical_works.c.rating_sum, sa.Float) / musical_works.c.review_count),
+            else_=0.0
+        ),
+        musical_works.c.id
+    ),
+
+    # Moderation queue
+    _index(
+        'ix_reviews_pending_created_at_id', reviews.c.created_at, reviews.c.id,
+        postgresql_where=reviews.c.is_approved == False,  # noqa: E712
+        sqlite_where=reviews.c.is_approved == False  # noqa: E712
+    ),
+]
+
+POSTGRESQL_INDEXES = [
+    _index(
+        'ix_artists_name_trgm', artists.c.name,
+        postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}
+    ),
+    _index(
+        'ix_musical_works_title_trgm', musical_works.c.title,
+        postgresql_using='gin', postgresql_ops={'title': 'gin_trgm_ops'}
+    ),
+    _index('ix_artists_search_document', _tsvector(artists.c.name), postgresql_using='gin'),
+    _index(
+        'ix_musical_works_search_document',
+        sa.func.setweight(_tsvector(musical_works.c.title), _literal('A')).op('||')(
+            sa.func.setweight(_tsvector(musical_works.c.description), _literal('B'))
+        ),
+        postgresql_using='gin'
+    ),
+]
+
+
+def upgrade(connection):
+    duplicate = connection.execute(
+        sa.select(reviews.c.user_id, reviews.c.musical_work_id)
+        .group_by(reviews.c.user_id, reviews.c.musical_work_id)
+        .having(sa.func.count() > 1)
+        .limit(1)
+    ).first()
+    if duplicate:
+        raise RuntimeError(
+            f'User {duplicate.user_id} has several reviews of musical work {duplicate.musical_work_id}; '
+            'remove duplicate reviews before adding the unique index'
+        )
+
+    indexes = INDEXES
+    if connection.dialect.name == 'postgresql':
+        connection.execute(sa.text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+        indexes = INDEXES + POSTGRESQL_INDEXES
+    for index in indexes:
+        create_index(connection, index)
@@ -0,0 +1,35 @@
+"""Indexes for paging a work's approved reviews by date or rating, replacing the plain musical_work_id index"""
+
+import sqlalchemy as sa
+
+from migrations.operations import create_index, drop_index
+
+TRANSACTIONAL = False
+
+metadata = sa.MetaData()
+
+reviews = sa.Table(
+    'reviews', metadata,
+    sa.Column('id', sa.Integer), sa.Column('musical_work_id', sa.Integer), sa.Column('rating', sa.Integer),
+    sa.Column('is_approved', sa.Boolean), sa.Column('created_at', sa.DateTime)
+)
+
+INDEXES = [
+    sa.Index(
+        'ix_reviews_musical_work_id_is_approved_created_at_id',
+        reviews.c.musical_work_id, reviews.c.is_approved, reviews.c.created_at, reviews.c.id,
+        postgresql_concurrently=True
+    ),
+    sa.Index(
+        'ix_reviews_musical_work_id_is_approved_rating_id',
+        reviews.c.musical_work_id, reviews.c.is_approved, reviews.c.rating, reviews.c.id,
+        postgresql_concurrently=True
+    ),
+]
+
+
+def upgrade(connection):
+    for index in INDEXES:
+        create_index(connection, index)
+    # Both new indexes lead with musical_work_id, so they serve the foreign key too
+    drop_index(connection, 'ix_reviews_musical_work_id')
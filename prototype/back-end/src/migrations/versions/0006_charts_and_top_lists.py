@@ -0,0 +1,91 @@
+"""Chart settings and entries, built from the stored rating aggregates, and top list snapshots"""
+
+from datetime import datetime
+
+import sqlalchemy as sa
+
+# Initial scoring parameters, as the CHART_PRIOR_WEIGHT and CHART_MIN_REVIEWS defaults
+PRIOR_WEIGHT = 10.0
+MIN_REVIEWS = 1
+DEFAULT_PRIOR_MEAN = 3.0
+
+metadata = sa.MetaData()
+
+users = sa.Table('users', metadata, sa.Column('id', sa.Integer, primary_key=True))
+genres = sa.Table('genres', metadata, sa.Column('id', sa.Integer, primary_key=True))
+musical_works = sa.Table(
+    'musical_works', metadata,
+    sa.Column('id', sa.Integer, primary_key=True), sa.Column('genre_id', sa.Integer),
+    sa.Column('review_count', sa.Integer), sa.Column('rating_sum', sa.Integer)
+)
+
+chart_settings = sa.Table(
+    'chart_settings', metadata,
+    sa.Column('id', sa.Integer, primary_key=True),
+    sa.Column('prior_mean', sa.Float, nullable=False),
+    sa.Column('prior_weight', sa.Float, nullable=False),
+    sa.Column('min_reviews', sa.Integer, nullable=False),
+    sa.Column('computed_at', sa.DateTime)
+)
+
+chart_entries = sa.Table(
+    'chart_entries', metadata,
+    sa.Column('musical_work_id', sa.Integer, sa.ForeignKey('musical_works.id', ondelete='CASCADE'), primary_key=True),
+    sa.Column('genre_id', sa.Integer, sa.ForeignKey('genres.id'), nullable=False),
+    sa.Column('score', sa.Float, nullable=False),
+    sa.Column('review_count', sa.Integer, nullable=False),
+    sa.Index('ix_chart_entries_score_musical_work_id', 'score', 'musical_work_id'),
+    sa.Index('ix_chart_entries_genre_id_score_musical_work_id', 'genre_id', 'score', 'musical_work_id')
+)
+
+top_lists = sa.Table(
+    'top_lists', metadata,
+    sa.Column('id', sa.Integer, primary_key=True),
+    sa.Column('title', sa.String(200), nullable=False),
+    sa.Column('genre_id', sa.Integer, sa.ForeignKey('genres.id')),
+    sa.Column('size', sa.Integer, nullable=False),
+    sa.Column('prior_mean', sa.Float, nullable=False),
+    sa.Column('prior_weight', sa.Float, nullable=False),
+    sa.Column('created_by', sa.Integer, sa.ForeignKey('users.id', ondelete='SET NULL')),
+    sa.Column('created_at', sa.DateTime),
+    sa.Column('published_at', sa.DateTime),
+    sa.Index('ix_top_lists_genre_id_id', 'genre_id', 'id')
+)
+
+top_list_entries = sa.Table(
+    'top_list_entries', metadata,
+    sa.Column('top_list_id', sa.Integer, sa.ForeignKey('top_lists.id', ondelete='CASCADE'), primary_key=True),
+    sa.Column('position', sa.Integer, primary_key=True),
+    sa.Column('musical_work_id', sa.Integer, sa.ForeignKey('musical_works.id', ondelete='SET NULL'), index=True),
+    sa.Column('title', sa.String(200), nullable=False),
+    sa.Column('score', sa.Float, nullable=False),
+    sa.Column('review_count', sa.Integer, nullable=False)
+)
+
+
+def upgrade(connection):
+    metadata.create_all(
+        connection, tables=[chart_settings, chart_entries, top_lists, top_list_entries], checkfirst=True
+    )
+    if connection.scalar(sa.select(sa.func.count()).select_from(chart_settings)):
+        return
+
+    review_count, rating_sum = connection.execute(sa.select(
+        sa.func.coalesce(sa.func.sum(musical_works.c.review_count), 0),
+        sa.func.coalesce(sa.func.sum(musical_works.c.rating_sum), 0)
+    )).one()
+    prior_mean = rating_sum / review_count if review_count else DEFAULT_PRIOR_MEAN
+    connection.execute(chart_settings.insert().values(
+        id=1, prior_mean=prior_mean, prior_weight=PRIOR_WEIGHT, min_reviews=MIN_REVIEWS,
+        computed_at=datetime.utcnow()
+    ))
+
+    score = (
+        (PRIOR_WEIGHT * prior_mean + sa.cast(musical_works.c.rating_sum, sa.Float))
+        / (PRIOR_WEIGHT + musical_works.c.review_count)
+    )
+    connection.execute(chart_entries.insert().from_select(
+        ['musical_work_id', 'genre_id', 'score', 'review_count'],
+        sa.select(musical_works.c.id, musical_works.c.genre_id, score, musical_works.c.review_count)
+        .where(musical_works.c.review_count >= MIN_REVIEWS)
+    ))
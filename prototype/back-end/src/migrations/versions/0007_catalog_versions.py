@@ -0,0 +1,16 @@
+"""Catalog version keys, which worker processes poll to expire cached responses and refresh in-memory indexes"""
+
+import sqlalchemy as sa
+
+metadata = sa.MetaData()
+
+catalog_versions = sa.Table(
+    'catalog_versions', metadata,
+    sa.Column('key', sa.String(100), primary_key=True),
+    sa.Column('version', sa.Integer, nullable=False),
+    sa.Column('changed_at', sa.DateTime, nullable=False, index=True)
+)
+
+
+def upgrade(connection):
+    metadata.create_all(connection, tables=[catalog_versions], checkfirst=True)
@@ -0,0 +1 @@
+"""Migration modules, named <version>_<name>.py"""
@@ -1,8 +1,39 @@
-from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
+import sqlite3
+
+from sqlalchemy import DDL, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.hybrid import hybrid_property
 
 # Import db from app module to avoid circular import
 from app import db
+from password_hashing import get_password_hasher
+
+
+def sql_literal(value):
+    """Constant rendered inline, so query expressions match index expressions exactly"""
+    return db.literal(value, literal_execute=True)
+
+
+# Full-text search uses the 'simple' configuration: no stemming or stop words,
+# which suits artist names and titles in many languages.
+SEARCH_CONFIG = sql_literal('simple')
+
+# Trigram indexes need the pg_trgm extension
+event.listen(
+    db.metadata, 'before_create',
+    DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql')
+)
+
+
+@event.listens_for(Engine, 'connect')
+def enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    """SQLite only enforces foreign keys when asked to; writes rely on them as on PostgreSQL"""
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA foreign_keys=ON')
+        cursor.close()
+
 
 class User(db.Model):
     """User model with role-based access"""
@@ -17,15 +48,21 @@ class User(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relationships
-    reviews = db.relationship('Review', backref='user', lazy=True, cascade='all, delete-orphan')
+    reviews = db.relationship(
+        'Review', backref='user', lazy=True, cascade='all, delete-orphan', foreign_keys='Review.user_id'
+    )
     
     def set_password(self, password):
         """Hash and set password"""
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = get_password_hasher().hash(password)
     
     def check_password(self, password):
         """Check password"""
-        return check_password_hash(self.password_hash, password)
+        return get_password_hasher().verify(self.password_hash, password)
+    
+    def password_needs_rehash(self):
+        """True when the stored hash predates the configured hash parameters"""
+        return get_password_hasher().needs_rehash(self.password_hash)
     
     def to_dict(self):
         """Convert to dictionary"""
@@ -41,6 +78,9 @@ class User(db.Model):
 class Genre(db.Model):
     """Genre model"""
     __tablename__ = 'genres'
+    __table_args__ = (
+        db.Index('ix_genres_created_at_id', 'created_at', 'id'),  # keyset pagination by created_at
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), unique=True, nullable=False, index=True)
@@ -63,6 +103,13 @@ class Genre(db.Model):
 class Artist(db.Model):
     """Artist model"""
     __tablename__ = 'artists'
+    __table_args__ = (
+        db.Index('ix_artists_created_at_id', 'created_at', 'id'),  # keyset pagination by created_at
+        db.Index(
+            'ix_artists_name_trgm', 'name',
+            postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}
+        ).ddl_if(dialect='postgresql'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(200), nullable=False, index=True)
@@ -82,22 +129,65 @@ class Artist(db.Model):
             'multimedia': self.multimedia,
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
+    
+    @classmethod
+    def search_document(cls):
+        """tsvector expression matched by the full-text search index"""
+        return db.func.to_tsvector(SEARCH_CONFIG, db.func.coalesce(cls.name, sql_literal('')))
+
+
+db.Index(
+    'ix_artists_search_document', Artist.search_document(), postgresql_using='gin'
+).ddl_if(dialect='postgresql')
 
 
 class MusicalWork(db.Model):
     """Musical work model"""
     __tablename__ = 'musical_works'
+    __table_args__ = (
+        db.Index('ix_musical_works_created_at_id', 'created_at', 'id'),  # keyset pagination by created_at
+        db.Index('ix_musical_works_review_count_id', 'review_count', 'id'),
+        db.Index(
+            'ix_musical_works_title_trgm', 'title',
+            postgresql_using='gin', postgresql_ops={'title': 'gin_trgm_ops'}
+        ).ddl_if(dialect='postgresql'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False, index=True)
     description = db.Column(db.Text)
-    genre_id = db.Column(db.Integer, db.ForeignKey('genres.id'), nullable=False)
-    artist_id = db.Column(db.Integer, db.ForeignKey('artists.id'), nullable=False)
+    genre_id = db.Column(db.Integer, db.ForeignKey('genres.id'), nullable=False, index=True)
+    artist_id = db.Column(db.Integer, db.ForeignKey('artists.id'), nullable=False, index=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    # Aggregates over approved reviews, maintained by ReviewRepository
+    review_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_sum = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_1_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_2_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_3_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_4_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_5_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    
     # Relationships
     reviews = db.relationship('Review', backref='musical_work', lazy=True, cascade='all, delete-orphan')
     
+    @hybrid_property
+    def average_rating(self):
+        """Mean approved rating, 0 when there are no approved reviews"""
+        return self.rating_sum / self.review_count if self.review_count else 0.0
+    
+    @average_rating.expression
+    def average_rating(cls):
+        return db.case(
+            (cls.review_count > 0, db.cast(cls.rating_sum, db.Float) / cls.review_count),
+            else_=0.0
+        )
+    
+    def rating_histogram(self):
+        """Number of approved reviews per rating, keyed '1' to '5'"""
+        return {str(rating): getattr(self, f'rating_{rating}_count') or 0 for rating in range(1, 6)}
+    
     def to_dict(self, include_artist=False, include_genre=False, include_reviews=False, approved_reviews_only=False):
         """Convert to dictionary"""
         data = {
@@ -106,7 +196,10 @@ class MusicalWork(db.Model):
             'description': self.description,
             'genre_id': self.genre_id,
             'artist_id': self.artist_id,
-            'created_at': self.created_at.isoformat() if self.created_at else None
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'review_count': self.review_count or 0,
+            'average_rating': round(self.average_rating, 2) if self.review_count else None,
+            'rating_histogram': self.rating_histogram()
         }
         
         if include_artist and self.artist:
@@ -122,11 +215,36 @@ class MusicalWork(db.Model):
             data['reviews'] = [review.to_dict() for review in reviews]
         
         return data
+    
+    @classmethod
+    def search_document(cls):
+        """tsvector expression matched by the full-text search index (title ranks above description)"""
+        return db.func.setweight(
+            db.func.to_tsvector(SEARCH_CONFIG, db.func.coalesce(cls.title, sql_literal(''))), sql_literal('A')
+        ).op('||')(db.func.setweight(
+            db.func.to_tsvector(SEARCH_CONFIG, db.func.coalesce(cls.description, sql_literal(''))), sql_literal('B')
+        ))
+
+
+db.Index('ix_musical_works_average_rating_id', MusicalWork.average_rating, MusicalWork.id)
+
+db.Index(
+    'ix_musical_works_search_document', MusicalWork.search_document(), postgresql_using='gin'
+).ddl_if(dialect='postgresql')
 
 
 class Review(db.Model):
     """Review model for musical works"""
     __tablename__ = 'reviews'
+    __table_args__ = (
+        # One review per user and work; also serves user_id lookups and is the ON CONFLICT target
+        db.Index('ux_reviews_user_id_musical_work_id', 'user_id', 'musical_work_id', unique=True),
+        # A work's approved reviews in keyset order by date or by rating; also serve musical_work_id lookups
+        db.Index(
+            'ix_reviews_musical_work_id_is_approved_created_at_id', 'musical_work_id', 'is_approved', 'created_at', 'id'
+        ),
+        db.Index('ix_reviews_musical_work_id_is_approved_rating_id', 'musical_work_id', 'is_approved', 'rating', 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -137,6 +255,10 @@ class Review(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    # Moderation lease: the moderator who claimed this pending review, and until when
+    claimed_by = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='SET NULL'))
+    claimed_until = db.Column(db.DateTime)
+    
     def to_dict(self, include_user=False):
         """Convert to dictionary"""
         data = {
@@ -155,3 +277,108 @@ class Review(db.Model):
         
         return data
 
+
+# Moderation queue: pending reviews oldest first. Covers only the backlog, so
+# it stays small however many reviews have been approved.
+db.Index(
+    'ix_reviews_pending_created_at_id', Review.created_at, Review.id,
+    postgresql_where=Review.is_approved == False,  # noqa: E712
+    sqlite_where=Review.is_approved == False  # noqa: E712
+)
+
+
+class ChartSettings(db.Model):
+    """Scoring parameters of the live charts, a single row written by `flask refresh-charts`
+    
+    A work's chart score is its Bayesian average rating: the approved ratings
+    plus `prior_weight` ratings of `prior_mean` (the catalog-wide mean), so
+    works with few reviews rank near the mean rather than at the extremes.
+    """
+    __tablename__ = 'chart_settings'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    prior_mean = db.Column(db.Float, nullable=False)
+    prior_weight = db.Column(db.Float, nullable=False)
+    min_reviews = db.Column(db.Integer, nullable=False)  # Approved reviews a work needs to be charted
+    computed_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class ChartEntry(db.Model):
+    """A charted work's score; the overall and per-genre charts are index range scans over these rows"""
+    __tablename__ = 'chart_entries'
+    __table_args__ = (
+        db.Index('ix_chart_entries_score_musical_work_id', 'score', 'musical_work_id'),
+        db.Index('ix_chart_entries_genre_id_score_musical_work_id', 'genre_id', 'score', 'musical_work_id'),
+    )
+    
+    musical_work_id = db.Column(
+        db.Integer, db.ForeignKey('musical_works.id', ondelete='CASCADE'), primary_key=True
+    )
+    genre_id = db.Column(db.Integer, db.ForeignKey('genres.id'), nullable=False)  # Copied from the work
+    score = db.Column(db.Float, nullable=False)
+    review_count = db.Column(db.Integer, nullable=False)
+    
+    musical_work = db.relationship('MusicalWork')
+
+
+class TopList(db.Model):
+    """A snapshot of a chart taken by a producer, private until published"""
+    __tablename__ = 'top_lists'
+    __table_args__ = (
+        db.Index('ix_top_lists_genre_id_id', 'genre_id', 'id'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    title = db.Column(db.String(200), nullable=False)
+    genre_id = db.Column(db.Integer, db.ForeignKey('genres.id'))  # None for the overall chart
+    size = db.Column(db.Integer, nullable=False)  # Entries captured
+    prior_mean = db.Column(db.Float, nullable=False)
+    prior_weight = db.Column(db.Float, nullable=False)
+    created_by = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='SET NULL'))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    published_at = db.Column(db.DateTime)
+    
+    entries = db.relationship(
+        'TopListEntry', backref='top_list', lazy=True, cascade='all, delete-orphan',
+        order_by='TopListEntry.position'
+    )
+    
+    def to_dict(self):
+        """Convert to dictionary"""
+        return {
+            'id': self.id,
+            'title': self.title,
+            'genre_id': self.genre_id,
+            'size': self.size,
+            'prior_mean': round(self.prior_mean, 4),
+            'prior_weight': self.prior_weight,
+            'created_by': self.created_by,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'published_at': self.published_at.isoformat() if self.published_at else None
+        }
+
+
+class TopListEntry(db.Model):
+    """A work's position, title, score and review count as captured in a top list
+
+    Deleting the work keeps the entry, with its title, and clears musical_work_id.
+    """
+    __tablename__ = 'top_list_entries'
+    
+    top_list_id = db.Column(db.Integer, db.ForeignKey('top_lists.id', ondelete='CASCADE'), primary_key=True)
+    position = db.Column(db.Integer, primary_key=True)
+    musical_work_id = db.Column(db.Integer, db.ForeignKey('musical_works.id', ondelete='SET NULL'), index=True)
+    title = db.Column(db.String(200), nullable=False)
+    score = db.Column(db.Float, nullable=False)
+    review_count = db.Column(db.Integer, nullable=False)
+    
+    musical_work = db.relationship('MusicalWork')
+
+
+class CatalogVersion(db.Model):
+    """How often a response cache version key, such as 'works' or 'artist:5', was invalidated, and when last"""
+    __tablename__ = 'catalog_versions'
+    
+    key = db.Column(db.String(100), primary_key=True)
+    version = db.Column(db.Integer, nullable=False)
+    changed_at = db.Column(db.DateTime, nullable=False, index=True)
@@ -0,0 +1,63 @@
+"""Password hashing limited to a bounded number of concurrent hashes"""
+
+import threading
+
+from flask import current_app, jsonify
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+class HasherBusy(RuntimeError):
+    """Raised when no hasher frees up within the queue timeout"""
+
+
+class PasswordHasher:
+    """Hashes and verifies passwords in at most `workers` request threads at once.
+
+    Password hashes are deliberately expensive, so a burst of logins would
+    otherwise occupy every request worker and starve catalog traffic. Callers
+    wait up to `queue_timeout` seconds for a free hasher and then get
+    HasherBusy, which turns a login storm into quick 503s instead of a queue.
+    """
+
+    def __init__(self, method, salt_length, workers, queue_timeout):
+        self.method = method
+        self.salt_length = salt_length
+        self.queue_timeout = queue_timeout
+        self._slots = threading.BoundedSemaphore(workers)
+
+    def _run(self, function, *args):
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            raise HasherBusy()
+        try:
+            return function(*args)
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method, self.salt_length)
+
+    def verify(self, password_hash, password):
+        return self._run(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """True when the hash was made with other parameters than the configured method"""
+        return password_hash.split('$', 1)[0] != self.method
+
+
+def get_password_hasher():
+    return current_app.extensions['password_hasher']
+
+
+def init_password_hasher(app):
+    app.extensions['password_hasher'] = PasswordHasher(
+        app.config['PASSWORD_HASH_METHOD'],
+        app.config['PASSWORD_HASH_SALT_LENGTH'],
+        app.config['PASSWORD_HASH_WORKERS'],
+        app.config['PASSWORD_HASH_QUEUE_TIMEOUT']
+    )
+
+    @app.errorhandler(HasherBusy)
+    def hasher_busy(error):
+        response = jsonify({'error': 'Too many sign-ins in progress, please retry shortly'})
+        response.headers['Retry-After'] = '1'
+        return response, 503
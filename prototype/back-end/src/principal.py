@@ -0,0 +1,120 @@
+"""Authorization principal resolved from JWT claims, with a short-lived cache"""
+
+import threading
+import time
+
+from flask import current_app
+from flask_jwt_extended import create_access_token, get_jwt
+
+
+class Principal:
+    """The authenticated user's id, role and active flag"""
+
+    def __init__(self, id, role, is_active):
+        self.id = id
+        self.role = role
+        self.is_active = is_active
+
+    @classmethod
+    def from_user(cls, user):
+        return cls(user.id, user.role, bool(user.is_active))
+
+
+class PrincipalCache:
+    """Per-process TTL cache of principals loaded from the database"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._invalidated_at = {}
+
+    def get(self, user_id):
+        """Return (found, principal) for a live entry"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry and entry[1] > time.time():
+                return True, entry[0]
+            return False, None
+
+    def put(self, user_id, principal, ttl, max_size):
+        with self._lock:
+            now = time.time()
+            if len(self._entries) >= max_size:
+                self._entries = {key: entry for key, entry in self._entries.items() if entry[1] > now}
+                if len(self._entries) >= max_size:
+                    self._entries.clear()
+            self._entries[user_id] = (principal, now + ttl)
+
+    def invalidate(self, user_id, claims_max_age):
+        """Drop the user's entry and stop trusting claims issued before now.
+
+        Marks older than `claims_max_age` are pruned: claims that old are no
+        longer trusted anyway.
+        """
+        with self._lock:
+            now = time.time()
+            self._entries.pop(user_id, None)
+            self._invalidated_at = {
+                key: at for key, at in self._invalidated_at.items() if at > now - claims_max_age
+            }
+            self._invalidated_at[user_id] = now
+
+    def invalidated_since(self, user_id, issued_at):
+        with self._lock:
+            return self._invalidated_at.get(user_id, 0) >= issued_at
+
+
+principal_cache = PrincipalCache()
+
+
+def create_user_token(user):
+    """Issue an access token carrying the user's role and active flag as claims"""
+    return create_access_token(
+        identity=str(user.id),
+        additional_claims={'role': user.role, 'active': bool(user.is_active)}
+    )
+
+
+def claims_max_age(config):
+    """Seconds a token's claims are trusted, capped at PRINCIPAL_CACHE_TTL"""
+    return min(config['PRINCIPAL_CLAIMS_MAX_AGE'], config['PRINCIPAL_CACHE_TTL'])
+
+
+def current_principal():
+    """Resolve the principal for the current request's JWT.
+
+    Recently issued tokens are trusted as-is: their signed role and active
+    claims are used without a database query. Tokens older than
+    PRINCIPAL_CLAIMS_MAX_AGE, tokens without these claims, and tokens issued
+    before an admin changed the user in this process are checked against the
+    database. The result is cached for PRINCIPAL_CACHE_TTL seconds. Returns
+    None when the user no longer exists.
+
+    Other processes do not see an admin's change until the claims or their
+    cached entry expire, so claims are never trusted for longer than
+    PRINCIPAL_CACHE_TTL: either way a change reaches every worker within it.
+    """
+    claims = get_jwt()
+    user_id = int(claims['sub'])
+
+    found, principal = principal_cache.get(user_id)
+    if found:
+        return principal
+
+    config = current_app.config
+    issued_at = claims.get('iat', 0)
+    if ('role' in claims and 'active' in claims
+            and issued_at >= time.time() - claims_max_age(config)
+            and not principal_cache.invalidated_since(user_id, issued_at)):
+        return Principal(user_id, claims['role'], claims['active'])
+
+    from repositories.user_repository import UserRepository
+    user = UserRepository.find_by_id(user_id)
+    principal = Principal.from_user(user) if user else None
+    principal_cache.put(user_id, principal, config['PRINCIPAL_CACHE_TTL'], config['PRINCIPAL_CACHE_SIZE'])
+    return principal
+
+
+def invalidate_principal(user_id):
+    """Call after changing a user's role or active flag"""
+    principal_cache.invalidate(user_id, claims_max_age(current_app.config))
@@ -0,0 +1,64 @@
+"""Per-request SQL query counting with optional budget enforcement"""
+
+import logging
+from contextlib import contextmanager
+from flask import g, has_app_context, request, current_app
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised in enforcing mode when a request runs more queries than its budget"""
+
+
+def query_budget(max_queries):
+    """Declare the maximum number of SQL queries a view may run per request"""
+    def decorator(view):
+        view.query_budget = max_queries
+        return view
+    return decorator
+
+
+@contextmanager
+def unbudgeted():
+    """Leave queries run inside the block, such as a one-off cache warm-up, out of the request's count"""
+    count = g.get('query_count') if has_app_context() else None
+    try:
+        yield
+    finally:
+        if count is not None:
+            g.query_count = count
+
+
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    if has_app_context() and 'query_count' in g:
+        g.query_count += 1
+
+
+def init_query_budget(app):
+    """Count queries per request and check them against each view's budget.
+
+    With QUERY_BUDGET_ENFORCE set (as in the testing config) a request over
+    budget raises QueryBudgetExceeded, so a reintroduced lazy load fails loudly;
+    otherwise it is logged as a warning.
+    """
+    if not event.contains(Engine, 'before_cursor_execute', _count_query):
+        event.listen(Engine, 'before_cursor_execute', _count_query)
+
+    @app.before_request
+    def start_query_count():
+        g.query_count = 0
+
+    @app.after_request
+    def check_query_budget(response):
+        view = current_app.view_functions.get(request.endpoint)
+        budget = getattr(view, 'query_budget', None)
+        count = g.get('query_count', 0)
+        if budget is not None and count > budget:
+            message = f'{request.endpoint} ran {count} queries (budget {budget})'
+            if current_app.config.get('QUERY_BUDGET_ENFORCE'):
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
@@ -1,8 +1,17 @@
 from models import db, Artist
+from repositories.pagination import keyset_paginate, keyset_columns
+from repositories.loading import with_plan
+from repositories.search_backend import ranked_search
 
 class ArtistRepository:
     """Repository for artist operations"""
     
+    SORT_COLUMNS = {
+        'id': Artist.id,
+        'name': Artist.name,
+        'created_at': Artist.created_at
+    }
+    
     @staticmethod
     def create(name, biography=None, multimedia=None):
         """Create a new artist"""
@@ -12,19 +21,79 @@ class ArtistRepository:
         return artist
     
     @staticmethod
-    def find_all():
+    def bulk_create(rows):
+        """Insert artist dicts with multi-row INSERTs and return their ids in order, without committing"""
+        return db.session.execute(
+            db.insert(Artist.__table__).returning(Artist.id, sort_by_parameter_order=True), rows
+        ).scalars().all()
+    
+    @staticmethod
+    def find_existing_ids(ids):
+        """Return the subset of `ids` that belong to an artist"""
+        if not ids:
+            return set()
+        return set(db.session.scalars(db.select(Artist.id).where(Artist.id.in_(ids))))
+    
+    @staticmethod
+    def find_by_ids(ids):
+        """Get the artists with the given IDs"""
+        return Artist.query.filter(Artist.id.in_(ids)).all() if ids else []
+    
+    @staticmethod
+    def find_all(load=()):
         """Get all artists"""
-        return Artist.query.all()
+        return with_plan(Artist.query, Artist, load).all()
     
     @staticmethod
-    def find_by_id(artist_id):
+    def iter_all(batch_size=1000):
+        """Iterate over all artists, fetching `batch_size` rows at a time"""
+        return Artist.query.order_by(Artist.id).yield_per(batch_size)
+    
+    @staticmethod
+    def find_page(limit=None, after=None, sort='id', load=()):
+        """Get a page of artists using keyset pagination"""
+        return keyset_paginate(
+            with_plan(Artist.query, Artist, load), ArtistRepository.SORT_COLUMNS, Artist.id,
+            sort=sort, limit=limit, after=after
+        )
+    
+    @staticmethod
+    def find_page_rows(shape, limit=None, after=None, sort='id'):
+        """Get a page of artist rows projected to `shape`, using keyset pagination"""
+        return keyset_paginate(
+            shape.query(keyset_columns(ArtistRepository.SORT_COLUMNS, sort)), ArtistRepository.SORT_COLUMNS, Artist.id,
+            sort=sort, limit=limit, after=after
+        )
+    
+    @staticmethod
+    def find_by_id(artist_id, load=()):
         """Find artist by ID"""
-        return Artist.query.get(artist_id)
+        return with_plan(Artist.query, Artist, load).get(artist_id)
+    
+    @staticmethod
+    def find_row_by_id(shape, artist_id):
+        """Find a artist row projected to `shape` by ID"""
+        return shape.query().filter(Artist.id == artist_id).first()
+    
+    @staticmethod
+    def find_rows_by_ids(shape, ids):
+        """Find the artists among `ids` in one query, as rows projected to `shape` carrying `id`"""
+        return shape.query({'id': Artist.id}).filter(Artist.id.in_(ids)).all()
+    
+    @staticmethod
+    def search_by_name(name_query, limit=None, after=None, load=()):
+        """Search artists by name, returning a page ranked by relevance"""
+        return ranked_search(
+            with_plan(Artist.query, Artist, load), Artist.name, Artist.search_document(),
+            name_query, Artist.id, limit=limit, after=after
+        )
     
     @staticmethod
-    def search_by_name(name_query):
-        """Search artists by name"""
-        return Artist.query.filter(Artist.name.ilike(f'%{name_query}%')).all()
+    def search_rows_by_name(shape, name_query, limit=None, after=None):
+        """Search artists by name, returning a page of rows projected to `shape` ranked by relevance"""
+        return ranked_search(
+            shape.query(), Artist.name, Artist.search_document(), name_query, Artist.id, limit=limit, after=after
+        )
     
     @staticmethod
     def update(artist_id, name=None, biography=None, multimedia=None):
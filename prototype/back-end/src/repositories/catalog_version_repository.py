@@ -0,0 +1,42 @@
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models import db, CatalogVersion
+
+KEY_CHUNK_SIZE = 1000  # keys per INSERT ... ON CONFLICT
+
+
+def _insert(connection, model):
+    """INSERT supporting ON CONFLICT for the connection's database"""
+    return (postgresql.insert if connection.dialect.name == 'postgresql' else sqlite.insert)(model)
+
+
+class CatalogVersionRepository:
+    """Repository for the version keys worker processes poll for catalog changes"""
+    
+    @staticmethod
+    def bump(keys, changed_at):
+        """Increment the versions of `keys`, creating missing ones, in a transaction of their own.
+        
+        It runs on a separate primary connection, so committing it leaves the
+        caller's session, and the objects loaded in it, alone. Keys are written
+        in sorted order so concurrent bumps lock rows in the same order.
+        """
+        keys = sorted(set(keys))
+        with db.engine.begin() as connection:
+            for start in range(0, len(keys), KEY_CHUNK_SIZE):
+                statement = _insert(connection, CatalogVersion).values([
+                    {'key': key, 'version': 1, 'changed_at': changed_at}
+                    for key in keys[start:start + KEY_CHUNK_SIZE]
+                ])
+                connection.execute(statement.on_conflict_do_update(
+                    index_elements=['key'],
+                    set_={'version': CatalogVersion.version + 1, 'changed_at': statement.excluded.changed_at}
+                ))
+    
+    @staticmethod
+    def find_changed_since(since):
+        """(key, version, changed_at) rows changed after `since`"""
+        return db.session.execute(
+            db.select(CatalogVersion.key, CatalogVersion.version, CatalogVersion.changed_at)
+            .where(CatalogVersion.changed_at > since)
+        ).all()
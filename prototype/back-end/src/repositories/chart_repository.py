@@ -0,0 +1,154 @@
+from datetime import datetime
+
+from models import db, MusicalWork, ChartSettings, ChartEntry, TopList, TopListEntry
+from repositories.pagination import keyset_paginate, keyset_columns
+
+SETTINGS_ID = 1  # chart_settings holds a single row
+DEFAULT_PRIOR_MEAN = 3.0  # Used until some review is approved
+ENTRY_COLUMNS = ['musical_work_id', 'genre_id', 'score', 'review_count']
+
+
+def _scored_works():
+    """SELECT of (musical_work_id, genre_id, score, review_count) for every work the current settings chart"""
+    works, settings = MusicalWork.__table__, ChartSettings.__table__
+    score = (
+        (settings.c.prior_weight * settings.c.prior_mean + db.cast(works.c.rating_sum, db.Float))
+        / (settings.c.prior_weight + works.c.review_count)
+    )
+    return db.select(works.c.id, works.c.genre_id, score, works.c.review_count).select_from(
+        works.join(settings, settings.c.id == SETTINGS_ID)
+    ).where(works.c.review_count >= settings.c.min_reviews)
+
+
+class ChartRepository:
+    """Repository for the live charts and the top lists snapshotted from them"""
+    
+    SORT_COLUMNS = {
+        'id': TopList.id,
+        'created_at': TopList.created_at
+    }
+    
+    @staticmethod
+    def refresh_works(musical_work_ids):
+        """Rescore the given works from their stored rating aggregates, in the caller's transaction.
+    
+        Called wherever those aggregates change, so the charts follow review
+        approvals, edits and deletions without rescanning reviews. Works that
+        no longer have enough approved reviews drop out of the charts.
+        """
+        musical_work_ids = list(musical_work_ids)
+        if not musical_work_ids:
+            return
+        entries = ChartEntry.__table__
+        db.session.execute(db.delete(entries).where(entries.c.musical_work_id.in_(musical_work_ids)))
+        db.session.execute(db.insert(entries).from_select(
+            ENTRY_COLUMNS, _scored_works().where(MusicalWork.__table__.c.id.in_(musical_work_ids))
+        ))
+    
+    @staticmethod
+    def rebuild(prior_weight, min_reviews):
+        """Re-estimate the prior mean from all approved ratings and rescore every work.
+    
+        The prior drifts as reviews accumulate, which incremental refreshes do
+        not account for; run this periodically (`flask refresh-charts`).
+        Returns the settings written and the number of works charted.
+        """
+        review_count, rating_sum = db.session.execute(db.select(
+            db.func.coalesce(db.func.sum(MusicalWork.review_count), 0),
+            db.func.coalesce(db.func.sum(MusicalWork.rating_sum), 0)
+        )).one()
+        settings = db.session.merge(ChartSettings(
+            id=SETTINGS_ID,
+            prior_mean=rating_sum / review_count if review_count else DEFAULT_PRIOR_MEAN,
+            prior_weight=prior_weight,
+            min_reviews=min_reviews,
+            computed_at=datetime.utcnow()
+        ))
+        db.session.flush()
+        db.session.execute(db.delete(ChartEntry.__table__))
+        result = db.session.execute(db.insert(ChartEntry.__table__).from_select(ENTRY_COLUMNS, _scored_works()))
+        db.session.commit()
+        return settings, result.rowcount
+    
+    @staticmethod
+    def find_settings():
+        """The current chart settings, or None before the first rebuild"""
+        return db.session.get(ChartSettings, SETTINGS_ID)
+    
+    @staticmethod
+    def find_chart_rows(shape, genre_id=None, limit=10):
+        """The top `limit` chart rows projected to `shape`, overall or for one genre, best score first"""
+        query = shape.query()
+        if genre_id is not None:
+            query = query.filter(ChartEntry.genre_id == genre_id)
+        return query.order_by(ChartEntry.score.desc(), ChartEntry.musical_work_id.desc()).limit(limit).all()
+    
+    @staticmethod
+    def create_top_list(title, size, genre_id=None, created_by=None, publish=False):
+        """Snapshot the top `size` works of the live chart into a new top list.
+    
+        The entries are copied by one INSERT ... SELECT, so the list is
+        consistent with a single state of the chart. Each entry keeps the
+        work's title, which outlives the work.
+        """
+        settings = ChartRepository.find_settings()
+        now = datetime.utcnow()
+        top_list = TopList(
+            title=title, genre_id=genre_id, size=0, created_by=created_by, created_at=now,
+            prior_mean=settings.prior_mean if settings else DEFAULT_PRIOR_MEAN,
+            prior_weight=settings.prior_weight if settings else 0.0,
+            published_at=now if publish else None
+        )
+        db.session.add(top_list)
+        db.session.flush()
+    
+        position = db.func.row_number().over(
+            order_by=(ChartEntry.score.desc(), ChartEntry.musical_work_id.desc())
+        )
+        ranked = db.select(
+            position.label('position'), ChartEntry.musical_work_id, MusicalWork.title,
+            ChartEntry.score, ChartEntry.review_count
+        ).join(MusicalWork, MusicalWork.id == ChartEntry.musical_work_id)
+        if genre_id is not None:
+            ranked = ranked.where(ChartEntry.genre_id == genre_id)
+        ranked = ranked.order_by(ChartEntry.score.desc(), ChartEntry.musical_work_id.desc()).limit(size).subquery()
+        result = db.session.execute(db.insert(TopListEntry.__table__).from_select(
+            ['top_list_id', 'position', 'musical_work_id', 'title', 'score', 'review_count'],
+            db.select(db.literal(top_list.id), *ranked.c)
+        ))
+        top_list.size = result.rowcount
+        db.session.commit()
+        return top_list
+    
+    @staticmethod
+    def publish(top_list_id):
+        """Publish a top list; publishing again keeps the first publication time"""
+        top_list = db.session.get(TopList, top_list_id)
+        if not top_list:
+            return None
+        if top_list.published_at is None:
+            top_list.published_at = datetime.utcnow()
+        db.session.commit()
+        return top_list
+    
+    @staticmethod
+    def find_top_list_row(shape, top_list_id):
+        """Find a top list row projected to `shape` by ID"""
+        return shape.query({'published_at': TopList.published_at}).filter(TopList.id == top_list_id).first()
+    
+    @staticmethod
+    def find_top_list_entry_rows(shape, top_list_id):
+        """A top list's entry rows projected to `shape`, in position order"""
+        return shape.query().filter(
+            TopListEntry.top_list_id == top_list_id
+        ).order_by(TopListEntry.position).all()
+    
+    @staticmethod
+    def find_top_list_page_rows(shape, published=True, genre_id=None, limit=None, after=None, sort='-id'):
+        """Get a page of published (or unpublished) top list rows projected to `shape`, newest first by default"""
+        query = shape.query(keyset_columns(ChartRepository.SORT_COLUMNS, sort)).filter(
+            TopList.published_at.isnot(None) if published else TopList.published_at.is_(None)
+        )
+        if genre_id is not None:
+            query = query.filter(TopList.genre_id == genre_id)
+        return keyset_paginate(query, ChartRepository.SORT_COLUMNS, TopList.id, sort=sort, limit=limit, after=after)
@@ -1,8 +1,21 @@
-from models import db, Genre
+from models import db, Genre, MusicalWork, TopList
+from repositories.pagination import keyset_paginate, keyset_columns
+from repositories.loading import with_plan
+
+
+class GenreInUse(ValueError):
+    """Raised when deleting a genre that musical works or top lists still refer to"""
+
 
 class GenreRepository:
     """Repository for genre operations"""
     
+    SORT_COLUMNS = {
+        'id': Genre.id,
+        'name': Genre.name,
+        'created_at': Genre.created_at
+    }
+    
     @staticmethod
     def create(name, description=None):
         """Create a new genre"""
@@ -12,14 +25,71 @@ class GenreRepository:
         return genre
     
     @staticmethod
-    def find_all():
+    def bulk_create(rows):
+        """Insert genre dicts with multi-row INSERTs and return their ids in order, without committing"""
+        return db.session.execute(
+            db.insert(Genre.__table__).returning(Genre.id, sort_by_parameter_order=True), rows
+        ).scalars().all()
+    
+    @staticmethod
+    def find_existing_names(names):
+        """Return the subset of `names` already used by a genre"""
+        if not names:
+            return set()
+        return set(db.session.scalars(db.select(Genre.name).where(Genre.name.in_(names))))
+    
+    @staticmethod
+    def find_existing_ids(ids):
+        """Return the subset of `ids` that belong to a genre"""
+        if not ids:
+            return set()
+        return set(db.session.scalars(db.select(Genre.id).where(Genre.id.in_(ids))))
+    
+    @staticmethod
+    def find_by_ids(ids):
+        """Get the genres with the given IDs"""
+        return Genre.query.filter(Genre.id.in_(ids)).all() if ids else []
+    
+    @staticmethod
+    def find_all(load=()):
         """Get all genres"""
-        return Genre.query.all()
+        return with_plan(Genre.query, Genre, load).all()
+    
+    @staticmethod
+    def iter_all(batch_size=1000):
+        """Iterate over all genres, fetching `batch_size` rows at a time"""
+        return Genre.query.order_by(Genre.id).yield_per(batch_size)
     
     @staticmethod
-    def find_by_id(genre_id):
+    def find_page(limit=None, after=None, sort='id', load=()):
+        """Get a page of genres using keyset pagination"""
+        return keyset_paginate(
+            with_plan(Genre.query, Genre, load), GenreRepository.SORT_COLUMNS, Genre.id,
+            sort=sort, limit=limit, after=after
+        )
+    
+    @staticmethod
+    def find_page_rows(shape, limit=None, after=None, sort='id'):
+        """Get a page of genre rows projected to `shape`, using keyset pagination"""
+        return keyset_paginate(
+            shape.query(keyset_columns(GenreRepository.SORT_COLUMNS, sort)), GenreRepository.SORT_COLUMNS, Genre.id,
+            sort=sort, limit=limit, after=after
+        )
+    
+    @staticmethod
+    def find_by_id(genre_id, load=()):
         """Find genre by ID"""
-        return Genre.query.get(genre_id)
+        return with_plan(Genre.query, Genre, load).get(genre_id)
+    
+    @staticmethod
+    def find_row_by_id(shape, genre_id):
+        """Find a genre row projected to `shape` by ID"""
+        return shape.query().filter(Genre.id == genre_id).first()
+    
+    @staticmethod
+    def find_rows_by_ids(shape, ids):
+        """Find the genres among `ids` in one query, as rows projected to `shape` carrying `id`"""
+        return shape.query({'id': Genre.id}).filter(Genre.id.in_(ids)).all()
     
     @staticmethod
     def find_by_name(name):
@@ -43,9 +113,12 @@ class GenreRepository:
     
     @staticmethod
     def delete(genre_id):
-        """Delete genre"""
+        """Delete genre. Raises GenreInUse while works or top lists refer to it."""
         genre = Genre.query.get(genre_id)
         if genre:
+            for model in (MusicalWork, TopList):
+                if db.session.query(db.select(model.id).where(model.genre_id == genre_id).exists()).scalar():
+                    raise GenreInUse()
             db.session.delete(genre)
             db.session.commit()
             return True
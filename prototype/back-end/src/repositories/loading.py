@@ -0,0 +1,46 @@
+from sqlalchemy.orm import joinedload, selectinload
+from models import db
+
+# Loading plans name the relationships a serializer will touch, so finders can
+# load them up front instead of lazily once per row. Dotted paths load nested
+# relationships, e.g. 'reviews.user'.
+
+# MusicalWork.to_dict(include_artist=True, include_genre=True)
+WORK_WITH_ARTIST_AND_GENRE = ('artist', 'genre')
+
+# MusicalWork.to_dict(include_artist=True, include_genre=True, include_reviews=True)
+WORK_DETAILS = ('artist', 'genre', 'reviews')
+
+# Review.to_dict(include_user=True)
+REVIEW_WITH_USER = ('user',)
+
+
+def _strategy(relationship):
+    """Joined loading for many-to-one, selectin loading for collections"""
+    return selectinload if relationship.uselist else joinedload
+
+
+def loading_options(model, plan=()):
+    """Translate a loading plan into ORM loader options for `model`"""
+    options = []
+    for path in plan or ():
+        option = None
+        current = model
+        for name in path.split('.'):
+            relationship = db.inspect(current).relationships.get(name)
+            if relationship is None:
+                raise ValueError(f'{current.__name__} has no relationship {name!r}')
+            attribute = getattr(current, name)
+            if option is None:
+                option = _strategy(relationship)(attribute)
+            else:
+                option = getattr(option, _strategy(relationship).__name__)(attribute)
+            current = relationship.mapper.class_
+        options.append(option)
+    return options
+
+
+def with_plan(query, model, plan=()):
+    """Apply a loading plan to a query"""
+    options = loading_options(model, plan)
+    return query.options(*options) if options else query
@@ -1,8 +1,20 @@
 from models import db, MusicalWork, Artist
+from repositories.chart_repository import ChartRepository
+from repositories.pagination import keyset_paginate, keyset_columns
+from repositories.loading import with_plan
+from repositories.search_backend import ranked_search, contains
 
 class MusicalWorkRepository:
     """Repository for musical work operations"""
     
+    SORT_COLUMNS = {
+        'id': MusicalWork.id,
+        'title': MusicalWork.title,
+        'created_at': MusicalWork.created_at,
+        'review_count': MusicalWork.review_count,
+        'average_rating': MusicalWork.average_rating
+    }
+    
     @staticmethod
     def create(title, genre_id, artist_id, description=None):
         """Create a new musical work"""
@@ -17,36 +29,113 @@ class MusicalWorkRepository:
         return musical_work
     
     @staticmethod
-    def find_all():
+    def bulk_create(rows):
+        """Insert musical work dicts with multi-row INSERTs and return their ids in order, without committing"""
+        return db.session.execute(
+            db.insert(MusicalWork.__table__).returning(MusicalWork.id, sort_by_parameter_order=True), rows
+        ).scalars().all()
+    
+    @staticmethod
+    def find_by_ids(ids):
+        """Get the musical works with the given IDs"""
+        return MusicalWork.query.filter(MusicalWork.id.in_(ids)).all() if ids else []
+    
+    @staticmethod
+    def find_all(load=()):
         """Get all musical works"""
-        return MusicalWork.query.all()
+        return with_plan(MusicalWork.query, MusicalWork, load).all()
     
     @staticmethod
-    def find_by_id(musical_work_id):
+    def iter_all(batch_size=1000, genre_id=None, artist_id=None, created_since=None, load=()):
+        """Iterate over musical works in id order, fetching `batch_size` rows at a time
+        
+        Rows are streamed from a server-side cursor where the driver supports one,
+        so memory use does not grow with the number of works.
+        """
+        query = with_plan(MusicalWork.query, MusicalWork, load)
+        if genre_id is not None:
+            query = query.filter(MusicalWork.genre_id == genre_id)
+        if artist_id is not None:
+            query = query.filter(MusicalWork.artist_id == artist_id)
+        if created_since is not None:
+            query = query.filter(MusicalWork.created_at >= created_since)
+        return query.order_by(MusicalWork.id).yield_per(batch_size)
+    
+    @staticmethod
+    def iter_rows(shape, batch_size=1000, genre_id=None, artist_id=None, created_since=None):
+        """Iterate over musical work rows projected to `shape` in id order, like `iter_all`"""
+        query = shape.query()
+        if genre_id is not None:
+            query = query.filter(MusicalWork.genre_id == genre_id)
+        if artist_id is not None:
+            query = query.filter(MusicalWork.artist_id == artist_id)
+        if created_since is not None:
+            query = query.filter(MusicalWork.created_at >= created_since)
+        return query.order_by(MusicalWork.id).yield_per(batch_size)
+    
+    @staticmethod
+    def find_page(limit=None, after=None, sort='id', load=()):
+        """Get a page of musical works using keyset pagination"""
+        return keyset_paginate(
+            with_plan(MusicalWork.query, MusicalWork, load), MusicalWorkRepository.SORT_COLUMNS, MusicalWork.id,
+            sort=sort, limit=limit, after=after
+        )
+    
+    @staticmethod
+    def find_page_rows(shape, limit=None, after=None, sort='id'):
+        """Get a page of musical work rows projected to `shape`, using keyset pagination"""
+        return keyset_paginate(
+            shape.query(keyset_columns(MusicalWorkRepository.SORT_COLUMNS, sort)), MusicalWorkRepository.SORT_COLUMNS, MusicalWork.id,
+            sort=sort, limit=limit, after=after
+        )
+    
+    @staticmethod
+    def find_by_id(musical_work_id, load=()):
         """Find musical work by ID"""
-        return MusicalWork.query.get(musical_work_id)
+        return with_plan(MusicalWork.query, MusicalWork, load).get(musical_work_id)
+    
+    @staticmethod
+    def find_row_by_id(shape, musical_work_id):
+        """Find a musical work row projected to `shape` by ID"""
+        return shape.query().filter(MusicalWork.id == musical_work_id).first()
     
     @staticmethod
-    def search_by_title(title_query):
-        """Search musical works by title"""
-        return MusicalWork.query.filter(MusicalWork.title.ilike(f'%{title_query}%')).all()
+    def find_rows_by_ids(shape, ids):
+        """Find the musical works among `ids` in one query, as rows projected to `shape` carrying `id`"""
+        return shape.query({'id': MusicalWork.id}).filter(MusicalWork.id.in_(ids)).all()
     
     @staticmethod
-    def search_by_artist(artist_name):
+    def search_by_title(title_query, limit=None, after=None, load=()):
+        """Search musical works by title and description, returning a page ranked by relevance"""
+        return ranked_search(
+            with_plan(MusicalWork.query, MusicalWork, load), MusicalWork.title, MusicalWork.search_document(),
+            title_query, MusicalWork.id, limit=limit, after=after
+        )
+    
+    @staticmethod
+    def search_rows_by_title(shape, title_query, limit=None, after=None):
+        """Search musical works by title and description, returning a page of rows projected to `shape`"""
+        return ranked_search(
+            shape.query(), MusicalWork.title, MusicalWork.search_document(),
+            title_query, MusicalWork.id, limit=limit, after=after
+        )
+    
+    @staticmethod
+    def search_by_artist(artist_name, load=()):
         """Search musical works by artist name"""
-        return MusicalWork.query.join(MusicalWork.artist).filter(
-            db.func.lower(Artist.name).contains(artist_name.lower())
+        return with_plan(MusicalWork.query, MusicalWork, load).join(MusicalWork.artist).filter(
+            contains(Artist.name, artist_name)
         ).all()
     
     @staticmethod
-    def find_by_genre(genre_id):
+    def find_by_genre(genre_id, load=()):
         """Find musical works by genre"""
-        return MusicalWork.query.filter_by(genre_id=genre_id).all()
+        return with_plan(MusicalWork.query, MusicalWork, load).filter_by(genre_id=genre_id).all()
     
     @staticmethod
-    def find_by_artist(artist_id):
+    def find_by_artist(artist_id, load=()):
         """Find musical works by artist"""
-        return MusicalWork.query.filter_by(artist_id=artist_id).all()
+        return with_plan(MusicalWork.query, MusicalWork, load).filter_by(artist_id=artist_id).all()
     
     @staticmethod
     def update(musical_work_id, title=None, genre_id=None, artist_id=None, description=None):
@@ -57,8 +146,10 @@ class MusicalWorkRepository:
         
         if title is not None:
             musical_work.title = title
-        if genre_id is not None:
+        if genre_id is not None and genre_id != musical_work.genre_id:
             musical_work.genre_id = genre_id
+            db.session.flush()
+            ChartRepository.refresh_works([musical_work_id])  # moves the work to its new genre's chart
         if artist_id is not None:
             musical_work.artist_id = artist_id
         if description is not None:
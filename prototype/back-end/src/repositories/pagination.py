@@ -0,0 +1,163 @@
+import base64
+import json
+from datetime import datetime
+
+from models import db
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+MAX_OFFSET = 1000
+
+
+class PaginationError(ValueError):
+    """Raised for an invalid limit, sort order or cursor"""
+
+
+class Page:
+    """A single page of results with the cursor for the next one"""
+
+    def __init__(self, items, next_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+
+    def to_dict(self, serialize):
+        """Convert to dictionary, serializing each item with `serialize`"""
+        return {
+            'items': [serialize(item) for item in self.items],
+            'next_cursor': self.next_cursor
+        }
+
+
+def encode_cursor(sort, value, last_id):
+    """Encode the sort key of the last row on a page into an opaque cursor"""
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    payload = json.dumps([sort, value, last_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, sort):
+    """Decode a cursor produced by `encode_cursor` for the given sort order"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        cursor_sort, value, last_id = json.loads(base64.urlsafe_b64decode(padded))
+    except (ValueError, TypeError):
+        raise PaginationError('Invalid cursor')
+    if cursor_sort != sort or not isinstance(last_id, int):
+        raise PaginationError('Cursor does not match sort order')
+    return value, last_id
+
+
+def clamp_limit(limit):
+    """Apply the default and maximum page size"""
+    if limit is None:
+        return DEFAULT_PAGE_SIZE
+    if limit < 1:
+        raise PaginationError('limit must be a positive integer')
+    return min(limit, MAX_PAGE_SIZE)
+
+
+def _coerce(column, value):
+    """Convert a JSON cursor value back to the column's Python type"""
+    if value is None:
+        raise PaginationError('Invalid cursor')
+    if isinstance(column.type, db.DateTime):
+        try:
+            return datetime.fromisoformat(value)
+        except (TypeError, ValueError):
+            raise PaginationError('Invalid cursor')
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        return value
+    if python_type is float and isinstance(value, int) and not isinstance(value, bool):
+        return float(value)  # JSON writes whole floats as integers
+    if isinstance(value, bool) != (python_type is bool) or not isinstance(value, python_type):
+        raise PaginationError('Invalid cursor')  # a hand-edited cursor would fail in the database instead
+    return value
+
+
+def keyset_columns(sort_columns, sort):
+    """The columns `keyset_paginate` reads back from the last row for `sort`: the sort key and id"""
+    key = sort[1:] if sort.startswith('-') else sort
+    return {name: sort_columns[name] for name in (key, 'id') if name in sort_columns}
+
+
+def keyset_paginate(query, sort_columns, id_column, sort='id', limit=None, after=None):
+    """Return a Page of `query` ordered by `sort`, starting after the `after` cursor.
+
+    `sort_columns` maps sort names to columns; a leading '-' sorts descending.
+    Rows are ordered by (sort column, id) so the order is total, and the next
+    page is selected with a range predicate instead of OFFSET, so every page
+    costs one index range scan of `limit` rows.
+    """
+    descending = sort.startswith('-')
+    key = sort[1:] if descending else sort
+    if key not in sort_columns:
+        raise PaginationError(f'Invalid sort. Must be one of: {", ".join(sort_columns)}')
+    sort_column = sort_columns[key]
+    limit = clamp_limit(limit)
+
+    if after:
+        value, last_id = decode_cursor(after, sort)
+        if sort_column is id_column:
+            query = query.filter(id_column < last_id if descending else id_column > last_id)
+        else:
+            value = _coerce(sort_column, value)
+            if descending:
+                query = query.filter(db.or_(
+                    sort_column < value,
+                    db.and_(sort_column == value, id_column < last_id)
+                ))
+            else:
+                query = query.filter(db.or_(
+                    sort_column > value,
+                    db.and_(sort_column == value, id_column > last_id)
+                ))
+
+    if sort_column is id_column:
+        order_by = [id_column.desc() if descending else id_column]
+    elif descending:
+        order_by = [sort_column.desc(), id_column.desc()]
+    else:
+        order_by = [sort_column, id_column]
+
+    rows = query.order_by(*order_by).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(sort, getattr(last, key), last.id)
+    return Page(rows, next_cursor)
+
+
+def offset_window(limit=None, after=None, sort='relevance'):
+    """Return the (offset, limit) selected by an offset cursor, capped at MAX_OFFSET rows"""
+    limit = clamp_limit(limit)
+    offset = 0
+    if after:
+        _, offset = decode_cursor(after, sort)
+        if offset < 0 or offset >= MAX_OFFSET:
+            raise PaginationError('Invalid cursor')
+    return offset, min(limit, MAX_OFFSET - offset)
+
+
+def offset_page(rows, offset, limit, sort='relevance'):
+    """Build a Page from up to `limit + 1` rows fetched at `offset`"""
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        if offset + limit < MAX_OFFSET:
+            next_cursor = encode_cursor(sort, None, offset + limit)
+    return Page(rows, next_cursor)
+
+
+def offset_paginate(query, order_by, limit=None, after=None, sort='relevance'):
+    """Return a Page of `query` in `order_by` order, using the cursor as an offset.
+
+    Meant for relevance-ranked results, where computed scores make poor keyset
+    keys. Depth is capped at MAX_OFFSET rows so deep pages stay cheap.
+    """
+    offset, limit = offset_window(limit, after, sort)
+    rows = query.order_by(*order_by).offset(offset).limit(limit + 1).all()
+    return offset_page(rows, offset, limit, sort)
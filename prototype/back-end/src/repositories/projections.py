@@ -0,0 +1,283 @@
+from models import db, User, Genre, Artist, MusicalWork, Review, ChartEntry, TopList, TopListEntry
+
+# Projections are the column-level counterpart of loading plans: a shape names
+# the JSON keys a model serializes to and the columns each key is computed
+# from. Finders select exactly those columns, joining many-to-one
+# relationships for nested objects, and get plain rows back instead of ORM
+# instances. Each shape's serializer is generated once as Python source, so
+# turning a row into a dict costs one dict display per object. Shapes narrowed
+# with `project` select only the requested columns and join only the requested
+# relations.
+
+MAX_PROJECTIONS = 256  # Narrowed shapes compiled and kept per shape
+
+
+class ProjectionError(ValueError):
+    """Raised for an unknown field or relation in a projection"""
+
+
+def _iso(value):
+    return value.isoformat() if value is not None else None
+
+
+def _average(review_count, rating_sum):
+    return round(rating_sum / review_count, 2) if review_count else None
+
+
+class Field:
+    """A JSON key computed by `template`, a Python expression over `columns` as {0}, {1}, ..."""
+
+    __slots__ = ('key', 'columns', 'template')
+
+    def __init__(self, key, columns, template='{0}'):
+        self.key = key
+        self.columns = tuple(columns)
+        self.template = template
+
+
+def column(attribute):
+    """A column serialized under its own name, DateTimes as ISO 8601 strings"""
+    template = '_iso({0})' if isinstance(attribute.type, db.DateTime) else '{0}'
+    return Field(attribute.key, (attribute,), template)
+
+
+class Shape:
+    """The fields of one model plus nested shapes reached through many-to-one relationships.
+
+    Collections (one-to-many) are not joined; callers load them with a
+    separate query using the shape returned by `collection`.
+    """
+
+    def __init__(self, model, fields, nested=(), collections=()):
+        self.model = model
+        self.fields = tuple(fields)
+        self.nested = tuple(nested)  # (key, relationship name, Shape)
+        self.collections = tuple(collections)  # (key, relationship name, Shape)
+        self._compiled = None
+        self._projections = {}
+
+    def _compile(self):
+        # Compiled on first use: relationships declared by backref only exist once mappers are configured
+        if self._compiled is None:
+            columns, joins, related = [], [], []
+            expression = self._layout(self, '', columns, joins, related)
+            namespace = {'_iso': _iso, '_average': _average}
+            exec(f'def serialize(row):\n    return {expression}\n', namespace)
+            labels = {label.name for label in columns if '__' not in label.name}
+            self._compiled = (columns, joins, labels, namespace['serialize'], related)
+        return self._compiled
+
+    @staticmethod
+    def _layout(shape, prefix, columns, joins, related, outer=False):
+        """Append the shape's labelled columns and joins, returning its dict display over `row`
+
+        Relations through a nullable foreign key are outer joined and display
+        as None when absent, as is everything nested below them.
+        """
+        positions = {}
+        items = []
+        for field in shape.fields:
+            arguments = []
+            for attribute in field.columns:
+                if attribute.key not in positions:
+                    positions[attribute.key] = len(columns)
+                    columns.append(attribute.label(prefix + attribute.key))
+                arguments.append(f'row[{positions[attribute.key]}]')
+            items.append(f'{field.key!r}: {field.template.format(*arguments)}')
+        if prefix and 'id' not in positions:
+            # Nested entities always carry their id, for `related_ids`
+            positions['id'] = len(columns)
+            columns.append(db.inspect(shape.model).primary_key[0].label(prefix + 'id'))
+        if prefix:
+            related.append((prefix[:-2], positions['id']))
+        for key, name, nested in shape.nested:
+            relationship = db.inspect(shape.model).relationships[name]
+            optional = outer or any(column.nullable for column in relationship.local_columns)
+            joins.append((relationship.class_attribute, optional))
+            position = len(related)
+            display = Shape._layout(nested, f'{prefix}{key}__', columns, joins, related, optional)
+            if optional and not outer:
+                display = f'(None if row[{related[position][1]}] is None else {display})'
+            items.append(f'{key!r}: {display}')
+        return '{' + ', '.join(items) + '}'
+
+    @property
+    def serialize(self):
+        """Function turning a row selected by `query` into the model's to_dict output"""
+        return self._compile()[3]
+
+    def related_ids(self, row):
+        """(relation key, id) for each entity nested in a row selected by `query`"""
+        return [(key, row[position]) for key, position in self._compile()[4] if row[position] is not None]
+
+    def collection(self, key):
+        """Shape of the collection `key`, or None when this shape leaves it out"""
+        for collection_key, _, shape in self.collections:
+            if collection_key == key:
+                return shape
+        return None
+
+    def project(self, fields=None, expand=None):
+        """This shape narrowed to `fields` and to the relations named in `expand`.
+
+        `fields` names top-level keys, a relation for all of its keys, or
+        'relation.key' for some of them; None keeps every field. Without
+        `expand`, the relations kept are those `fields` names, or all of them
+        when `fields` is None too. Raises ProjectionError for unknown names.
+        """
+        if fields is None and expand is None:
+            return self
+        cache_key = (
+            None if fields is None else frozenset(fields), None if expand is None else frozenset(expand)
+        )
+        shape = self._projections.get(cache_key)
+        if shape is None:
+            shape = self._project(fields, expand)
+            if len(self._projections) < MAX_PROJECTIONS:
+                self._projections[cache_key] = shape
+        return shape
+
+    @property
+    def relations(self):
+        """Names `project` accepts in `expand`"""
+        return [key for key, _, _ in self.nested + self.collections]
+
+    def field_names(self):
+        """Names `project` accepts in `fields`"""
+        names = {field.key for field in self.fields}
+        for key, _, shape in self.nested + self.collections:
+            names.add(key)
+            names.update(f'{key}.{name}' for name in shape.field_names())
+        return names
+
+    def _project(self, fields, expand):
+        relations = self.relations
+        own, relation_fields = None, {}
+        if fields is not None:
+            own = set()
+            keys = {field.key for field in self.fields}
+            for name in fields:
+                relation, dot, key = name.partition('.')
+                if dot and relation in relations:
+                    if relation_fields.get(relation, []) is not None:
+                        relation_fields.setdefault(relation, []).append(key)
+                elif not dot and name in relations:
+                    relation_fields[name] = None  # all of the relation's keys
+                elif not dot and name in keys:
+                    own.add(name)
+                else:
+                    raise ProjectionError(f'Unknown field: {name}')
+        if expand is not None:
+            for name in expand:
+                if name not in relations:
+                    choices = f'. Must be one of: {", ".join(relations)}' if relations else ''
+                    raise ProjectionError(f'Cannot expand {name}{choices}')
+            for relation in relation_fields:
+                if relation not in expand:
+                    raise ProjectionError(f'Fields of {relation} require expand={relation}')
+
+        def included(key):
+            if expand is not None:
+                return key in expand
+            return fields is None or key in relation_fields
+
+        def narrow(relations):
+            return [
+                (key, name, shape.project(relation_fields.get(key)))
+                for key, name, shape in relations if included(key)
+            ]
+
+        return Shape(
+            self.model, [field for field in self.fields if own is None or field.key in own],
+            narrow(self.nested), narrow(self.collections)
+        )
+
+    def pick(self, data):
+        """Narrow a dict serialized with the full shape, e.g. an in-memory index entry, to this shape"""
+        picked = {field.key: data[field.key] for field in self.fields}
+        for key, _, nested in self.nested:
+            if key in data:
+                picked[key] = None if data[key] is None else nested.pick(data[key])
+        return picked
+
+    def query(self, key_columns=None):
+        """Query selecting this shape's columns as rows.
+
+        Top-level columns are labelled with their attribute names. Any of
+        `key_columns` (name -> column, e.g. from `keyset_columns`) the shape
+        leaves out is added under its name, so rows still carry the keys
+        pagination reads back.
+        """
+        columns, joins, labels = self._compile()[:3]
+        extra = [
+            key_column.label(name) for name, key_column in (key_columns or {}).items() if name not in labels
+        ]
+        if not columns and not extra:
+            extra = [db.inspect(self.model).primary_key[0]]  # a shape narrowed to nothing still selects its rows
+        query = db.session.query(*columns, *extra).select_from(self.model)
+        for relationship, outer in joins:
+            query = query.outerjoin(relationship) if outer else query.join(relationship)
+        return query
+
+
+# User.to_dict()
+USER_ROW = Shape(User, [
+    column(User.id), column(User.username), column(User.email), column(User.role), column(User.is_active)
+])
+
+# Genre.to_dict()
+GENRE_ROW = Shape(Genre, [column(Genre.id), column(Genre.name), column(Genre.description), column(Genre.created_at)])
+
+# Artist.to_dict()
+ARTIST_ROW = Shape(Artist, [
+    column(Artist.id), column(Artist.name), column(Artist.biography), column(Artist.multimedia),
+    column(Artist.created_at)
+])
+
+# MusicalWork.to_dict()
+WORK_ROW = Shape(MusicalWork, [
+    column(MusicalWork.id), column(MusicalWork.title), column(MusicalWork.description),
+    column(MusicalWork.genre_id), column(MusicalWork.artist_id), column(MusicalWork.created_at),
+    Field('review_count', (MusicalWork.review_count,), '{0} or 0'),
+    Field('average_rating', (MusicalWork.review_count, MusicalWork.rating_sum), '_average({0}, {1})'),
+    Field('rating_histogram', [getattr(MusicalWork, f'rating_{rating}_count') for rating in range(1, 6)],
+          "{{'1': {0} or 0, '2': {1} or 0, '3': {2} or 0, '4': {3} or 0, '5': {4} or 0}}"),
+])
+
+# MusicalWork.to_dict(include_artist=True, include_genre=True)
+WORK_ROW_WITH_ARTIST_AND_GENRE = Shape(MusicalWork, WORK_ROW.fields, nested=[
+    ('artist', 'artist', ARTIST_ROW), ('genre', 'genre', GENRE_ROW)
+])
+
+# Review.to_dict()
+REVIEW_ROW = Shape(Review, [
+    column(Review.id), column(Review.user_id), column(Review.musical_work_id), column(Review.rating),
+    column(Review.comment), column(Review.is_approved), column(Review.created_at), column(Review.updated_at)
+])
+
+# Review.to_dict(include_user=True)
+REVIEW_ROW_WITH_USER = Shape(Review, REVIEW_ROW.fields, nested=[('user', 'user', USER_ROW)])
+
+# MusicalWork.to_dict(include_artist=True, include_genre=True, include_reviews=True)
+WORK_ROW_DETAILS = Shape(
+    MusicalWork, WORK_ROW.fields, nested=WORK_ROW_WITH_ARTIST_AND_GENRE.nested,
+    collections=[('reviews', 'reviews', REVIEW_ROW)]
+)
+
+# A live chart entry with its work, artist and genre
+CHART_ENTRY_ROW = Shape(ChartEntry, [
+    Field('score', (ChartEntry.score,), 'round({0}, 4)'), column(ChartEntry.review_count)
+], nested=[('musical_work', 'musical_work', WORK_ROW_WITH_ARTIST_AND_GENRE)])
+
+# TopList.to_dict()
+TOP_LIST_ROW = Shape(TopList, [
+    column(TopList.id), column(TopList.title), column(TopList.genre_id), column(TopList.size),
+    Field('prior_mean', (TopList.prior_mean,), 'round({0}, 4)'), column(TopList.prior_weight),
+    column(TopList.created_by), column(TopList.created_at), column(TopList.published_at)
+])
+
+# A top list entry as captured, with its work, artist and genre (None once the work is deleted)
+TOP_LIST_ENTRY_ROW = Shape(TopListEntry, [
+    column(TopListEntry.position), column(TopListEntry.title),
+    Field('score', (TopListEntry.score,), 'round({0}, 4)'), column(TopListEntry.review_count)
+], nested=[('musical_work', 'musical_work', WORK_ROW_WITH_ARTIST_AND_GENRE)])
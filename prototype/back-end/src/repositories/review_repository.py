@@ -1,47 +1,356 @@
-from models import db, Review
+from datetime import datetime, timedelta
+
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.attributes import set_committed_value
+
+from models import db, User, Review, MusicalWork
+from repositories.chart_repository import ChartRepository
+from repositories.loading import with_plan
+from repositories.pagination import PaginationError, keyset_paginate, keyset_columns
+
+ID_CHUNK_SIZE = 1000  # ids per IN list in batch statements
+FOREIGN_KEY_VIOLATION = '23503'  # PostgreSQL SQLSTATE
+WORK_FOREIGN_KEY = 'reviews_musical_work_id_fkey'  # PostgreSQL's default name for reviews.musical_work_id
+USER_FOREIGN_KEY = 'reviews_user_id_fkey'  # and for reviews.user_id
+
+
+class ReviewExists(ValueError):
+    """Raised when the user has already reviewed the work"""
+
+
+class MusicalWorkNotFound(LookupError):
+    """Raised when a review refers to a work that does not exist"""
+
+
+class UserNotFound(LookupError):
+    """Raised when a review refers to a user that does not exist, e.g. one deleted after logging in"""
+
+
+def _insert(model):
+    """INSERT supporting ON CONFLICT for the session's database"""
+    dialect = db.session.get_bind().dialect.name
+    return (postgresql.insert if dialect == 'postgresql' else sqlite.insert)(model)
+
+
+def _missing_reference(error, user_id, musical_work_id):
+    """MusicalWorkNotFound or UserNotFound when an IntegrityError from writing a review is a foreign key violation"""
+    pgcode = getattr(error.orig, 'pgcode', None)
+    if pgcode is not None:
+        if pgcode != FOREIGN_KEY_VIOLATION:
+            return None
+        if WORK_FOREIGN_KEY in str(error.orig):
+            return MusicalWorkNotFound()
+        return UserNotFound() if USER_FOREIGN_KEY in str(error.orig) else None
+    # SQLite does not name the violated constraint
+    if 'FOREIGN KEY constraint failed' not in str(error.orig):
+        return None
+    if db.session.get(MusicalWork, musical_work_id) is None:
+        return MusicalWorkNotFound()
+    return UserNotFound() if db.session.get(User, user_id) is None else None
+
+
+def _chunks(ids):
+    for start in range(0, len(ids), ID_CHUNK_SIZE):
+        yield ids[start:start + ID_CHUNK_SIZE]
+
 
 class ReviewRepository:
     """Repository for review operations"""
     
+    SORT_COLUMNS = {
+        'id': Review.id,
+        'created_at': Review.created_at,
+        'rating': Review.rating
+    }
+    
+    # Named orders for a work's approved reviews
+    WORK_REVIEW_SORTS = {
+        'newest': '-created_at',
+        'oldest': 'created_at',
+        'highest': '-rating',
+        'lowest': 'rating'
+    }
+    
+    @staticmethod
+    def _adjust_ratings(musical_work_id, rating, delta, refresh_chart=True):
+        """Add (delta=1) or remove (delta=-1) an approved rating from the work's stored aggregates.
+        
+        Runs as an in-place UPDATE in the caller's transaction, so the aggregates
+        commit or roll back together with the review change, and rescores the
+        work's chart entry unless `refresh_chart` is false.
+        """
+        histogram_column = getattr(MusicalWork, f'rating_{rating}_count')
+        MusicalWork.query.filter_by(id=musical_work_id).update({
+            MusicalWork.review_count: MusicalWork.review_count + delta,
+            MusicalWork.rating_sum: MusicalWork.rating_sum + delta * rating,
+            histogram_column: histogram_column + delta
+        }, synchronize_session=False)
+        if refresh_chart:
+            ChartRepository.refresh_works([musical_work_id])
+    
+    @staticmethod
+    def _apply_rating_deltas(rows, delta):
+        """Add (delta=1) or remove (delta=-1) many ratings, given as (musical_work_id, rating) rows.
+        
+        Issues one parameterized UPDATE per affected work as a single executemany,
+        in work id order so concurrent batches lock rows in the same order, then
+        rescores the affected works' chart entries.
+        """
+        changes = {}
+        for musical_work_id, rating in rows:
+            change = changes.setdefault(musical_work_id, {
+                'work_id': musical_work_id, 'count': 0, 'sum': 0,
+                'r1': 0, 'r2': 0, 'r3': 0, 'r4': 0, 'r5': 0
+            })
+            change['count'] += delta
+            change['sum'] += delta * rating
+            change[f'r{rating}'] += delta
+        if not changes:
+            return
+        works = MusicalWork.__table__
+        values = {
+            'review_count': works.c.review_count + db.bindparam('count'),
+            'rating_sum': works.c.rating_sum + db.bindparam('sum')
+        }
+        for rating in range(1, 6):
+            column = f'rating_{rating}_count'
+            values[column] = works.c[column] + db.bindparam(f'r{rating}')
+        db.session.execute(
+            db.update(works).where(works.c.id == db.bindparam('work_id')).values(values),
+            [changes[musical_work_id] for musical_work_id in sorted(changes)]
+        )
+        for chunk in _chunks(sorted(changes)):
+            ChartRepository.refresh_works(chunk)
+    
+    @staticmethod
+    def _pending_criteria(criteria):
+        """WHERE clauses selecting pending reviews whose columns equal `criteria`"""
+        reviews = Review.__table__
+        return [reviews.c.is_approved == False] + [  # noqa: E712 (matches the pending index predicate)
+            reviews.c[column] == value for column, value in criteria.items()
+        ]
+    
+    @staticmethod
+    def _claimable(moderator_id, now):
+        """WHERE clause for reviews without a live lease held by another moderator"""
+        reviews = Review.__table__
+        return db.or_(
+            reviews.c.claimed_until.is_(None),
+            reviews.c.claimed_until < now,
+            reviews.c.claimed_by == moderator_id
+        )
+    
+    @staticmethod
+    def _filter_selection(criteria, moderator_id, limit):
+        """WHERE clauses selecting the `limit` oldest claimable pending reviews matching `criteria`
+        
+        The ids come from a LIMIT subquery over the pending (created_at, id)
+        index; the outer statement checks again that each row is still pending.
+        """
+        reviews = Review.__table__
+        review_ids = db.select(reviews.c.id).where(
+            *ReviewRepository._pending_criteria(criteria),
+            ReviewRepository._claimable(moderator_id, datetime.utcnow())
+        ).order_by(reviews.c.created_at, reviews.c.id).limit(limit)
+        return [reviews.c.id.in_(review_ids.scalar_subquery()), reviews.c.is_approved.is_(False)]
+    
     @staticmethod
     def create(user_id, musical_work_id, rating, comment=None):
-        """Create a new review"""
-        review = Review(
-            user_id=user_id,
-            musical_work_id=musical_work_id,
-            rating=rating,
-            comment=comment
+        """Create a new review with a single INSERT ... ON CONFLICT DO NOTHING
+        
+        The unique (user_id, musical_work_id) index and the foreign keys do the
+        checks, so concurrent submissions cannot both succeed. The review comes
+        back with its user loaded by the same statement. Raises ReviewExists,
+        MusicalWorkNotFound or UserNotFound.
+        """
+        now = datetime.utcnow()
+        statement = _insert(Review).values(
+            user_id=user_id, musical_work_id=musical_work_id, rating=rating, comment=comment,
+            is_approved=False, created_at=now, updated_at=now
+        ).on_conflict_do_nothing(index_elements=['user_id', 'musical_work_id'])
+        review = ReviewRepository._execute_insert(statement, user_id, musical_work_id)
+        if review is None:
+            raise ReviewExists()
+        return review
+    
+    @staticmethod
+    def upsert_rating(user_id, musical_work_id, rating, comment=None):
+        """Create the user's review of a work, or replace its rating (and comment, when given).
+        
+        Returns (review, created). New and pending reviews are written by one
+        INSERT ... ON CONFLICT DO UPDATE; an approved review is changed through
+        `update` so the work's rating aggregates follow. Raises MusicalWorkNotFound
+        or UserNotFound.
+        """
+        now = datetime.utcnow()
+        statement = _insert(Review).values(
+            user_id=user_id, musical_work_id=musical_work_id, rating=rating, comment=comment,
+            is_approved=False, created_at=now, updated_at=now
         )
-        db.session.add(review)
-        db.session.commit()
+        statement = statement.on_conflict_do_update(
+            index_elements=['user_id', 'musical_work_id'],
+            set_={
+                'rating': statement.excluded.rating,
+                'comment': db.func.coalesce(statement.excluded.comment, Review.comment),
+                'updated_at': statement.excluded.updated_at
+            },
+            where=Review.is_approved == False  # noqa: E712
+        )
+        review = ReviewRepository._execute_insert(statement, user_id, musical_work_id)
+        if review is not None:
+            return review, review.created_at == now
+        
+        existing = ReviewRepository.find_user_review_for_work(user_id, musical_work_id)
+        return ReviewRepository.update(existing.id, rating=rating, comment=comment), False
+    
+    @staticmethod
+    def _execute_insert(statement, user_id, musical_work_id):
+        """Run a review INSERT ... RETURNING and commit; None when nothing was written
+        
+        RETURNING also reads the review's user through correlated subqueries
+        (SQLite cannot put the INSERT in a CTE to join), which becomes
+        `review.user`. The review is detached before the commit so its returned
+        columns stay loaded instead of being expired and read back. Raises
+        MusicalWorkNotFound or UserNotFound when a foreign key rejects the row;
+        other integrity errors propagate.
+        """
+        user_columns = [User.id, User.username, User.email, User.role, User.is_active]
+        # Spelled out: SQLite renders RETURNING columns unqualified, leaving the subqueries uncorrelated
+        reviews_user_id = db.literal_column('reviews.user_id')
+        try:
+            row = db.session.execute(
+                statement.returning(Review, *(
+                    db.select(column).where(User.id == reviews_user_id).scalar_subquery().label(f'user_{column.key}')
+                    for column in user_columns
+                )),
+                execution_options={'populate_existing': True}
+            ).one_or_none()
+            if row is not None:
+                db.session.expunge(row[0])
+            db.session.commit()
+        except IntegrityError as e:
+            db.session.rollback()
+            missing = _missing_reference(e, user_id, musical_work_id)
+            if missing is not None:
+                raise missing
+            raise
+        if row is None:
+            return None
+        review = row[0]
+        user = User(**{column.key: value for column, value in zip(user_columns, row[1:])})
+        set_committed_value(review, 'user', user)
         return review
     
     @staticmethod
-    def find_all(approved_only=False):
+    def find_all(approved_only=False, load=()):
         """Get all reviews, optionally filter by approval status"""
-        query = Review.query
+        query = with_plan(Review.query, Review, load)
         if approved_only:
             query = query.filter_by(is_approved=True)
         return query.all()
     
     @staticmethod
-    def find_by_id(review_id):
+    def find_by_id(review_id, load=()):
         """Find review by ID"""
-        return Review.query.get(review_id)
+        return with_plan(Review.query, Review, load).get(review_id)
     
     @staticmethod
-    def find_by_user(user_id):
+    def find_pending_page(limit=None, after=None, load=()):
+        """Get a page of reviews awaiting approval, oldest first"""
+        return keyset_paginate(
+            with_plan(Review.query, Review, load).filter_by(is_approved=False),
+            {'created_at': Review.created_at}, Review.id,
+            sort='created_at', limit=limit, after=after
+        )
+    
+    @staticmethod
+    def find_pending_page_rows(shape, limit=None, after=None):
+        """Get a page of pending review rows projected to `shape`, oldest first"""
+        sort_columns = {'created_at': Review.created_at, 'id': Review.id}
+        return keyset_paginate(
+            shape.query(sort_columns).filter(Review.is_approved == False),  # noqa: E712
+            sort_columns, Review.id, sort='created_at', limit=limit, after=after
+        )
+    
+    @staticmethod
+    def claim_pending(moderator_id, limit, lease_seconds, load=()):
+        """Lease up to `limit` of the oldest unclaimed pending reviews to a moderator.
+        
+        Reviews whose lease expired are claimable again, and the moderator's
+        own live claims are claimed again with a renewed lease. Candidate rows
+        are locked with FOR UPDATE SKIP LOCKED, so moderators claiming at the
+        same time get disjoint batches instead of waiting on each other.
+        """
+        now = datetime.utcnow()
+        reviews = Review.__table__
+        candidates = db.select(reviews.c.id).where(
+            reviews.c.is_approved == False,  # noqa: E712
+            ReviewRepository._claimable(moderator_id, now)
+        ).order_by(reviews.c.created_at, reviews.c.id).limit(limit).with_for_update(skip_locked=True)
+        
+        review_ids = db.session.scalars(candidates).all()
+        if review_ids:
+            db.session.execute(
+                db.update(reviews).where(reviews.c.id.in_(review_ids)).values(
+                    claimed_by=moderator_id,
+                    claimed_until=now + timedelta(seconds=lease_seconds),
+                    updated_at=reviews.c.updated_at  # a lease is not an edit
+                )
+            )
+        db.session.commit()
+        if not review_ids:
+            return []
+        return with_plan(Review.query, Review, load).filter(
+            Review.id.in_(review_ids)
+        ).order_by(Review.created_at, Review.id).all()
+    
+    @staticmethod
+    def release_claims(moderator_id, review_ids):
+        """Give back a moderator's leases on the given reviews; returns how many were released"""
+        reviews = Review.__table__
+        result = db.session.execute(
+            db.update(reviews).where(
+                reviews.c.id.in_(review_ids), reviews.c.claimed_by == moderator_id
+            ).values(claimed_by=None, claimed_until=None, updated_at=reviews.c.updated_at)
+        )
+        db.session.commit()
+        return result.rowcount
+    
+    @staticmethod
+    def find_by_user(user_id, load=()):
         """Find reviews by user (all reviews for the user)"""
-        return Review.query.filter_by(user_id=user_id).all()
+        return with_plan(Review.query, Review, load).filter_by(user_id=user_id).all()
     
     @staticmethod
-    def find_by_musical_work(musical_work_id, approved_only=False):
+    def find_rows_by_user(shape, user_id):
+        """Find the user's review rows projected to `shape`"""
+        return shape.query().filter(Review.user_id == user_id).all()
+    
+    @staticmethod
+    def find_by_musical_work(musical_work_id, approved_only=False, load=()):
         """Find reviews for a musical work, optionally filter by approval status"""
-        query = Review.query.filter_by(musical_work_id=musical_work_id)
+        query = with_plan(Review.query, Review, load).filter_by(musical_work_id=musical_work_id)
         if approved_only:
             query = query.filter_by(is_approved=True)
         return query.all()
     
+    @staticmethod
+    def find_approved_page_rows(shape, musical_work_id, limit=None, after=None, sort='newest'):
+        """Get a page of a work's approved review rows projected to `shape`, using keyset pagination
+        
+        `sort` is one of WORK_REVIEW_SORTS; each order is a range scan of one
+        (musical_work_id, is_approved, ...) index.
+        """
+        order = ReviewRepository.WORK_REVIEW_SORTS.get(sort)
+        if order is None:
+            raise PaginationError(f'Invalid sort. Must be one of: {", ".join(ReviewRepository.WORK_REVIEW_SORTS)}')
+        query = shape.query(keyset_columns(ReviewRepository.SORT_COLUMNS, order)).filter(
+            Review.musical_work_id == musical_work_id,
+            Review.is_approved == True  # noqa: E712
+        )
+        return keyset_paginate(query, ReviewRepository.SORT_COLUMNS, Review.id, sort=order, limit=limit, after=after)
+    
     @staticmethod
     def find_user_review_for_work(user_id, musical_work_id):
         """Find a specific user's review for a work"""
@@ -52,12 +361,19 @@ class ReviewRepository:
     
     @staticmethod
     def update(review_id, rating=None, comment=None):
-        """Update review"""
-        review = Review.query.get(review_id)
+        """Update review
+        
+        The row is read with FOR UPDATE, so an approval or another update of
+        the review waits for this one and the aggregates never see a stale rating.
+        """
+        review = db.session.get(Review, review_id, with_for_update=True, populate_existing=True)
         if not review:
             return None
         
-        if rating is not None:
+        if rating is not None and rating != review.rating:
+            if review.is_approved:
+                ReviewRepository._adjust_ratings(review.musical_work_id, review.rating, -1, refresh_chart=False)
+                ReviewRepository._adjust_ratings(review.musical_work_id, rating, 1)
             review.rating = rating
         if comment is not None:
             review.comment = comment
@@ -66,32 +382,153 @@ class ReviewRepository:
         return review
     
     @staticmethod
-    def approve(review_id):
-        """Approve a review"""
-        review = Review.query.get(review_id)
-        if not review:
-            return None
-        review.is_approved = True
+    def approve(review_id, load=()):
+        """Approve a review; returns (review, approved), approved being whether this call approved it
+        
+        A single UPDATE ... WHERE is_approved = false RETURNING decides, so of
+        concurrent approvals only one adjusts the work's aggregates, with the
+        rating the row holds at that moment. The review is None when it does
+        not exist.
+        """
+        reviews = Review.__table__
+        row = db.session.execute(
+            db.update(reviews).where(reviews.c.id == review_id, reviews.c.is_approved.is_(False))
+            .values(is_approved=True)
+            .returning(reviews.c.musical_work_id, reviews.c.rating)
+        ).one_or_none()
+        if row is not None:
+            ReviewRepository._adjust_ratings(row.musical_work_id, row.rating, 1)
         db.session.commit()
-        return review
+        return ReviewRepository.find_by_id(review_id, load=load), row is not None
     
     @staticmethod
     def reject(review_id):
-        """Reject a review (delete it)"""
-        review = Review.query.get(review_id)
-        if not review:
-            return None
-        db.session.delete(review)
+        """Reject a review (delete it)
+        
+        Returns the deleted row's (musical_work_id, rating, is_approved), or
+        None when the review did not exist. A single DELETE ... RETURNING
+        decides, so the aggregates are adjusted once with the values deleted.
+        """
+        reviews = Review.__table__
+        row = db.session.execute(
+            db.delete(reviews).where(reviews.c.id == review_id)
+            .returning(reviews.c.musical_work_id, reviews.c.rating, reviews.c.is_approved)
+        ).one_or_none()
+        if row is not None and row.is_approved:
+            ReviewRepository._adjust_ratings(row.musical_work_id, row.rating, -1)
+        db.session.commit()
+        return row
+    
+    @staticmethod
+    def approve_many(review_ids=None, criteria=None, moderator_id=None, limit=None):
+        """Approve reviews by id, or pending reviews matching `criteria`, in one transaction.
+        
+        By filter, at most `limit` of the oldest matches are approved, skipping
+        reviews leased to a moderator other than `moderator_id`; callers repeat
+        until nothing is left. Works on table rows without loading ORM objects.
+        Returns (outcomes, work_ids): outcomes maps review ids to 'approved',
+        'already_approved' or 'not_found', and work_ids are the works whose
+        reviews changed.
+        """
+        reviews = Review.__table__
+        statement = db.update(reviews).values(is_approved=True).returning(
+            reviews.c.id, reviews.c.musical_work_id, reviews.c.rating
+        )
+        if review_ids is None:
+            changed = db.session.execute(
+                statement.where(*ReviewRepository._filter_selection(criteria, moderator_id, limit))
+            ).all()
+        else:
+            changed = []
+            for chunk in _chunks(review_ids):
+                changed += db.session.execute(
+                    statement.where(reviews.c.id.in_(chunk), reviews.c.is_approved.is_(False))
+                ).all()
+        ReviewRepository._apply_rating_deltas(((row.musical_work_id, row.rating) for row in changed), 1)
+        
+        approved = {row.id for row in changed}
+        if review_ids is None:
+            outcomes = dict.fromkeys(sorted(approved), 'approved')
+        else:
+            existing = set()
+            for chunk in _chunks([review_id for review_id in review_ids if review_id not in approved]):
+                existing.update(db.session.scalars(db.select(reviews.c.id).where(reviews.c.id.in_(chunk))))
+            outcomes = {
+                review_id: 'approved' if review_id in approved
+                else 'already_approved' if review_id in existing
+                else 'not_found'
+                for review_id in review_ids
+            }
+        db.session.commit()
+        return outcomes, {row.musical_work_id for row in changed}
+    
+    @staticmethod
+    def reject_many(review_ids=None, criteria=None, moderator_id=None, limit=None):
+        """Reject (delete) reviews by id, or pending reviews matching `criteria`, in one transaction.
+        
+        The filter path is limited and skips leased reviews as in `approve_many`.
+        Returns (outcomes, work_ids) like `approve_many`, with outcomes of
+        'rejected' or 'not_found'.
+        """
+        reviews = Review.__table__
+        statement = db.delete(reviews).returning(
+            reviews.c.id, reviews.c.musical_work_id, reviews.c.rating, reviews.c.is_approved
+        )
+        if review_ids is None:
+            deleted = db.session.execute(
+                statement.where(*ReviewRepository._filter_selection(criteria, moderator_id, limit))
+            ).all()
+        else:
+            deleted = []
+            for chunk in _chunks(review_ids):
+                deleted += db.session.execute(statement.where(reviews.c.id.in_(chunk))).all()
+        approved = [row for row in deleted if row.is_approved]
+        ReviewRepository._apply_rating_deltas(((row.musical_work_id, row.rating) for row in approved), -1)
         db.session.commit()
-        return True
+        
+        rejected = {row.id for row in deleted}
+        outcomes = {
+            review_id: 'rejected' if review_id in rejected else 'not_found'
+            for review_id in (sorted(rejected) if review_ids is None else review_ids)
+        }
+        return outcomes, {row.musical_work_id for row in deleted}
     
     @staticmethod
     def delete(review_id):
-        """Delete review"""
-        review = Review.query.get(review_id)
-        if review:
-            db.session.delete(review)
-            db.session.commit()
-            return True
-        return False
+        """Delete review; returns the deleted row like `reject`, or None"""
+        return ReviewRepository.reject(review_id)
+    
+    @staticmethod
+    def recompute_rating_aggregates():
+        """Recompute every work's rating aggregates from its approved reviews.
+        
+        Only works whose stored values drifted are written, and their chart
+        entries rescored in the same transaction; returns their ids.
+        """
+        def approved(aggregate, *criteria):
+            return db.select(aggregate).where(
+                Review.musical_work_id == MusicalWork.id,
+                Review.is_approved.is_(True),
+                *criteria
+            ).scalar_subquery()
+        
+        values = {
+            MusicalWork.review_count: approved(db.func.count(Review.id)),
+            MusicalWork.rating_sum: approved(db.func.coalesce(db.func.sum(Review.rating), 0))
+        }
+        for rating in range(1, 6):
+            values[getattr(MusicalWork, f'rating_{rating}_count')] = approved(
+                db.func.count(Review.id), Review.rating == rating
+            )
+        
+        repaired = db.session.scalars(
+            db.update(MusicalWork)
+            .values(values)
+            .where(db.or_(*(column != expected for column, expected in values.items())))
+            .returning(MusicalWork.id)
+        ).all()
+        for chunk in _chunks(sorted(repaired)):
+            ChartRepository.refresh_works(chunk)
+        db.session.commit()
+        return repaired
 
@@ -0,0 +1,69 @@
+from models import db, SEARCH_CONFIG
+from repositories.pagination import MAX_OFFSET, offset_paginate
+from query_budget import unbudgeted
+
+# Matches each index contributes before ranking. Every page a cursor can
+# reach lies within it, so pages are cut from the same candidate set.
+SEARCH_CANDIDATES = MAX_OFFSET
+
+# Whether each engine has PostgreSQL full-text search and pg_trgm, keyed by URL
+_text_search_support = {}
+
+
+def supports_text_search():
+    """Check whether the current engine can use the indexed search path
+
+    The probe runs once per engine and is not counted against the calling
+    view's query budget.
+    """
+    engine = db.engine
+    key = str(engine.url)
+    if key not in _text_search_support:
+        supported = False
+        if engine.dialect.name == 'postgresql':
+            with unbudgeted():
+                supported = db.session.execute(
+                    db.text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+                ).first() is not None
+        _text_search_support[key] = supported
+    return _text_search_support[key]
+
+
+def escape_like(value):
+    """Escape LIKE wildcards so user input is matched literally"""
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def contains(column, term):
+    """Case-insensitive substring predicate (served by the trigram index on PostgreSQL)"""
+    return column.ilike(f'%{escape_like(term)}%', escape='\\')
+
+
+def ranked_search(query, column, document, term, id_column, limit=None, after=None):
+    """Return a Page of rows from `query` matching `term`, most relevant first.
+
+    On PostgreSQL with pg_trgm, candidates are gathered first: up to
+    SEARCH_CANDIDATES ids from each of a full-text match of `document`, a
+    trigram match of `column` and a substring of `column`, each read from its
+    GIN index with a LIMIT. Only those candidates are ranked, by the better of
+    trigram similarity and ts_rank, so a short, common term costs a few
+    bounded index scans rather than ranking every match. Other engines fall
+    back to a substring scan ordered by `column`.
+    """
+    substring = contains(column, term)
+    if supports_text_search():
+        ts_query = db.func.plainto_tsquery(SEARCH_CONFIG, term)
+        candidates = db.union(*(
+            db.select(id_column.label('id')).where(predicate).limit(SEARCH_CANDIDATES)
+            for predicate in (document.bool_op('@@')(ts_query), column.bool_op('%')(term), substring)
+        )).subquery()
+        query = query.filter(id_column.in_(db.select(candidates.c.id)))
+        relevance = db.func.greatest(
+            db.func.similarity(column, term),
+            db.func.ts_rank(document, ts_query)
+        )
+        order_by = [relevance.desc(), id_column]
+    else:
+        query = query.filter(substring)
+        order_by = [column, id_column]
+    return offset_paginate(query, order_by, limit=limit, after=after)
@@ -17,6 +17,11 @@ class UserRepository:
         """Find user by ID"""
         return User.query.get(user_id)
     
+    @staticmethod
+    def find_rows_by_ids(shape, ids):
+        """Find the users among `ids` in one query, as rows projected to `shape` carrying `id`"""
+        return shape.query({'id': User.id}).filter(User.id.in_(ids)).all()
+    
     @staticmethod
     def find_by_username(username):
         """Find user by username"""
@@ -32,6 +37,9 @@ class UserRepository:
         """Authenticate user"""
         user = User.query.filter_by(username=username).first()
         if user and user.check_password(password):
+            if user.password_needs_rehash():
+                user.set_password(password)
+                db.session.commit()
             return user
         return None
     
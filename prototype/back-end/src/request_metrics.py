@@ -0,0 +1,274 @@
+"""Per-request database, serialization and latency metrics in Prometheus format, with a slow request log"""
+
+import hmac
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from flask import Response, current_app, g, has_app_context, jsonify, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from database import WAIT_BUCKETS, pool_status
+from json_encoding import FastJSONProvider
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+MAX_DISTINCT_STATEMENTS = 50  # Distinct statements timed per request for the slow log
+
+
+class RequestStats:
+    """What one request spent on the database and on JSON encoding"""
+
+    __slots__ = ('started', 'queries', 'db_seconds', 'serialize_seconds', 'statements')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.serialize_seconds = 0.0
+        self.statements = {}  # statement -> [executions, seconds]
+
+    def record_query(self, statement, seconds):
+        self.queries += 1
+        self.db_seconds += seconds
+        timing = self.statements.get(statement)
+        if timing is None:
+            if len(self.statements) >= MAX_DISTINCT_STATEMENTS:
+                return
+            timing = self.statements[statement] = [0, 0.0]
+        timing[0] += 1
+        timing[1] += seconds
+
+
+class _Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+
+class MetricsRegistry:
+    """Per-process totals keyed by (blueprint, endpoint, method).
+
+    Each worker process keeps its own registry, so Prometheus should scrape
+    every worker (or sum across them) rather than one address behind a load
+    balancer.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._responses = defaultdict(int)  # (blueprint, endpoint, method, status) -> count
+        self._totals = defaultdict(lambda: defaultdict(int))  # route -> name -> total
+        self._latency = {}
+        self._queries = {}
+
+    def observe(self, route, status, stats, latency, response_bytes):
+        with self._lock:
+            self._responses[route + (str(status),)] += 1
+            totals = self._totals[route]
+            totals['queries'] += stats.queries
+            totals['db_seconds'] += stats.db_seconds
+            totals['serialize_seconds'] += stats.serialize_seconds
+            if response_bytes is not None:
+                totals['response_bytes'] += response_bytes
+            self._histogram(self._latency, route, LATENCY_BUCKETS).observe(latency)
+            self._histogram(self._queries, route, QUERY_COUNT_BUCKETS).observe(stats.queries)
+
+    @staticmethod
+    def _histogram(histograms, route, buckets):
+        histogram = histograms.get(route)
+        if histogram is None:
+            histogram = histograms[route] = _Histogram(buckets)
+        return histogram
+
+    def render(self, engine):
+        """Prometheus text exposition of every metric, including the connection pool's"""
+        lines = []
+        with self._lock:
+            _family(lines, 'audiotheca_http_requests_total', 'counter', 'Requests by route and status')
+            for (blueprint, endpoint, method, status), count in sorted(self._responses.items()):
+                labels = _labels(blueprint=blueprint, endpoint=endpoint, method=method, status=status)
+                lines.append(f'audiotheca_http_requests_total{labels} {count}')
+            for name, help_text in (
+                ('queries', 'SQL statements executed'),
+                ('db_seconds', 'Time spent executing SQL statements'),
+                ('serialize_seconds', 'Time spent encoding JSON responses'),
+                ('response_bytes', 'Response body bytes, where the length was known up front'),
+            ):
+                metric = f'audiotheca_http_{name}_total'
+                _family(lines, metric, 'counter', help_text)
+                for route, totals in sorted(self._totals.items()):
+                    lines.append(f'{metric}{_route_labels(route)} {_number(totals[name])}')
+            _histogram_family(lines, 'audiotheca_http_request_duration_seconds',
+                              'Time from request start to response, excluding streamed bodies', self._latency)
+            _histogram_family(lines, 'audiotheca_http_request_queries',
+                              'SQL statements per request', self._queries)
+
+        status = pool_status(engine)
+        _family(lines, 'audiotheca_db_pool_checkout_wait_seconds', 'histogram',
+                'Time spent waiting for a pooled connection')
+        cumulative = 0
+        for bound in WAIT_BUCKETS:
+            cumulative += status['wait_buckets'][str(bound)]
+            lines.append(f'audiotheca_db_pool_checkout_wait_seconds_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f'audiotheca_db_pool_checkout_wait_seconds_bucket{{le="+Inf"}} {status["checkouts"]}')
+        lines.append(f'audiotheca_db_pool_checkout_wait_seconds_sum {_number(status["wait_seconds_total"])}')
+        lines.append(f'audiotheca_db_pool_checkout_wait_seconds_count {status["checkouts"]}')
+        _family(lines, 'audiotheca_db_pool_checkout_timeouts_total', 'counter',
+                'Checkouts that gave up waiting for a connection')
+        lines.append(f'audiotheca_db_pool_checkout_timeouts_total {status["timeouts"]}')
+        for name in ('size', 'checked_out', 'overflow', 'idle'):
+            if name in status:
+                _family(lines, f'audiotheca_db_pool_{name}', 'gauge', f'Connection pool {name.replace("_", " ")}')
+                lines.append(f'audiotheca_db_pool_{name} {status[name]}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels):
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+
+def _route_labels(route, **extra):
+    blueprint, endpoint, method = route
+    return _labels(blueprint=blueprint, endpoint=endpoint, method=method, **extra)
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _family(lines, name, metric_type, help_text):
+    lines.append(f'# HELP {name} {help_text}')
+    lines.append(f'# TYPE {name} {metric_type}')
+
+
+def _histogram_family(lines, name, help_text, histograms):
+    _family(lines, name, 'histogram', help_text)
+    for route, histogram in sorted(histograms.items()):
+        cumulative = 0
+        for bound, count in zip(histogram.buckets, histogram.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{_route_labels(route, le=bound)} {cumulative}')
+        lines.append(f'{name}_bucket{_route_labels(route, le="+Inf")} {histogram.count}')
+        lines.append(f'{name}_sum{_route_labels(route)} {_number(histogram.sum)}')
+        lines.append(f'{name}_count{_route_labels(route)} {histogram.count}')
+
+
+def _current_stats():
+    if has_app_context():
+        return g.get('request_stats')
+    return None
+
+
+def _start_query(conn, cursor, statement, parameters, context, executemany):
+    if _current_stats() is not None:
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+def _end_query(conn, cursor, statement, parameters, context, executemany):
+    stats = _current_stats()
+    started = conn.info.get('query_started')
+    if stats is not None and started:
+        stats.record_query(statement, time.perf_counter() - started.pop())
+
+
+def _drop_query_start(exception_context):
+    # A failed statement never reaches after_cursor_execute
+    connection = exception_context.connection
+    started = connection.info.get('query_started') if connection is not None else None
+    if started:
+        started.pop()
+
+
+class TimedJSONProvider(FastJSONProvider):
+    """The app's JSON provider, adding encoding time to the current request's stats"""
+
+    def dumps(self, obj, **kwargs):
+        stats = _current_stats()
+        if stats is None:
+            return super().dumps(obj, **kwargs)
+        started = time.perf_counter()
+        try:
+            return super().dumps(obj, **kwargs)
+        finally:
+            stats.serialize_seconds += time.perf_counter() - started
+
+
+def _log_slow_request(route, status, stats, latency, config):
+    statements = sorted(stats.statements.items(), key=lambda item: item[1][1], reverse=True)
+    details = ''.join(
+        f'\n  {seconds * 1000:.1f} ms in {executions} run(s): {" ".join(statement.split())}'
+        for statement, (executions, seconds) in statements[:config['SLOW_REQUEST_STATEMENTS']]
+    )
+    logger.warning(
+        'Slow request %s %s (%s) -> %s: %.1f ms, %d queries, %.1f ms in SQL, %.1f ms serializing%s',
+        request.method, request.path, route[1], status, latency * 1000,
+        stats.queries, stats.db_seconds * 1000, stats.serialize_seconds * 1000, details
+    )
+
+
+def metrics():
+    """Prometheus scrape endpoint; requires `Authorization: Bearer <METRICS_TOKEN>`, and is off while that is unset"""
+    token = current_app.config.get('METRICS_TOKEN')
+    if not token:
+        return jsonify({'error': 'Metrics are disabled; set METRICS_TOKEN to enable them'}), 404
+    if not hmac.compare_digest(request.headers.get('Authorization', '').encode(), f'Bearer {token}'.encode()):
+        return jsonify({'error': 'Metrics token required'}), 401
+    from app import db
+    return Response(registry.render(db.engine), mimetype='text/plain; version=0.0.4')
+
+
+def init_request_metrics(app):
+    """Time each request's SQL and JSON encoding and serve the totals at GET /metrics.
+
+    Requests slower than SLOW_REQUEST_SECONDS, or running more than
+    SLOW_REQUEST_QUERIES statements, are logged as warnings together with
+    their most expensive statements and how often each ran, which is how an
+    N+1 lazy load shows up.
+    """
+    if not event.contains(Engine, 'before_cursor_execute', _start_query):
+        event.listen(Engine, 'before_cursor_execute', _start_query)
+        event.listen(Engine, 'after_cursor_execute', _end_query)
+        event.listen(Engine, 'handle_error', _drop_query_start)
+
+    app.json = TimedJSONProvider(app)
+    app.add_url_rule('/metrics', 'metrics', metrics)
+
+    @app.before_request
+    def start_request_stats():
+        g.request_stats = RequestStats()
+
+    @app.after_request
+    def record_request_stats(response):
+        stats = g.pop('request_stats', None)
+        if stats is None:
+            return response
+        latency = time.perf_counter() - stats.started
+        route = (request.blueprint or '', request.endpoint or 'unmatched', request.method)
+        registry.observe(route, response.status_code, stats, latency, response.calculate_content_length())
+        config = current_app.config
+        if latency > config['SLOW_REQUEST_SECONDS'] or stats.queries > config['SLOW_REQUEST_QUERIES']:
+            _log_slow_request(route, response.status_code, stats, latency, config)
+        return response
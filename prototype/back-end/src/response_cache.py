@@ -0,0 +1,149 @@
+"""In-process cache of serialized public GET responses with strong ETags"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import Response, current_app, g, make_response, request
+
+from catalog_sync import publish
+
+
+class _Entry:
+    __slots__ = ('body', 'etag', 'dependencies', 'created', 'expires')
+
+    def __init__(self, body, etag, dependencies, created, expires):
+        self.body = body
+        self.etag = etag
+        self.dependencies = dependencies
+        self.created = created
+        self.expires = expires
+
+
+class ResponseCache:
+    """LRU of response bodies bounded by total size, validated by dependency versions.
+
+    Every cached body records the version keys it was built from, such as
+    'artist:5' or 'works'. Writes call `invalidate` on the keys they change,
+    which stamps them with the current value of a logical clock; an entry is
+    only served while none of its keys was stamped after the entry was
+    started. The cache is per process: a write handled by another worker
+    expires the same keys here when this process next polls catalog_versions
+    (see catalog_sync), and at the latest after `ttl` seconds.
+    """
+
+    def __init__(self, max_bytes, max_entry_bytes, ttl):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._size = 0
+        self._clock = 0
+        self._stamps = {}
+        self.last_invalidated = 0.0  # Wall time of the latest invalidate, for replica routing
+
+    def now(self):
+        """Current logical clock, taken before building a response"""
+        with self._lock:
+            return self._clock
+
+    def invalidate(self, *keys):
+        """Mark version keys as changed, expiring every entry built from them"""
+        with self._lock:
+            self._clock += 1
+            self.last_invalidated = time.time()
+            for key in keys:
+                self._stamps[key] = self._clock
+
+    def get(self, cache_key):
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is None:
+                return None
+            if entry.expires <= time.time() or any(
+                self._stamps.get(key, 0) > entry.created for key in entry.dependencies
+            ):
+                self._discard(cache_key)
+                return None
+            self._entries.move_to_end(cache_key)
+            return entry
+
+    def put(self, cache_key, body, etag, dependencies, created):
+        if len(body) > self.max_entry_bytes:
+            return
+        with self._lock:
+            if cache_key in self._entries:
+                self._discard(cache_key)
+            self._entries[cache_key] = _Entry(body, etag, dependencies, created, time.time() + self.ttl)
+            self._size += len(body)
+            while self._size > self.max_bytes and self._entries:
+                self._discard(next(iter(self._entries)))
+
+    def _discard(self, cache_key):
+        entry = self._entries.pop(cache_key)
+        self._size -= len(entry.body)
+
+
+def compute_etag(body):
+    """Strong validator derived from the body, so it agrees across processes"""
+    return hashlib.blake2b(body, digest_size=16).hexdigest()
+
+
+def _conditional(response, etag):
+    response.set_etag(etag)
+    response.cache_control.no_cache = True  # clients revalidate with If-None-Match
+    return response.make_conditional(request)
+
+
+def depends_on(*keys):
+    """Add version keys to the response being built by a @cached_get view"""
+    dependencies = g.get('cache_dependencies')
+    if dependencies is not None:
+        dependencies.update(keys)
+
+
+def cached_get(*dependencies):
+    """Cache a public GET view's JSON body and answer If-None-Match with 304.
+
+    `dependencies` are version keys formatted with the view arguments, e.g.
+    'artist:{artist_id}'; views add keys for nested entities with `depends_on`.
+    Only 200 responses are cached.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(**kwargs):
+            cache = current_app.extensions['response_cache']
+            cache_key = request.full_path
+            entry = cache.get(cache_key)
+            if entry is not None:
+                response = Response(entry.body, mimetype='application/json')
+                return _conditional(response, entry.etag)
+
+            created = cache.now()
+            g.cache_dependencies = {key.format(**kwargs) for key in dependencies}
+            response = make_response(view(**kwargs))
+            if response.status_code != 200:
+                return response
+            body = response.get_data()
+            etag = compute_etag(body)
+            cache.put(cache_key, body, etag, frozenset(g.cache_dependencies), created)
+            return _conditional(response, etag)
+        return wrapper
+    return decorator
+
+
+def invalidate(*keys):
+    """Expire cached responses built from any of the given version keys, and announce them to other processes"""
+    current_app.extensions['response_cache'].invalidate(*keys)
+    publish(keys)
+
+
+def init_response_cache(app):
+    app.extensions['response_cache'] = ResponseCache(
+        app.config['RESPONSE_CACHE_MAX_BYTES'],
+        app.config['RESPONSE_CACHE_MAX_ENTRY_BYTES'],
+        app.config['RESPONSE_CACHE_TTL']
+    )
@@ -4,6 +4,8 @@ from .user import user_bp
 from .producer import producer_bp
 from .search import search_bp
 from .admin import admin_bp
+from .batch import batch_bp
+from .charts import charts_bp
 
-__all__ = ['auth_bp', 'user_bp', 'producer_bp', 'search_bp', 'admin_bp']
+__all__ = ['auth_bp', 'user_bp', 'producer_bp', 'search_bp', 'admin_bp', 'batch_bp', 'charts_bp']
 
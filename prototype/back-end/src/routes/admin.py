@@ -1,25 +1,38 @@
 from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_jwt_extended import jwt_required
 from repositories.user_repository import UserRepository
+from repositories.projections import USER_ROW, ProjectionError
+from principal import current_principal, invalidate_principal
+from database import pool_status
+from routes.fields import get_shape
+from routes.batch import BatchError, get_ids, batch_result
 
 admin_bp = Blueprint('admin', __name__)
 
 def require_admin():
-    """Check if user is an admin"""
-    user_id = get_jwt_identity()
-    user = UserRepository.find_by_id(user_id)
-    if not user or user.role != 'admin':
+    """Check if user is an active admin"""
+    principal = current_principal()
+    if not principal or not principal.is_active or principal.role != 'admin':
         return None
-    return user
+    return principal
 
 
 @admin_bp.route('/users', methods=['GET'])
 @jwt_required()
 def get_all_users():
-    """Get all users (admin only)"""
+    """Get all users, or with `ids` the users with those ids keyed by id (admin only)"""
     if not require_admin():
         return jsonify({'error': 'Admin access required'}), 403
     
+    if request.args.get('ids') is not None:
+        try:
+            shape = get_shape(USER_ROW)
+            ids = get_ids()
+        except (ProjectionError, BatchError) as e:
+            return jsonify({'error': str(e)}), 400
+        rows = UserRepository.find_rows_by_ids(shape, ids)
+        return jsonify(batch_result(shape, rows, ids)), 200
+    
     from models import User
     users = User.query.all()
     return jsonify([user.to_dict() for user in users]), 200
@@ -43,7 +56,8 @@ def get_user(user_id):
 @jwt_required()
 def ban_user(user_id):
     """Ban a user (admin only)"""
-    if not require_admin():
+    admin = require_admin()
+    if not admin:
         return jsonify({'error': 'Admin access required'}), 403
     
     user = UserRepository.find_by_id(user_id)
@@ -51,8 +65,7 @@ def ban_user(user_id):
         return jsonify({'error': 'User not found'}), 404
     
     # Cannot ban yourself
-    current_user_id = get_jwt_identity()
-    if user_id == current_user_id:
+    if user_id == admin.id:
         return jsonify({'error': 'Cannot ban yourself'}), 400
     
     # Cannot ban other admins
@@ -63,6 +76,7 @@ def ban_user(user_id):
     user.is_active = False
     from app import db
     db.session.commit()
+    invalidate_principal(user_id)
     
     return jsonify({
         'message': 'User banned successfully',
@@ -85,6 +99,7 @@ def unban_user(user_id):
     user.is_active = True
     from app import db
     db.session.commit()
+    invalidate_principal(user_id)
     
     return jsonify({
         'message': 'User unbanned successfully',
@@ -96,7 +111,8 @@ def unban_user(user_id):
 @jwt_required()
 def update_user_role(user_id):
     """Update user role (admin only)"""
-    if not require_admin():
+    admin = require_admin()
+    if not admin:
         return jsonify({'error': 'Admin access required'}), 403
     
     user = UserRepository.find_by_id(user_id)
@@ -104,8 +120,7 @@ def update_user_role(user_id):
         return jsonify({'error': 'User not found'}), 404
     
     # Cannot change your own role
-    current_user_id = get_jwt_identity()
-    if user_id == current_user_id:
+    if user_id == admin.id:
         return jsonify({'error': 'Cannot change your own role'}), 400
     
     data = request.get_json()
@@ -123,9 +138,20 @@ def update_user_role(user_id):
     user.role = new_role
     from app import db
     db.session.commit()
+    invalidate_principal(user_id)
     
     return jsonify({
         'message': 'User role updated successfully',
         'user': user.to_dict()
     }), 200
 
+
+@admin_bp.route('/database/pool', methods=['GET'])
+@jwt_required()
+def get_database_pool():
+    """Connection pool occupancy and checkout wait times for this process (admin only)"""
+    if not require_admin():
+        return jsonify({'error': 'Admin access required'}), 403
+
+    from app import db
+    return jsonify(pool_status(db.engine)), 200
@@ -1,6 +1,7 @@
 from flask import Blueprint, request, jsonify
-from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
+from flask_jwt_extended import jwt_required, get_jwt_identity
 from repositories.user_repository import UserRepository
+from principal import create_user_token
 from models import User
 
 auth_bp = Blueprint('auth', __name__)
@@ -29,7 +30,7 @@ def register():
     user = UserRepository.create(username, email, password, role)
     
     # Create access token
-    access_token = create_access_token(identity=user.id)
+    access_token = create_user_token(user)
     
     return jsonify({
         'message': 'User registered successfully',
@@ -59,7 +60,7 @@ def login():
         return jsonify({'error': 'Account is deactivated'}), 403
     
     # Create access token
-    access_token = create_access_token(identity=str(user.id))
+    access_token = create_user_token(user)
     
     return jsonify({
         'message': 'Login successful',
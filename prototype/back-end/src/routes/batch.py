@@ -0,0 +1,93 @@
+from flask import Blueprint, current_app, request, jsonify
+from flask_jwt_extended import verify_jwt_in_request
+from repositories.genre_repository import GenreRepository
+from repositories.artist_repository import ArtistRepository
+from repositories.musical_work_repository import MusicalWorkRepository
+from repositories.user_repository import UserRepository
+from repositories.projections import GENRE_ROW, ARTIST_ROW, WORK_ROW_WITH_ARTIST_AND_GENRE, USER_ROW, ProjectionError
+from principal import current_principal
+from query_budget import query_budget
+from database import read_only
+from routes.fields import get_shapes
+
+batch_bp = Blueprint('batch', __name__)
+
+# Types POST /batch/get accepts: body key -> (shape, repository)
+BATCH_TYPES = {
+    'musical_works': (WORK_ROW_WITH_ARTIST_AND_GENRE, MusicalWorkRepository),
+    'artists': (ARTIST_ROW, ArtistRepository),
+    'genres': (GENRE_ROW, GenreRepository),
+    'users': (USER_ROW, UserRepository),
+}
+
+
+class BatchError(ValueError):
+    """Raised for a malformed or oversized list of ids"""
+
+
+def parse_ids(value, name='ids'):
+    """Distinct ids, in the order given, from a list of integers or a comma-separated string"""
+    if isinstance(value, str):
+        try:
+            value = [int(part) for part in value.split(',') if part.strip()]
+        except ValueError:
+            raise BatchError(f'{name} must be a list of integers')
+    elif not isinstance(value, list) or not all(isinstance(i, int) and not isinstance(i, bool) for i in value):
+        raise BatchError(f'{name} must be a list of integers')
+    ids = list(dict.fromkeys(value))
+    limit = current_app.config['BATCH_GET_MAX_IDS']
+    if len(ids) > limit:
+        raise BatchError(f'At most {limit} {name} per request')
+    return ids
+
+
+def get_ids():
+    """Ids from the `ids` query parameter, or None when the request does not give one"""
+    value = request.args.get('ids')
+    return None if value is None else parse_ids(value)
+
+
+def batch_result(shape, rows, ids):
+    """Serialized rows keyed by id, plus the requested ids that matched nothing"""
+    items = {row.id: shape.serialize(row) for row in rows}
+    return {
+        'items': {str(item_id): item for item_id, item in items.items()},
+        'not_found': [item_id for item_id in ids if item_id not in items]
+    }
+
+
+def _is_admin():
+    if verify_jwt_in_request(optional=True) is None:
+        return False
+    principal = current_principal()
+    return bool(principal and principal.is_active and principal.role == 'admin')
+
+
+@batch_bp.route('/batch/get', methods=['POST'])
+@query_budget(len(BATCH_TYPES) + 1)  # plus a principal lookup when users are requested
+@read_only
+def batch_get():
+    """Get musical works, artists, genres and users by id, one query per type
+
+    The body maps types to lists of ids, e.g. {"musical_works": [1, 2], "artists": [7]};
+    users require an admin. `fields` and `expand` apply as on the list endpoints.
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not data:
+        return jsonify({'error': 'Request body must map types to lists of ids'}), 400
+    for name in data:
+        if name not in BATCH_TYPES:
+            return jsonify({'error': f'Unknown type: {name}. Must be one of: {", ".join(BATCH_TYPES)}'}), 400
+    try:
+        requested = {name: parse_ids(data[name], name) for name in BATCH_TYPES if name in data}
+        shapes = dict(zip(BATCH_TYPES, get_shapes(*(shape for shape, _ in BATCH_TYPES.values()))))
+    except (BatchError, ProjectionError) as e:
+        return jsonify({'error': str(e)}), 400
+    if 'users' in requested and not _is_admin():
+        return jsonify({'error': 'Admin access required'}), 403
+    
+    results = {}
+    for name, ids in requested.items():
+        shape, repository = shapes[name], BATCH_TYPES[name][1]
+        results[name] = batch_result(shape, repository.find_rows_by_ids(shape, ids), ids)
+    return jsonify(results), 200
@@ -0,0 +1,173 @@
+from flask import Blueprint, current_app, request, jsonify
+from flask_jwt_extended import jwt_required, verify_jwt_in_request
+from repositories.chart_repository import ChartRepository
+from repositories.genre_repository import GenreRepository
+from repositories.pagination import PaginationError
+from repositories.projections import CHART_ENTRY_ROW, TOP_LIST_ROW, TOP_LIST_ENTRY_ROW, ProjectionError
+from response_cache import cached_get, depends_on
+from query_budget import query_budget
+from routes.fields import get_shape
+from routes.pagination import get_page_args
+from routes.producer import require_producer
+
+charts_bp = Blueprint('charts', __name__)
+
+TOP_LIST_STATUSES = ('published', 'draft')
+
+
+def get_size(value, name):
+    """A chart length: CHART_SIZE when absent, capped at CHART_MAX_SIZE. Raises ValueError."""
+    if value is None:
+        return current_app.config['CHART_SIZE']
+    if isinstance(value, str):
+        try:
+            value = int(value)
+        except ValueError:
+            value = None
+    if not isinstance(value, int) or isinstance(value, bool) or value < 1:
+        raise ValueError(f'{name} must be a positive integer')
+    return min(value, current_app.config['CHART_MAX_SIZE'])
+
+
+def get_genre_id():
+    """The optional `genre_id` query parameter. Raises ValueError."""
+    genre_id = request.args.get('genre_id')
+    if genre_id is None:
+        return None
+    try:
+        return int(genre_id)
+    except ValueError:
+        raise ValueError('genre_id must be an integer')
+
+
+def ranked(shape, rows):
+    """Serialize chart rows with their 1-based position"""
+    return [{'position': position, **shape.serialize(row)} for position, row in enumerate(rows, 1)]
+
+
+# ============ LIVE CHARTS ============
+
+@charts_bp.route('/charts', methods=['GET'])
+@query_budget(1)
+@cached_get('works')
+def get_chart():
+    """Get the top musical works overall, or in `genre_id`, by Bayesian average rating
+    
+    `limit` sets the length (CHART_SIZE by default, at most CHART_MAX_SIZE).
+    Each lookup reads only the `limit` best entries of the materialized chart.
+    """
+    try:
+        shape = get_shape(CHART_ENTRY_ROW)
+        genre_id = get_genre_id()
+        limit = get_size(request.args.get('limit'), 'limit')
+    except (ProjectionError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    rows = ChartRepository.find_chart_rows(shape, genre_id, limit)
+    for row in rows:
+        depends_on(*(
+            f'{key.rpartition("__")[2]}:{related_id}' for key, related_id in shape.related_ids(row)
+            if key != 'musical_work'  # work changes invalidate 'works'
+        ))
+    return jsonify({'genre_id': genre_id, 'items': ranked(shape, rows)}), 200
+
+
+# ============ TOP LISTS ============
+
+@charts_bp.route('/top-lists', methods=['GET'])
+def get_top_lists():
+    """Get a page of published top lists, newest first, optionally for one `genre_id`
+    
+    Producers can pass status=draft to list the unpublished ones.
+    """
+    status = request.args.get('status', 'published')
+    if status not in TOP_LIST_STATUSES:
+        return jsonify({'error': f'Invalid status. Must be one of: {", ".join(TOP_LIST_STATUSES)}'}), 400
+    if status == 'draft':
+        verify_jwt_in_request()
+        if not require_producer():
+            return jsonify({'error': 'Producer or admin access required'}), 403
+    try:
+        shape = get_shape(TOP_LIST_ROW)
+        page = ChartRepository.find_top_list_page_rows(
+            shape, status == 'published', get_genre_id(), **get_page_args('-id')
+        )
+    except (PaginationError, ProjectionError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(page.to_dict(shape.serialize)), 200
+
+
+@charts_bp.route('/top-lists/<int:top_list_id>', methods=['GET'])
+def get_top_list(top_list_id):
+    """Get a top list with its entries; unpublished lists are visible to producers only
+    
+    `fields` and `expand` apply to the entries.
+    """
+    try:
+        entry_shape = get_shape(TOP_LIST_ENTRY_ROW)
+    except ProjectionError as e:
+        return jsonify({'error': str(e)}), 400
+    top_list = ChartRepository.find_top_list_row(TOP_LIST_ROW, top_list_id)
+    if top_list is None:
+        return jsonify({'error': 'Top list not found'}), 404
+    if top_list.published_at is None:
+        if verify_jwt_in_request(optional=True) is None or not require_producer():
+            return jsonify({'error': 'Top list not found'}), 404
+    
+    data = TOP_LIST_ROW.serialize(top_list)
+    data['entries'] = [
+        entry_shape.serialize(row) for row in ChartRepository.find_top_list_entry_rows(entry_shape, top_list_id)
+    ]
+    return jsonify(data), 200
+
+
+@charts_bp.route('/top-lists', methods=['POST'])
+@jwt_required()
+def create_top_list():
+    """Snapshot the current chart into a new top list (producer/admin only)
+    
+    Body: title, and optionally genre_id (the overall chart when absent),
+    size (CHART_SIZE by default) and publish (false keeps it private).
+    """
+    principal = require_producer()
+    if not principal:
+        return jsonify({'error': 'Producer or admin access required'}), 403
+    
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not isinstance(data.get('title'), str) or not data['title'].strip():
+        return jsonify({'error': 'Title is required'}), 400
+    genre_id = data.get('genre_id')
+    if genre_id is not None:
+        if not isinstance(genre_id, int) or isinstance(genre_id, bool):
+            return jsonify({'error': 'genre_id must be an integer'}), 400
+        if not GenreRepository.find_by_id(genre_id):
+            return jsonify({'error': 'Genre not found'}), 404
+    try:
+        size = get_size(data.get('size'), 'size')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if not isinstance(data.get('publish', False), bool):
+        return jsonify({'error': 'publish must be a boolean'}), 400
+    
+    top_list = ChartRepository.create_top_list(
+        data['title'].strip(), size, genre_id, created_by=principal.id, publish=data.get('publish', False)
+    )
+    return jsonify({
+        'message': 'Top list published successfully' if top_list.published_at else 'Top list saved as a draft',
+        'top_list': top_list.to_dict()
+    }), 201
+
+
+@charts_bp.route('/top-lists/<int:top_list_id>/publish', methods=['POST'])
+@jwt_required()
+def publish_top_list(top_list_id):
+    """Publish a draft top list (producer/admin only)"""
+    if not require_producer():
+        return jsonify({'error': 'Producer or admin access required'}), 403
+    
+    top_list = ChartRepository.publish(top_list_id)
+    if not top_list:
+        return jsonify({'error': 'Top list not found'}), 404
+    return jsonify({
+        'message': 'Top list published successfully',
+        'top_list': top_list.to_dict()
+    }), 200
@@ -0,0 +1,39 @@
+from flask import request
+from repositories.projections import ProjectionError
+
+
+def _names(parameter):
+    value = request.args.get(parameter)
+    if value is None:
+        return None
+    return [name.strip() for name in value.split(',') if name.strip()]
+
+
+def get_shape(shape):
+    """Narrow `shape` to the `fields` and `expand` query parameters.
+
+    `fields=id,title,artist.name` selects keys ('relation' or 'relation.key'
+    within a relation) and `expand=artist` the relations to include. Without
+    `expand`, only the relations `fields` names are included; without either,
+    everything is. Raises ProjectionError.
+    """
+    return shape.project(_names('fields'), _names('expand'))
+
+
+def get_shapes(*shapes):
+    """Like `get_shape` for a response holding several shapes, where each name need only apply to one of them"""
+    fields, expand = _names('fields'), _names('expand')
+    for names, known, message in (
+        (fields, [shape.field_names() for shape in shapes], 'Unknown field: {}'),
+        (expand, [set(shape.relations) for shape in shapes], 'Cannot expand {}'),
+    ):
+        for name in names or ():
+            if not any(name in choices for choices in known):
+                raise ProjectionError(message.format(name))
+    return [
+        shape.project(
+            None if fields is None else [name for name in fields if name in shape.field_names()],
+            None if expand is None else [name for name in expand if name in shape.relations]
+        )
+        for shape in shapes
+    ]
@@ -0,0 +1,17 @@
+from flask import request
+from repositories.pagination import PaginationError
+
+
+def get_page_args(default_sort='id', prefix=''):
+    """Read `limit`, `after` and `sort` query parameters for keyset pagination, each name preceded by `prefix`"""
+    limit = request.args.get(f'{prefix}limit')
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except ValueError:
+            raise PaginationError(f'{prefix}limit must be a positive integer')
+    return {
+        'limit': limit,
+        'after': request.args.get(f'{prefix}after') or None,
+        'sort': request.args.get(f'{prefix}sort', default_sort)
+    }
@@ -1,38 +1,72 @@
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from repositories.genre_repository import GenreRepository
+import io
+from datetime import datetime, timezone
+from itertools import islice
+from tempfile import SpooledTemporaryFile
+
+from flask import Blueprint, Response, current_app, request, jsonify, stream_with_context
+from werkzeug.wsgi import wrap_file
+from flask_jwt_extended import jwt_required
+from repositories.genre_repository import GenreRepository, GenreInUse
 from repositories.artist_repository import ArtistRepository
 from repositories.musical_work_repository import MusicalWorkRepository
-from repositories.user_repository import UserRepository
-from models import Review
+from repositories.pagination import PaginationError
+from repositories.loading import REVIEW_WITH_USER
+from repositories.projections import (
+    GENRE_ROW, ARTIST_ROW, WORK_ROW_WITH_ARTIST_AND_GENRE, WORK_ROW_DETAILS, REVIEW_ROW_WITH_USER, ProjectionError
+)
+from search_index import get_catalog_indexes, reindex_work, reindex_works
+from principal import current_principal
+from response_cache import cached_get, depends_on, invalidate
+from query_budget import query_budget
+from database import statement_timeout, use_primary
+from routes.pagination import get_page_args
+from routes.fields import get_shape
+from routes.batch import BatchError, get_ids, batch_result
+from catalog_import import CatalogImporter
 
 producer_bp = Blueprint('producer', __name__)
 
+BATCH_FILTER_FIELDS = ('musical_work_id', 'user_id', 'rating')
+
 def require_producer():
-    """Check if user is a producer or admin"""
-    user_id = get_jwt_identity()
-    user = UserRepository.find_by_id(user_id)
-    if not user or user.role not in ['producer', 'admin']:
+    """Check if user is an active producer or admin"""
+    principal = current_principal()
+    if not principal or not principal.is_active or principal.role not in ['producer', 'admin']:
         return None
-    return user
+    return principal
 
 
 # ============ GENRE ROUTES ============
 
 @producer_bp.route('/genres', methods=['GET'])
+@query_budget(1)
+@cached_get('genres')
 def get_genres():
-    """Get all genres"""
-    genres = GenreRepository.find_all()
-    return jsonify([genre.to_dict() for genre in genres]), 200
+    """Get a page of genres, or with `ids` the genres with those ids keyed by id"""
+    try:
+        shape = get_shape(GENRE_ROW)
+        ids = get_ids()
+        if ids is not None:
+            rows = GenreRepository.find_rows_by_ids(shape, ids)
+            return jsonify(batch_result(shape, rows, ids)), 200
+        page = GenreRepository.find_page_rows(shape, **get_page_args())
+    except (PaginationError, ProjectionError, BatchError) as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(page.to_dict(shape.serialize)), 200
 
 
 @producer_bp.route('/genres/<int:genre_id>', methods=['GET'])
+@cached_get('genre:{genre_id}')
 def get_genre(genre_id):
     """Get a specific genre"""
-    genre = GenreRepository.find_by_id(genre_id)
-    if not genre:
+    try:
+        shape = get_shape(GENRE_ROW)
+    except ProjectionError as e:
+        return jsonify({'error': str(e)}), 400
+    genre = GenreRepository.find_row_by_id(shape, genre_id)
+    if genre is None:
         return jsonify({'error': 'Genre not found'}), 404
-    return jsonify(genre.to_dict()), 200
+    return jsonify(shape.serialize(genre)), 200
 
 
 @producer_bp.route('/genres', methods=['POST'])
@@ -51,6 +85,9 @@ def create_genre():
         return jsonify({'error': 'Genre already exists'}), 400
     
     genre = GenreRepository.create(data['name'], data.get('description'))
+    invalidate('genres', f'genre:{genre.id}')
+    for index in get_catalog_indexes():
+        index.add_genre(genre)
     return jsonify(genre.to_dict()), 201
 
 
@@ -71,6 +108,9 @@ def update_genre(genre_id):
         name=data.get('name'),
         description=data.get('description')
     )
+    invalidate('genres', f'genre:{genre_id}')
+    for index in get_catalog_indexes():
+        index.add_genre(updated_genre)
     
     return jsonify(updated_genre.to_dict()), 200
 
@@ -82,7 +122,14 @@ def delete_genre(genre_id):
     if not require_producer():
         return jsonify({'error': 'Producer or admin access required'}), 403
     
-    if GenreRepository.delete(genre_id):
+    try:
+        deleted = GenreRepository.delete(genre_id)
+    except GenreInUse:
+        return jsonify({'error': 'Genre is still used by musical works or top lists'}), 400
+    if deleted:
+        invalidate('genres', f'genre:{genre_id}')
+        for index in get_catalog_indexes():
+            index.remove_genre(genre_id)
         return jsonify({'message': 'Genre deleted successfully'}), 200
     return jsonify({'error': 'Genre not found'}), 404
 
@@ -90,19 +137,34 @@ def delete_genre(genre_id):
 # ============ ARTIST ROUTES ============
 
 @producer_bp.route('/artists', methods=['GET'])
+@query_budget(1)
+@cached_get('artists')
 def get_artists():
-    """Get all artists"""
-    artists = ArtistRepository.find_all()
-    return jsonify([artist.to_dict() for artist in artists]), 200
+    """Get a page of artists, or with `ids` the artists with those ids keyed by id"""
+    try:
+        shape = get_shape(ARTIST_ROW)
+        ids = get_ids()
+        if ids is not None:
+            rows = ArtistRepository.find_rows_by_ids(shape, ids)
+            return jsonify(batch_result(shape, rows, ids)), 200
+        page = ArtistRepository.find_page_rows(shape, **get_page_args())
+    except (PaginationError, ProjectionError, BatchError) as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(page.to_dict(shape.serialize)), 200
 
 
 @producer_bp.route('/artists/<int:artist_id>', methods=['GET'])
+@cached_get('artist:{artist_id}')
 def get_artist(artist_id):
     """Get a specific artist"""
-    artist = ArtistRepository.find_by_id(artist_id)
-    if not artist:
+    try:
+        shape = get_shape(ARTIST_ROW)
+    except ProjectionError as e:
+        return jsonify({'error': str(e)}), 400
+    artist = ArtistRepository.find_row_by_id(shape, artist_id)
+    if artist is None:
         return jsonify({'error': 'Artist not found'}), 404
-    return jsonify(artist.to_dict()), 200
+    return jsonify(shape.serialize(artist)), 200
 
 
 @producer_bp.route('/artists', methods=['POST'])
@@ -121,6 +183,9 @@ def create_artist():
         data.get('biography'),
         data.get('multimedia')
     )
+    invalidate('artists', f'artist:{artist.id}')
+    for index in get_catalog_indexes():
+        index.add_artist(artist)
     return jsonify(artist.to_dict()), 201
 
 
@@ -142,6 +207,9 @@ def update_artist(artist_id):
         biography=data.get('biography'),
         multimedia=data.get('multimedia')
     )
+    invalidate('artists', f'artist:{artist_id}')
+    for index in get_catalog_indexes():
+        index.add_artist(updated_artist)
     
     return jsonify(updated_artist.to_dict()), 200
 
@@ -154,6 +222,9 @@ def delete_artist(artist_id):
         return jsonify({'error': 'Producer or admin access required'}), 403
     
     if ArtistRepository.delete(artist_id):
+        invalidate('artists', f'artist:{artist_id}')
+        for index in get_catalog_indexes():
+            index.remove_artist(artist_id)
         return jsonify({'message': 'Artist deleted successfully'}), 200
     return jsonify({'error': 'Artist not found'}), 404
 
@@ -161,19 +232,121 @@ def delete_artist(artist_id):
 # ============ MUSICAL WORK ROUTES ============
 
 @producer_bp.route('/musical-works', methods=['GET'])
+@query_budget(1)
+@cached_get('works')
 def get_musical_works():
-    """Get all musical works"""
-    works = MusicalWorkRepository.find_all()
-    return jsonify([work.to_dict(include_artist=True, include_genre=True) for work in works]), 200
+    """Get a page of musical works, or with `ids` the works with those ids keyed by id"""
+    try:
+        shape = get_shape(WORK_ROW_WITH_ARTIST_AND_GENRE)
+        ids = get_ids()
+        if ids is not None:
+            rows = MusicalWorkRepository.find_rows_by_ids(shape, ids)
+            for work in rows:
+                depends_on(*(f'{key}:{related_id}' for key, related_id in shape.related_ids(work)))
+            return jsonify(batch_result(shape, rows, ids)), 200
+        page = MusicalWorkRepository.find_page_rows(shape, **get_page_args())
+    except (PaginationError, ProjectionError, BatchError) as e:
+        return jsonify({'error': str(e)}), 400
+    for work in page.items:
+        depends_on(*(f'{key}:{related_id}' for key, related_id in shape.related_ids(work)))
+    return jsonify(page.to_dict(shape.serialize)), 200
+
+
+@producer_bp.route('/musical-works/export', methods=['GET'])
+@statement_timeout('bulk')
+def export_musical_works():
+    """Stream musical works with their artist and genre as NDJSON or a JSON array
+
+    Optional filters: genre_id, artist_id, and since (ISO timestamp, works
+    created at or after it; UTC unless it carries an offset). `fields` and `expand` narrow each work.
+    """
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in ('ndjson', 'json'):
+        return jsonify({'error': 'format must be ndjson or json'}), 400
+    try:
+        shape = get_shape(WORK_ROW_WITH_ARTIST_AND_GENRE)
+    except ProjectionError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    filters = {}
+    for name in ('genre_id', 'artist_id'):
+        if request.args.get(name) is not None:
+            try:
+                filters[name] = int(request.args[name])
+            except ValueError:
+                return jsonify({'error': f'{name} must be an integer'}), 400
+    if request.args.get('since'):
+        try:
+            since = datetime.fromisoformat(request.args['since'])
+        except ValueError:
+            return jsonify({'error': 'since must be an ISO 8601 timestamp'}), 400
+        if since.tzinfo is not None:
+            since = since.astimezone(timezone.utc).replace(tzinfo=None)  # columns hold naive UTC
+        filters['created_since'] = since
+    
+    batch_size = current_app.config['EXPORT_BATCH_SIZE']
+    works = MusicalWorkRepository.iter_rows(shape, batch_size, **filters)
+    mimetype = 'application/x-ndjson' if export_format == 'ndjson' else 'application/json'
+    return Response(stream_with_context(export_chunks(works, shape, export_format, batch_size)), mimetype=mimetype)
+
+
+def export_chunks(works, shape, export_format, batch_size):
+    """Serialize `works` rows of `shape` one batch at a time, yielding one response chunk per batch"""
+    dumps = current_app.json.dumps
+    serialize = shape.serialize
+    works = iter(works)
+    separator = '\n' if export_format == 'ndjson' else ','
+    if export_format == 'json':
+        yield '['
+    first = True
+    while True:
+        batch = list(islice(works, batch_size))
+        if not batch:
+            break
+        chunk = separator.join(dumps(serialize(work)) for work in batch)
+        if export_format == 'ndjson':
+            yield chunk + '\n'
+        else:
+            yield chunk if first else ',' + chunk
+        first = False
+    if export_format == 'json':
+        yield ']'
 
 
 @producer_bp.route('/musical-works/<int:work_id>', methods=['GET'])
+@query_budget(2)
+@cached_get('work:{work_id}')
 def get_musical_work(work_id):
-    """Get a specific musical work"""
-    work = MusicalWorkRepository.find_by_id(work_id)
-    if not work:
+    """Get a specific musical work with the first page of its approved reviews
+    
+    `reviews_sort` (newest, oldest, highest or lowest) and `reviews_limit`
+    choose the page; `reviews_next_cursor` continues it at
+    GET /musical-works/<id>/reviews with the same sort.
+    """
+    from repositories.review_repository import ReviewRepository
+    try:
+        shape = get_shape(WORK_ROW_DETAILS)
+        review_args = get_page_args('newest', prefix='reviews_')
+    except (PaginationError, ProjectionError) as e:
+        return jsonify({'error': str(e)}), 400
+    review_args['after'] = None
+    if review_args['limit'] is None:
+        review_args['limit'] = current_app.config['WORK_DETAIL_REVIEWS']
+    
+    work = MusicalWorkRepository.find_row_by_id(shape, work_id)
+    if work is None:
         return jsonify({'error': 'Musical work not found'}), 404
-    return jsonify(work.to_dict(include_artist=True, include_genre=True, include_reviews=True, approved_reviews_only=False)), 200
+    depends_on(*(f'{key}:{related_id}' for key, related_id in shape.related_ids(work)))
+    data = shape.serialize(work)
+    reviews = shape.collection('reviews')
+    if reviews is not None:
+        try:
+            page = ReviewRepository.find_approved_page_rows(reviews, work_id, **review_args)
+        except PaginationError as e:
+            return jsonify({'error': str(e)}), 400
+        data['reviews'] = [reviews.serialize(review) for review in page.items]
+        data['reviews_next_cursor'] = page.next_cursor
+    return jsonify(data), 200
 
 
 @producer_bp.route('/musical-works', methods=['POST'])
@@ -193,6 +366,9 @@ def create_musical_work():
         data['artist_id'],
         data.get('description')
     )
+    invalidate('works', f'work:{work.id}')
+    for index in get_catalog_indexes():
+        index.add_work(work)
     return jsonify(work.to_dict(include_artist=True, include_genre=True)), 201
 
 
@@ -215,6 +391,9 @@ def update_musical_work(work_id):
         artist_id=data.get('artist_id'),
         description=data.get('description')
     )
+    invalidate('works', f'work:{work_id}')
+    for index in get_catalog_indexes():
+        index.add_work(updated_work)
     
     return jsonify(updated_work.to_dict(include_artist=True, include_genre=True)), 200
 
@@ -227,22 +406,98 @@ def delete_musical_work(work_id):
         return jsonify({'error': 'Producer or admin access required'}), 403
     
     if MusicalWorkRepository.delete(work_id):
+        invalidate('works', f'work:{work_id}')
+        for index in get_catalog_indexes():
+            index.remove_work(work_id)
         return jsonify({'message': 'Musical work deleted successfully'}), 200
     return jsonify({'error': 'Musical work not found'}), 404
 
 
+# ============ BULK IMPORT ============
+
+@producer_bp.route('/import', methods=['POST'])
+@statement_timeout('bulk')
+@jwt_required()
+def import_catalog():
+    """Import genres, artists and works from an NDJSON body (producer/admin only)
+
+    Responds with NDJSON: one result per input record, in input order, then a
+    summary line. The report is spooled to disk when large.
+    """
+    if not require_producer():
+        return jsonify({'error': 'Producer or admin access required'}), 403
+    
+    lines = io.BufferedReader(request.stream, 64 * 1024)
+    report = SpooledTemporaryFile(max_size=1024 * 1024)
+    CatalogImporter(current_app.config['IMPORT_CHUNK_SIZE']).run(lines, report)
+    report.seek(0)
+    return Response(wrap_file(request.environ, report), mimetype='application/x-ndjson', direct_passthrough=True)
+
+
 # ============ REVIEW APPROVAL ROUTES ============
 
 @producer_bp.route('/reviews/pending', methods=['GET'])
 @jwt_required()
+@query_budget(2)
+@use_primary
 def get_pending_reviews():
-    """Get all pending reviews (producer/admin only)"""
+    """Get a page of pending reviews, oldest first (producer/admin only)"""
     if not require_producer():
         return jsonify({'error': 'Producer or admin access required'}), 403
     
     from repositories.review_repository import ReviewRepository
-    pending_reviews = Review.query.filter_by(is_approved=False).all()
-    return jsonify([review.to_dict(include_user=True) for review in pending_reviews]), 200
+    try:
+        shape = get_shape(REVIEW_ROW_WITH_USER)
+        page_args = get_page_args()
+        page_args.pop('sort')  # the queue is always oldest first
+        page = ReviewRepository.find_pending_page_rows(shape, **page_args)
+    except (PaginationError, ProjectionError) as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(page.to_dict(shape.serialize)), 200
+
+
+@producer_bp.route('/reviews/pending/claim', methods=['POST'])
+@jwt_required()
+@query_budget(4)
+def claim_pending_reviews():
+    """Lease a batch of the oldest unclaimed pending reviews to the caller (producer/admin only)"""
+    moderator = require_producer()
+    if not moderator:
+        return jsonify({'error': 'Producer or admin access required'}), 403
+    
+    config = current_app.config
+    data = request.get_json(silent=True) or {}
+    limit = data.get('limit', config['MODERATION_CLAIM_SIZE'])
+    if not isinstance(limit, int) or isinstance(limit, bool) or limit < 1:
+        return jsonify({'error': 'limit must be a positive integer'}), 400
+    
+    from repositories.review_repository import ReviewRepository
+    reviews = ReviewRepository.claim_pending(
+        moderator.id, min(limit, config['MODERATION_CLAIM_MAX']), config['MODERATION_LEASE_SECONDS'],
+        load=REVIEW_WITH_USER
+    )
+    return jsonify({
+        'items': [review.to_dict(include_user=True) for review in reviews],
+        'lease_seconds': config['MODERATION_LEASE_SECONDS']
+    }), 200
+
+
+@producer_bp.route('/reviews/pending/release', methods=['POST'])
+@jwt_required()
+def release_pending_reviews():
+    """Give back the caller's leases on the given reviews (producer/admin only)"""
+    moderator = require_producer()
+    if not moderator:
+        return jsonify({'error': 'Producer or admin access required'}), 403
+    
+    data = request.get_json(silent=True) or {}
+    review_ids = data.get('ids')
+    if not is_id_list(review_ids):
+        return jsonify({'error': 'ids must be a list of integers'}), 400
+    
+    from repositories.review_repository import ReviewRepository
+    released = ReviewRepository.release_claims(moderator.id, review_ids)
+    return jsonify({'released': released}), 200
 
 
 @producer_bp.route('/reviews/<int:review_id>/approve', methods=['POST'])
@@ -253,11 +508,15 @@ def approve_review(review_id):
         return jsonify({'error': 'Producer or admin access required'}), 403
     
     from repositories.review_repository import ReviewRepository
-    review = ReviewRepository.approve(review_id)
+    review, approved = ReviewRepository.approve(review_id, load=REVIEW_WITH_USER)
     
     if not review:
         return jsonify({'error': 'Review not found'}), 404
     
+    invalidate('works', f'work:{review.musical_work_id}')
+    if approved:
+        reindex_work(review.musical_work_id)
+    
     return jsonify({
         'message': 'Review approved successfully',
         'review': review.to_dict(include_user=True)
@@ -272,8 +531,101 @@ def reject_review(review_id):
         return jsonify({'error': 'Producer or admin access required'}), 403
     
     from repositories.review_repository import ReviewRepository
+    rejected = ReviewRepository.reject(review_id)
+    
+    if not rejected:
+        return jsonify({'error': 'Review not found'}), 404
+    
+    invalidate('works', f'work:{rejected.musical_work_id}')
+    if rejected.is_approved:
+        reindex_work(rejected.musical_work_id)
+    return jsonify({'message': 'Review rejected and deleted successfully'}), 200
+
+
+def is_id_list(value):
+    """Check that a JSON value is a list of integer ids"""
+    return isinstance(value, list) and all(
+        isinstance(item, int) and not isinstance(item, bool) for item in value
+    )
+
+
+def get_batch_selection():
+    """Read a batch moderation body: {"ids": [...]} or {"filter": {...}} over pending reviews
+    
+    Returns (review_ids, criteria, error); exactly one of review_ids and criteria is set.
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or ('ids' in data) == ('filter' in data):
+        return None, None, 'Provide either ids or filter'
+    
+    if 'ids' in data:
+        review_ids = data['ids']
+        if not is_id_list(review_ids):
+            return None, None, 'ids must be a list of integers'
+        if len(review_ids) > current_app.config['MODERATION_BATCH_MAX_IDS']:
+            return None, None, f'At most {current_app.config["MODERATION_BATCH_MAX_IDS"]} ids per request'
+        return list(dict.fromkeys(review_ids)), None, None
+    
+    criteria = data['filter']
+    if not isinstance(criteria, dict) or not criteria:
+        return None, None, f'filter must be an object with any of: {", ".join(BATCH_FILTER_FIELDS)}'
+    for field, value in criteria.items():
+        if field not in BATCH_FILTER_FIELDS:
+            return None, None, f'Invalid filter field. Must be one of: {", ".join(BATCH_FILTER_FIELDS)}'
+        if not isinstance(value, int) or isinstance(value, bool):
+            return None, None, f'{field} must be an integer'
+    return None, criteria, None
+
+
+def moderation_response(outcomes, work_ids):
+    """Invalidate and reindex the affected works, then report per-review outcomes"""
+    if work_ids:
+        invalidate('works', *(f'work:{musical_work_id}' for musical_work_id in work_ids))
+        reindex_works(work_ids)
+    return jsonify({
+        'results': [{'id': review_id, 'status': status} for review_id, status in outcomes.items()]
+    }), 200
+
+
+@producer_bp.route('/reviews/approve', methods=['POST'])
+@jwt_required()
+def approve_reviews():
+    """Approve a batch of reviews by id or by filter (producer/admin only)
+    
+    A filter matches the oldest pending reviews not leased to another
+    moderator, at most MODERATION_BATCH_MAX_IDS of them per request.
+    """
+    moderator = require_producer()
+    if not moderator:
+        return jsonify({'error': 'Producer or admin access required'}), 403
+    
+    review_ids, criteria, error = get_batch_selection()
+    if error:
+        return jsonify({'error': error}), 400
     
-    if ReviewRepository.reject(review_id):
-        return jsonify({'message': 'Review rejected and deleted successfully'}), 200
-    return jsonify({'error': 'Review not found'}), 404
+    from repositories.review_repository import ReviewRepository
+    return moderation_response(*ReviewRepository.approve_many(
+        review_ids, criteria, moderator.id, current_app.config['MODERATION_BATCH_MAX_IDS']
+    ))
+
 
+@producer_bp.route('/reviews/reject', methods=['POST'])
+@jwt_required()
+def reject_reviews():
+    """Reject (delete) a batch of reviews by id or by filter (producer/admin only)
+    
+    A filter matches the oldest pending reviews not leased to another
+    moderator, at most MODERATION_BATCH_MAX_IDS of them per request.
+    """
+    moderator = require_producer()
+    if not moderator:
+        return jsonify({'error': 'Producer or admin access required'}), 403
+    
+    review_ids, criteria, error = get_batch_selection()
+    if error:
+        return jsonify({'error': error}), 400
+    
+    from repositories.review_repository import ReviewRepository
+    return moderation_response(*ReviewRepository.reject_many(
+        review_ids, criteria, moderator.id, current_app.config['MODERATION_BATCH_MAX_IDS']
+    ))
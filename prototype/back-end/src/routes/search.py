@@ -1,11 +1,27 @@
 from flask import Blueprint, request, jsonify
 from repositories.artist_repository import ArtistRepository
 from repositories.musical_work_repository import MusicalWorkRepository
+from repositories.projections import ARTIST_ROW, WORK_ROW_WITH_ARTIST_AND_GENRE, ProjectionError
+from repositories.pagination import PaginationError
+from routes.pagination import get_page_args
+from routes.fields import get_shape, get_shapes
+from search_index import get_search_index, get_suggestion_index
+from query_budget import query_budget
+from database import statement_timeout
 
 search_bp = Blueprint('search', __name__)
 
 
+def get_search_page_args():
+    """Read `limit` and `after`; search results are always ranked by relevance"""
+    args = get_page_args()
+    del args['sort']
+    return args
+
+
 @search_bp.route('/search', methods=['GET'])
+@query_budget(2)
+@statement_timeout('search')
 def search():
     """Search for artists and musical works"""
     query = request.args.get('q', '')
@@ -14,26 +30,67 @@ def search():
     if not query:
         return jsonify({'error': 'Search query is required'}), 400
     
+    try:
+        page_args = get_search_page_args()
+        artist_shape, work_shape = get_shapes(ARTIST_ROW, WORK_ROW_WITH_ARTIST_AND_GENRE)
+    except (PaginationError, ProjectionError) as e:
+        return jsonify({'error': str(e)}), 400
+    page_args.pop('after')  # each section pages independently via its own endpoint
+    index = get_search_index()
+    
     results = {
         'artists': [],
-        'musical_works': []
+        'musical_works': [],
+        'next_cursors': {
+            'artists': None,
+            'musical_works': None
+        }
     }
     
     if search_type in ['all', 'artists']:
-        artists = ArtistRepository.search_by_name(query)
-        results['artists'] = [artist.to_dict() for artist in artists]
+        if index:
+            page = index.search_artists(query, **page_args)
+            results['artists'] = [artist_shape.pick(artist) for artist in page.items]
+        else:
+            page = ArtistRepository.search_rows_by_name(artist_shape, query, **page_args)
+            results['artists'] = [artist_shape.serialize(artist) for artist in page.items]
+        results['next_cursors']['artists'] = page.next_cursor
     
     if search_type in ['all', 'works']:
-        works = MusicalWorkRepository.search_by_title(query)
-        results['musical_works'] = [
-            work.to_dict(include_artist=True, include_genre=True) 
-            for work in works
-        ]
+        if index:
+            page = index.search_works(query, **page_args)
+            results['musical_works'] = [work_shape.pick(work) for work in page.items]
+        else:
+            page = MusicalWorkRepository.search_rows_by_title(work_shape, query, **page_args)
+            results['musical_works'] = [work_shape.serialize(work) for work in page.items]
+        results['next_cursors']['musical_works'] = page.next_cursor
     
     return jsonify(results), 200
 
 
+@search_bp.route('/search/suggest', methods=['GET'])
+@query_budget(0)
+@statement_timeout('search')
+def suggest():
+    """Suggest artist names and work titles for a typed prefix"""
+    query = request.args.get('q', '')
+    
+    if not query:
+        return jsonify({'error': 'Search query is required'}), 400
+    
+    try:
+        limit = int(request.args.get('limit', 8))
+    except ValueError:
+        return jsonify({'error': 'limit must be a positive integer'}), 400
+    if limit < 1:
+        return jsonify({'error': 'limit must be a positive integer'}), 400
+    
+    return jsonify(get_suggestion_index().suggest(query, limit)), 200
+
+
 @search_bp.route('/search/artists', methods=['GET'])
+@query_budget(1)
+@statement_timeout('search')
 def search_artists():
     """Search for artists only"""
     query = request.args.get('q', '')
@@ -41,11 +98,20 @@ def search_artists():
     if not query:
         return jsonify({'error': 'Search query is required'}), 400
     
-    artists = ArtistRepository.search_by_name(query)
-    return jsonify([artist.to_dict() for artist in artists]), 200
+    index = get_search_index()
+    try:
+        shape = get_shape(ARTIST_ROW)
+        if index:
+            return jsonify(index.search_artists(query, **get_search_page_args()).to_dict(shape.pick)), 200
+        page = ArtistRepository.search_rows_by_name(shape, query, **get_search_page_args())
+    except (PaginationError, ProjectionError) as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(page.to_dict(shape.serialize)), 200
 
 
 @search_bp.route('/search/musical-works', methods=['GET'])
+@query_budget(1)
+@statement_timeout('search')
 def search_musical_works():
     """Search for musical works only"""
     query = request.args.get('q', '')
@@ -53,9 +119,12 @@ def search_musical_works():
     if not query:
         return jsonify({'error': 'Search query is required'}), 400
     
-    works = MusicalWorkRepository.search_by_title(query)
-    return jsonify([
-        work.to_dict(include_artist=True, include_genre=True) 
-        for work in works
-    ]), 200
-
+    index = get_search_index()
+    try:
+        shape = get_shape(WORK_ROW_WITH_ARTIST_AND_GENRE)
+        if index:
+            return jsonify(index.search_works(query, **get_search_page_args()).to_dict(shape.pick)), 200
+        page = MusicalWorkRepository.search_rows_by_title(shape, query, **get_search_page_args())
+    except (PaginationError, ProjectionError) as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(page.to_dict(shape.serialize)), 200
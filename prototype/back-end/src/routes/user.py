@@ -1,38 +1,52 @@
 from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from repositories.review_repository import ReviewRepository
-from repositories.musical_work_repository import MusicalWorkRepository
-from repositories.user_repository import UserRepository
+from flask_jwt_extended import jwt_required
+from repositories.review_repository import ReviewRepository, ReviewExists, MusicalWorkNotFound, UserNotFound
+from repositories.projections import REVIEW_ROW_WITH_USER, ProjectionError
+from repositories.pagination import PaginationError
+from routes.fields import get_shape
+from routes.pagination import get_page_args
+from search_index import reindex_work
+from principal import current_principal
+from response_cache import invalidate
+from query_budget import query_budget
 
 user_bp = Blueprint('user', __name__)
 
 def require_authenticated():
-    """Check if user is authenticated"""
-    user_id = get_jwt_identity()
-    user = UserRepository.find_by_id(user_id)
-    if not user:
+    """Check if user is authenticated and active"""
+    principal = current_principal()
+    if not principal or not principal.is_active:
         return None
-    return user
+    return principal
 
 
 # ============ REVIEW ROUTES ============
 
 @user_bp.route('/reviews', methods=['GET'])
 @jwt_required()
+@query_budget(2)
 def get_reviews():
     """Get all reviews for the authenticated user"""
     user = require_authenticated()
     if not user:
         return jsonify({'error': 'Authentication required'}), 401
     
-    reviews = ReviewRepository.find_by_user(user.id)
-    return jsonify([review.to_dict(include_user=True) for review in reviews]), 200
+    try:
+        shape = get_shape(REVIEW_ROW_WITH_USER)
+    except ProjectionError as e:
+        return jsonify({'error': str(e)}), 400
+    reviews = ReviewRepository.find_rows_by_user(shape, user.id)
+    return jsonify([shape.serialize(review) for review in reviews]), 200
 
 
 @user_bp.route('/reviews', methods=['POST'])
 @jwt_required()
 def create_review():
-    """Create a new review (authenticated users only)"""
+    """Create a new review (authenticated users only)
+    
+    With "upsert": true, an existing review by the user for the work gets the
+    new rating (and comment, when given) instead of being rejected.
+    """
     user = require_authenticated()
     if not user:
         return jsonify({'error': 'Authentication required'}), 401
@@ -47,25 +61,27 @@ def create_review():
         return jsonify({'error': 'Rating must be between 1 and 5'}), 400
     
     musical_work_id = data['musical_work_id']
-    
-    # Check if work exists
-    work = MusicalWorkRepository.find_by_id(musical_work_id)
-    if not work:
+    if not isinstance(musical_work_id, int) or isinstance(musical_work_id, bool):
+        return jsonify({'error': 'musical_work_id must be an integer'}), 400
+    
+    # The unique index and foreign key replace reading the work and any existing review first
+    try:
+        if data.get('upsert'):
+            review, created = ReviewRepository.upsert_rating(user.id, musical_work_id, rating, data.get('comment'))
+        else:
+            review, created = ReviewRepository.create(user.id, musical_work_id, rating, data.get('comment')), True
+    except MusicalWorkNotFound:
         return jsonify({'error': 'Musical work not found'}), 404
-    
-    # Check if user already reviewed this work
-    existing_review = ReviewRepository.find_user_review_for_work(user.id, musical_work_id)
-    if existing_review:
+    except UserNotFound:
+        return jsonify({'error': 'Authentication required'}), 401
+    except ReviewExists:
         return jsonify({'error': 'You have already reviewed this work'}), 400
     
-    review = ReviewRepository.create(
-        user.id,
-        musical_work_id,
-        rating,
-        data.get('comment')
-    )
+    if review.is_approved:
+        invalidate('works', f'work:{musical_work_id}')
+        reindex_work(musical_work_id)
     
-    return jsonify(review.to_dict(include_user=True)), 201
+    return jsonify(review.to_dict(include_user=True)), 201 if created else 200
 
 
 @user_bp.route('/reviews/<int:review_id>', methods=['GET'])
@@ -116,6 +132,9 @@ def update_review(review_id):
         rating=data.get('rating'),
         comment=data.get('comment')
     )
+    invalidate('works', f'work:{updated_review.musical_work_id}')
+    if updated_review.is_approved and data.get('rating') is not None:
+        reindex_work(updated_review.musical_work_id)
     
     return jsonify(updated_review.to_dict(include_user=True)), 200
 
@@ -136,7 +155,11 @@ def delete_review(review_id):
     if review.user_id != user.id:
         return jsonify({'error': 'Unauthorized'}), 403
     
-    if ReviewRepository.delete(review_id):
+    deleted = ReviewRepository.delete(review_id)
+    if deleted:
+        invalidate('works', f'work:{deleted.musical_work_id}')
+        if deleted.is_approved:
+            reindex_work(deleted.musical_work_id)
         return jsonify({'message': 'Review deleted successfully'}), 200
     return jsonify({'error': 'Failed to delete review'}), 400
 
@@ -144,8 +167,13 @@ def delete_review(review_id):
 # ============ WORK DETAILS ROUTE ============
 
 @user_bp.route('/musical-works/<int:work_id>/reviews', methods=['GET'])
+@query_budget(1)
 def get_work_reviews(work_id):
-    """Get all approved reviews for a musical work (public)"""
-    reviews = ReviewRepository.find_by_musical_work(work_id, approved_only=True)
-    return jsonify([review.to_dict(include_user=True) for review in reviews]), 200
+    """Get a page of approved reviews for a musical work (public); sort is newest, oldest, highest or lowest"""
+    try:
+        shape = get_shape(REVIEW_ROW_WITH_USER)
+        page = ReviewRepository.find_approved_page_rows(shape, work_id, **get_page_args('newest'))
+    except (PaginationError, ProjectionError) as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(page.to_dict(shape.serialize)), 200
 
@@ -2,10 +2,13 @@
 """Main entry point for the Audiotheca backend application"""
 
 from app import create_app
+from search_index import warm_catalog_indexes
 import os
 
 app = create_app(os.getenv('FLASK_ENV', 'default'))
 
 if __name__ == '__main__':
+    with app.app_context():
+        warm_catalog_indexes()
     app.run(debug=True, host='0.0.0.0', port=8080)
 
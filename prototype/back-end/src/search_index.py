@@ -0,0 +1,539 @@
+"""In-memory inverted index for artist and musical work search"""
+
+import heapq
+import re
+import threading
+import unicodedata
+from array import array
+from bisect import bisect_left, insort
+
+from flask import current_app
+from repositories.pagination import offset_window, offset_page
+from query_budget import unbudgeted
+
+_TOKEN_RE = re.compile(r'\w+')
+
+# Letters NFKD does not decompose into a base letter plus accents
+_FOLD = str.maketrans({'đ': 'd', 'ø': 'o', 'ł': 'l', 'æ': 'ae', 'œ': 'oe'})
+
+# Score of a prefix match relative to a whole-token match
+PREFIX_WEIGHT = 0.5
+
+
+def normalize(text):
+    """Casefold and strip accents so 'Đorđe' and 'dorde' index the same"""
+    text = unicodedata.normalize('NFKD', text.casefold().translate(_FOLD))
+    return ''.join(ch for ch in text if not unicodedata.combining(ch))
+
+
+def tokenize(text):
+    """Split text into normalized word tokens"""
+    return _TOKEN_RE.findall(normalize(text)) if text else []
+
+
+class _Field:
+    """Postings for one text field: token -> sorted array of document ids"""
+
+    def __init__(self, weight):
+        self.weight = weight
+        self.postings = {}
+        self.vocabulary = []  # sorted tokens, for prefix lookups
+        self.doc_tokens = {}
+
+    def build(self, docs):
+        """Load (doc_id, text) pairs into an empty field, sorting the vocabulary once"""
+        postings = {}
+        for doc_id, text in docs:
+            tokens = set(tokenize(text))
+            self.doc_tokens[doc_id] = tokens
+            for token in tokens:
+                postings.setdefault(token, []).append(doc_id)
+        self.postings = {token: array('i', sorted(doc_ids)) for token, doc_ids in postings.items()}
+        self.vocabulary = sorted(self.postings)
+
+    def add(self, doc_id, text):
+        tokens = set(tokenize(text))
+        self.doc_tokens[doc_id] = tokens
+        for token in tokens:
+            posting = self.postings.get(token)
+            if posting is None:
+                self.postings[token] = array('i', [doc_id])
+                insort(self.vocabulary, token)
+            else:
+                position = bisect_left(posting, doc_id)
+                if position == len(posting) or posting[position] != doc_id:
+                    posting.insert(position, doc_id)
+
+    def remove(self, doc_id):
+        for token in self.doc_tokens.pop(doc_id, ()):
+            posting = self.postings[token]
+            position = bisect_left(posting, doc_id)
+            if position < len(posting) and posting[position] == doc_id:
+                del posting[position]
+            if not posting:
+                del self.postings[token]
+                del self.vocabulary[bisect_left(self.vocabulary, token)]
+
+    def score(self, token, prefix, scores):
+        """Record the best score of `token` in this field for each matching document"""
+        if prefix:
+            start = bisect_left(self.vocabulary, token)
+            end = bisect_left(self.vocabulary, token + '\uffff')
+            candidates = self.vocabulary[start:end]
+        else:
+            candidates = [token] if token in self.postings else []
+        for candidate in candidates:
+            weight = self.weight if candidate == token else self.weight * PREFIX_WEIGHT
+            for doc_id in self.postings[candidate]:
+                if scores.get(doc_id, 0) < weight:
+                    scores[doc_id] = weight
+
+
+class SearchIndex:
+    """Tokenized, normalized inverted index over artists and musical works.
+
+    Every query token must match; the last one also matches as a prefix so
+    partially typed words find results. Documents are stored as the payloads
+    the search endpoints return, so a lookup never touches the database.
+
+    Each process holds its own index. Writes made through this process keep
+    it current; writes made through other workers are applied when this
+    process next polls catalog_versions (see catalog_sync).
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.genres = {}
+        self.artists = {}
+        self.works = {}
+        self._artist_fields = [_Field(1.0)]
+        self._work_fields = [_Field(2.0), _Field(1.0)]  # title, description
+
+    def build(self, genres, artists, works):
+        """Index the full catalog into an empty index"""
+        with self._lock:
+            for genre in genres:
+                self.add_genre(genre)
+            names = []
+            for artist in artists:
+                self.artists[artist.id] = artist.to_dict()
+                names.append((artist.id, artist.name))
+            self._artist_fields[0].build(names)
+            titles, descriptions = [], []
+            for work in works:
+                self.works[work.id] = work.to_dict()
+                titles.append((work.id, work.title))
+                descriptions.append((work.id, work.description))
+            title, description = self._work_fields
+            title.build(titles)
+            description.build(descriptions)
+
+    def add_genre(self, genre):
+        """Add or replace a genre (only stored, for work payloads)"""
+        with self._lock:
+            self.genres[genre.id] = genre.to_dict()
+
+    def add_genres(self, genres):
+        with self._lock:
+            for genre in genres:
+                self.add_genre(genre)
+
+    def remove_genre(self, genre_id):
+        with self._lock:
+            self.genres.pop(genre_id, None)
+
+    def add_artist(self, artist):
+        """Add or replace an artist"""
+        with self._lock:
+            self.remove_artist(artist.id)
+            self.artists[artist.id] = artist.to_dict()
+            self._artist_fields[0].add(artist.id, artist.name)
+
+    def add_artists(self, artists):
+        with self._lock:
+            for artist in artists:
+                self.add_artist(artist)
+
+    def remove_artist(self, artist_id):
+        with self._lock:
+            if self.artists.pop(artist_id, None) is not None:
+                for field in self._artist_fields:
+                    field.remove(artist_id)
+
+    def add_work(self, work):
+        """Add or replace a musical work"""
+        with self._lock:
+            self.remove_work(work.id)
+            self.works[work.id] = work.to_dict()
+            title, description = self._work_fields
+            title.add(work.id, work.title)
+            description.add(work.id, work.description)
+
+    def add_works(self, works):
+        with self._lock:
+            for work in works:
+                self.add_work(work)
+
+    def remove_work(self, work_id):
+        with self._lock:
+            if self.works.pop(work_id, None) is not None:
+                for field in self._work_fields:
+                    field.remove(work_id)
+
+    def _ranked_ids(self, fields, query, count):
+        """Ids of the `count` best matches for `query`, best first"""
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        scores = None
+        for position, token in enumerate(tokens):
+            token_scores = {}
+            for field in fields:
+                field.score(token, position == len(tokens) - 1, token_scores)
+            if scores is None:
+                scores = token_scores
+            else:
+                scores = {doc_id: score + token_scores[doc_id]
+                          for doc_id, score in scores.items() if doc_id in token_scores}
+            if not scores:
+                return []
+        return heapq.nsmallest(count, scores, key=lambda doc_id: (-scores[doc_id], doc_id))
+
+    def search_artists(self, query, limit=None, after=None):
+        """Return a Page of artist payloads ranked by relevance"""
+        offset, limit = offset_window(limit, after)
+        with self._lock:
+            ids = self._ranked_ids(self._artist_fields, query, offset + limit + 1)
+            rows = [self.artists[artist_id] for artist_id in ids[offset:]]
+        return offset_page(rows, offset, limit)
+
+    def search_works(self, query, limit=None, after=None):
+        """Return a Page of work payloads (with artist and genre) ranked by relevance"""
+        offset, limit = offset_window(limit, after)
+        with self._lock:
+            ids = self._ranked_ids(self._work_fields, query, offset + limit + 1)
+            rows = [self._work_payload(work_id) for work_id in ids[offset:]]
+        return offset_page(rows, offset, limit)
+
+    def _work_payload(self, work_id):
+        """Same shape as MusicalWork.to_dict(include_artist=True, include_genre=True)"""
+        data = dict(self.works[work_id])
+        artist = self.artists.get(data['artist_id'])
+        if artist:
+            data['artist'] = artist
+        genre = self.genres.get(data['genre_id'])
+        if genre:
+            data['genre'] = genre
+        return data
+
+
+# Suggestions returned per type at most, and prefix lengths whose results are memoized
+MAX_SUGGESTIONS = 20
+MEMO_PREFIX_LENGTH = 3
+
+# Only the first few words of a name start a suggestion key
+MAX_KEY_WORDS = 4
+
+
+class _PrefixList:
+    """Sorted (key, id) array searched by binary search, with per-document weights.
+
+    A document has one key per word start, so 'Computer Love' is suggested for
+    both 'comp' and 'lo'. Short prefixes match many keys, so their results are
+    memoized until a document or weight changes. Adding documents in batches
+    with `add_many` re-sorts the keys and clears the memo once per batch.
+    """
+
+    def __init__(self):
+        self.keys = []
+        self.doc_keys = {}
+        self.labels = {}
+        self.weights = {}
+        self._memo = {}
+
+    @staticmethod
+    def _keys_for(label):
+        tokens = tokenize(label)
+        return {' '.join(tokens[start:]) for start in range(min(len(tokens), MAX_KEY_WORDS))}
+
+    def build(self, docs):
+        """Load (id, label, weight) triples into an empty list"""
+        for doc_id, label, weight in docs:
+            keys = self._keys_for(label)
+            self.doc_keys[doc_id] = keys
+            self.labels[doc_id] = label
+            self.weights[doc_id] = weight
+            self.keys.extend((key, doc_id) for key in keys)
+        self.keys.sort()
+
+    def add(self, doc_id, label, weight=None):
+        """Add or relabel a document; without `weight` an existing weight is kept"""
+        self.add_many([(doc_id, label, weight)])
+
+    def add_many(self, docs):
+        """Add or relabel (id, label, weight) triples; a weight of None keeps an existing weight"""
+        docs = {doc_id: (label, weight) for doc_id, label, weight in docs}
+        stale, added = set(), []
+        for doc_id, (label, weight) in docs.items():
+            keys = self._keys_for(label)
+            previous = self.doc_keys.get(doc_id, set())
+            stale.update((key, doc_id) for key in previous - keys)
+            added.extend((key, doc_id) for key in keys - previous)
+            self.doc_keys[doc_id] = keys
+            self.labels[doc_id] = label
+            self.weights[doc_id] = self.weights.get(doc_id, 0) if weight is None else weight
+        if stale:
+            self.keys = [entry for entry in self.keys if entry not in stale]
+        if added:
+            added.sort()
+            self.keys.extend(added)
+            self.keys.sort()  # two sorted runs, which the sort merges in linear time
+        if docs:
+            self._memo.clear()
+
+    def remove(self, doc_id):
+        for key in self.doc_keys.pop(doc_id, ()):
+            position = bisect_left(self.keys, (key, doc_id))
+            if position < len(self.keys) and self.keys[position] == (key, doc_id):
+                del self.keys[position]
+        self.labels.pop(doc_id, None)
+        self.weights.pop(doc_id, None)
+        self._memo.clear()
+
+    def adjust_weight(self, doc_id, delta):
+        if doc_id in self.weights:
+            self.weights[doc_id] += delta
+            self._memo.clear()
+
+    def top(self, prefix, count):
+        """The `count` heaviest documents with a key starting with `prefix`"""
+        if len(prefix) <= MEMO_PREFIX_LENGTH:
+            if prefix not in self._memo:
+                self._memo[prefix] = self._top(prefix, MAX_SUGGESTIONS)
+            return self._memo[prefix][:count]
+        return self._top(prefix, count)
+
+    def _top(self, prefix, count):
+        start = bisect_left(self.keys, (prefix,))
+        end = bisect_left(self.keys, (prefix + '\uffff',))
+        ids = {doc_id for _, doc_id in self.keys[start:end]}
+        ranked = heapq.nsmallest(count, ids, key=lambda doc_id: (-self.weights[doc_id], doc_id))
+        return [(doc_id, self.labels[doc_id]) for doc_id in ranked]
+
+
+class SuggestionIndex:
+    """Prefix index of artist names and work titles for typeahead.
+
+    Suggestions are ranked by popularity: a work's number of approved reviews,
+    and for an artist the sum over their works. Like SearchIndex, each process
+    keeps its own copy, updated by writes made through that process and by
+    the catalog_versions poll for writes made elsewhere; a review approved in
+    another worker reaches it as a change to the work's key, which reloads
+    the work's review count and credits the difference to its artist.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._artists = _PrefixList()
+        self._works = _PrefixList()
+        self._work_artist = {}
+
+    def build(self, artists, works):
+        """Index the full catalog into an empty index"""
+        with self._lock:
+            artist_weights = {}
+            work_docs = []
+            for work in works:
+                weight = work.review_count or 0
+                self._work_artist[work.id] = work.artist_id
+                artist_weights[work.artist_id] = artist_weights.get(work.artist_id, 0) + weight
+                work_docs.append((work.id, work.title, weight))
+            self._works.build(work_docs)
+            self._artists.build(
+                (artist.id, artist.name, artist_weights.get(artist.id, 0)) for artist in artists
+            )
+
+    def add_genre(self, genre):
+        pass
+
+    def add_genres(self, genres):
+        pass
+
+    def remove_genre(self, genre_id):
+        pass
+
+    def add_artist(self, artist):
+        """Add or rename an artist"""
+        self.add_artists([artist])
+
+    def add_artists(self, artists):
+        with self._lock:
+            self._artists.add_many((artist.id, artist.name, None) for artist in artists)
+
+    def remove_artist(self, artist_id):
+        with self._lock:
+            self._artists.remove(artist_id)
+
+    def add_work(self, work):
+        """Add or update a musical work and its popularity, also credited to its artist"""
+        self.add_works([work])
+
+    def add_works(self, works):
+        with self._lock:
+            docs = []
+            for work in {work.id: work for work in works}.values():
+                weight = work.review_count or 0
+                previous_artist = self._work_artist.get(work.id)
+                if previous_artist is not None:
+                    self._artists.adjust_weight(previous_artist, -self._works.weights.get(work.id, 0))
+                self._artists.adjust_weight(work.artist_id, weight)
+                self._work_artist[work.id] = work.artist_id
+                docs.append((work.id, work.title, weight))
+            self._works.add_many(docs)
+
+    def remove_work(self, work_id):
+        with self._lock:
+            artist_id = self._work_artist.pop(work_id, None)
+            weight = self._works.weights.get(work_id, 0)
+            if artist_id is not None:
+                self._artists.adjust_weight(artist_id, -weight)
+            self._works.remove(work_id)
+
+    def suggest(self, prefix, count):
+        """Top `count` artists and works whose name has a word starting with `prefix`"""
+        prefix = ' '.join(tokenize(prefix))
+        count = min(count, MAX_SUGGESTIONS)
+        if not prefix:
+            return {'artists': [], 'musical_works': []}
+        with self._lock:
+            return {
+                'artists': [
+                    {'id': artist_id, 'name': name}
+                    for artist_id, name in self._artists.top(prefix, count)
+                ],
+                'musical_works': [
+                    {'id': work_id, 'title': title}
+                    for work_id, title in self._works.top(prefix, count)
+                ]
+            }
+
+
+_build_lock = threading.Lock()
+
+
+def init_search_index(app):
+    """Register the in-memory indexes, built by `warm_catalog_indexes` or else on first use"""
+    app.extensions['catalog_indexes'] = {}
+
+
+def _build_suggestion_index():
+    from repositories.artist_repository import ArtistRepository
+    from repositories.musical_work_repository import MusicalWorkRepository
+
+    index = SuggestionIndex()
+    index.build(ArtistRepository.iter_all(), MusicalWorkRepository.iter_all())
+    return index
+
+
+def _build_search_index():
+    from repositories.genre_repository import GenreRepository
+    from repositories.artist_repository import ArtistRepository
+    from repositories.musical_work_repository import MusicalWorkRepository
+
+    index = SearchIndex()
+    index.build(GenreRepository.iter_all(), ArtistRepository.iter_all(), MusicalWorkRepository.iter_all())
+    return index
+
+
+def _get_index(name, build):
+    indexes = current_app.extensions['catalog_indexes']
+    index = indexes.get(name)
+    if index is None:
+        with _build_lock:
+            index = indexes.get(name)
+            if index is None:
+                with unbudgeted():
+                    index = build()
+                indexes[name] = index
+    return index
+
+
+def get_search_index():
+    """Return the app's in-memory search index, or None when search uses SQL"""
+    if current_app.config.get('SEARCH_BACKEND') != 'memory':
+        return None
+    return _get_index('search', _build_search_index)
+
+
+def get_suggestion_index():
+    """Return the app's typeahead suggestion index"""
+    return _get_index('suggestions', _build_suggestion_index)
+
+
+def warm_catalog_indexes():
+    """Build the in-memory indexes before serving, so no request waits on a build.
+
+    Call from server entry points within an app context; CLI commands leave
+    them unbuilt.
+    """
+    get_suggestion_index()
+    get_search_index()
+
+
+def get_catalog_indexes():
+    """In-memory indexes built so far, which producer writes must keep current
+
+    Waits for a build in progress, so a write committed while the build was
+    reading the database is still applied afterwards.
+    """
+    with _build_lock:
+        return list(current_app.extensions['catalog_indexes'].values())
+
+
+def refresh_catalog_indexes(keys):
+    """Reload the genres, artists and works named by version keys such as 'artist:5' into the in-memory indexes
+
+    Applies writes other processes announced through catalog_versions;
+    entities no longer in the database are removed.
+    """
+    from repositories.genre_repository import GenreRepository
+    from repositories.artist_repository import ArtistRepository
+    from repositories.musical_work_repository import MusicalWorkRepository
+
+    ids = {'genre': set(), 'artist': set(), 'work': set()}
+    for key in keys:
+        kind, _, entity_id = key.partition(':')
+        if kind in ids and entity_id.isdigit():
+            ids[kind].add(int(entity_id))
+    indexes = get_catalog_indexes()
+    if not indexes or not any(ids.values()):
+        return
+    # Everything is read before an index is touched, so no index lock is held during a query
+    loaded = [
+        (kind, {entity.id: entity for entity in repository.find_by_ids(sorted(ids[kind]))})
+        for kind, repository in (
+            ('genre', GenreRepository), ('artist', ArtistRepository), ('work', MusicalWorkRepository)
+        )
+    ]
+    for kind, entities in loaded:
+        for index in indexes:
+            getattr(index, f'add_{kind}s')([entities[entity_id] for entity_id in sorted(entities)])
+            for entity_id in sorted(ids[kind] - entities.keys()):
+                getattr(index, f'remove_{kind}')(entity_id)
+
+
+def reindex_work(musical_work_id):
+    """Refresh a work in the in-memory indexes after its rating aggregates changed"""
+    reindex_works([musical_work_id])
+
+
+def reindex_works(musical_work_ids):
+    """Refresh several works in the in-memory indexes with one query"""
+    from repositories.musical_work_repository import MusicalWorkRepository
+
+    indexes = get_catalog_indexes()
+    if not indexes or not musical_work_ids:
+        return
+    works = MusicalWorkRepository.find_by_ids(list(musical_work_ids))
+    for index in indexes:
+        index.add_works(works)
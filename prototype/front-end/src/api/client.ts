@@ -4,6 +4,8 @@ const apiBase = import.meta.env.VITE_API_BASE_URL || 'http://localhost:5000'
 
 export const api = axios.create({
   baseURL: apiBase,
+  // Sends the API's last-write cookie, which keeps reads after a write on the primary database
+  withCredentials: true,
   headers: { 'Content-Type': 'application/json' }
 })
 
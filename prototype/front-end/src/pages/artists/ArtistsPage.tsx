@@ -1,6 +1,6 @@
 import { useEffect, useState } from 'react'
 import { api } from '@/api/client'
-import type { Artist } from '@/types'
+import type { Artist, Paginated } from '@/types'
 
 export function ArtistsPage() {
   const [items, setItems] = useState<Artist[]>([])
@@ -10,7 +10,7 @@ export function ArtistsPage() {
   const [error, setError] = useState<string | null>(null)
 
   async function load() {
-    try { const { data } = await api.get('/artists'); setItems(data); setError(null) } catch (e: any) { setError(e.message) }
+    try { const { data } = await api.get<Paginated<Artist>>('/artists'); setItems(data.items); setError(null) } catch (e: any) { setError(e.message) }
   }
 
   useEffect(() => { load() }, [])
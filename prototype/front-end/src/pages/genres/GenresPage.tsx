@@ -1,6 +1,6 @@
 import { useEffect, useState } from 'react'
 import { api } from '@/api/client'
-import type { Genre } from '@/types'
+import type { Genre, Paginated } from '@/types'
 
 export function GenresPage() {
   const [items, setItems] = useState<Genre[]>([])
@@ -9,7 +9,7 @@ export function GenresPage() {
   const [error, setError] = useState<string | null>(null)
 
   async function load() {
-    try { const { data } = await api.get('/genres'); setItems(data); setError(null) } catch (e: any) { setError(e.message) }
+    try { const { data } = await api.get<Paginated<Genre>>('/genres'); setItems(data.items); setError(null) } catch (e: any) { setError(e.message) }
   }
 
   useEffect(() => { load() }, [])
@@ -9,7 +9,7 @@ export function PendingReviewsPage() {
   const [success, setSuccess] = useState<string | null>(null)
 
   async function load() {
-    try { const { data } = await api.get('/reviews/pending'); setItems(data); setError(null) } catch (e: any) { setError(e.message) }
+    try { const { data } = await api.post('/reviews/pending/claim'); setItems(data.items); setError(null) } catch (e: any) { setError(e.message) }
   }
 
   useEffect(() => { load() }, [])
@@ -21,7 +21,7 @@ export function SearchPage() {
       if (!q) { setRes(null); return }
       setLoading(true)
       try {
-        const { data } = await api.get('/search', { params: { q, type: 'all' }, signal: controller.signal as any })
+        const { data } = await api.get('/search/suggest', { params: { q }, signal: controller.signal as any })
         setRes(data)
         setError(null)
       } catch (e: any) { setError(e.message) }
@@ -1,6 +1,6 @@
 import { useEffect, useState } from 'react'
 import { api } from '@/api/client'
-import type { Artist, Genre, MusicalWork } from '@/types'
+import type { Artist, Genre, MusicalWork, Paginated } from '@/types'
 
 export function WorksCrudPage() {
   const [items, setItems] = useState<MusicalWork[]>([])
@@ -15,11 +15,11 @@ export function WorksCrudPage() {
   async function load() {
     try {
       const [w, a, g] = await Promise.all([
-        api.get('/musical-works'),
-        api.get('/artists'),
-        api.get('/genres')
+        api.get<Paginated<MusicalWork>>('/musical-works'),
+        api.get<Paginated<Artist>>('/artists', { params: { limit: 500, sort: 'name' } }),
+        api.get<Paginated<Genre>>('/genres', { params: { limit: 500, sort: 'name' } })
       ])
-      setItems(w.data); setArtists(a.data); setGenres(g.data); setError(null)
+      setItems(w.data.items); setArtists(a.data.items); setGenres(g.data.items); setError(null)
     } catch (e: any) { setError(e.message) }
   }
 
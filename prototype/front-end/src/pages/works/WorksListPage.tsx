@@ -1,6 +1,6 @@
 import { useEffect, useState } from 'react'
 import { api } from '@/api/client'
-import type { MusicalWork } from '@/types'
+import type { MusicalWork, Paginated } from '@/types'
 import { Link } from 'react-router-dom'
 
 export function WorksListPage() {
@@ -11,8 +11,8 @@ export function WorksListPage() {
   useEffect(() => {
     (async () => {
       try {
-        const { data } = await api.get('/musical-works')
-        setItems(data)
+        const { data } = await api.get<Paginated<MusicalWork>>('/musical-works')
+        setItems(data.items)
         setError(null)
       } catch (e: any) { setError(e.message) }
       finally { setLoading(false) }